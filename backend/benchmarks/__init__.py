@@ -0,0 +1 @@
+"""Бенчмарки парсера и API без живого аккаунта Telegram (запуск из папки backend: python -m benchmarks.ingest)"""
@@ -0,0 +1,179 @@
+"""
+Генератор синтетической ленты: Source, Post и SelectedPost с реалистичными распределениями
+(несколько крупных каналов и длинный хвост мелких, альбомы, смесь медиа, отобранные посты).
+
+Запуск из папки backend (пишет в DATABASE_URL или в --database-url):
+    python -m benchmarks.dataset --posts 100000 --channels 200 --database-url sqlite:///feed_100k.db
+"""
+import random
+import argparse
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, func, insert, select, update
+
+# Вес типа медиа у одиночного поста (None - только текст)
+MEDIA_MIX = (
+    (None, 0.30), ("photo", 0.42), ("video", 0.15), ("document", 0.05),
+    ("animation", 0.04), ("audio", 0.02), ("voice", 0.01), ("sticker", 0.01),
+)
+SELECTED_STATUSES = (("draft", 0.5), ("ready", 0.2), ("published", 0.25), ("failed", 0.05))
+EXTENSIONS = {"photo": "jpg", "video": "mp4", "document": "pdf", "animation": "gif",
+              "audio": "mp3", "voice": "ogg", "sticker": "webp"}
+WORDS = ("новости", "канал", "обзор", "сегодня", "важно", "рынок", "проект", "запуск", "итоги",
+         "анонс", "подробнее", "ссылка", "мнение", "данные", "рост", "команда", "релиз", "вопрос")
+BATCH_SIZE = 5000
+
+def _choice(rng: random.Random, weighted):
+    values, weights = zip(*weighted)
+    return rng.choices(values, weights)[0]
+
+def _text(rng: random.Random) -> str:
+    # Длина постов - логнормальная: много коротких, немного лонгридов
+    words = max(1, min(600, int(rng.lognormvariate(3.3, 0.9))))
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+class FeedDatasetGenerator:
+    """Дописывает посты в базу до нужного объема - так один файл БД проходит 10k -> 100k -> 1M"""
+
+    def __init__(self, engine, channels: int = 100, album_ratio: float = 0.15, selected_ratio: float = 0.005,
+                 inactive_ratio: float = 0.1, days: int = 365, seed: int = 42):
+        self.engine = engine
+        self.channels = channels
+        self.album_ratio = album_ratio
+        self.selected_ratio = selected_ratio
+        self.inactive_ratio = inactive_ratio
+        self.days = days
+        self.rng = random.Random(seed)
+        self.now = datetime(2025, 1, 1)
+
+    def ensure_sources(self) -> dict:
+        """{channel_id: channel_name} источников; создает их при первом запуске"""
+        from models import Source
+
+        with self.engine.begin() as conn:
+            existing = dict(conn.execute(select(Source.channel_id, Source.channel_name).order_by(Source.id)).all())
+            if not existing:
+                rows = [{
+                    "channel_id": f"-100{1000000000 + index}",
+                    "channel_name": f"Канал {index}",
+                    "channel_username": f"feed_channel_{index}",
+                    "is_active": self.rng.random() >= self.inactive_ratio,
+                    "added_at": self.now - timedelta(days=self.days),
+                } for index in range(self.channels)]
+                conn.execute(insert(Source.__table__), rows)
+                existing = {row["channel_id"]: row["channel_name"] for row in rows}
+        return existing
+
+    def grow_to(self, total_posts: int) -> int:
+        """Добавляет посты, пока их не станет total_posts; возвращает число добавленных"""
+        from models import Post, SelectedPost
+
+        self.channel_names = self.ensure_sources()
+        channel_ids = list(self.channel_names)
+        # Размеры каналов по закону Ципфа: первые каналы публикуют на порядок больше хвоста
+        weights = [1 / (index + 1) ** 1.1 for index in range(len(channel_ids))]
+
+        with self.engine.begin() as conn:
+            current = conn.execute(select(func.count(Post.id))).scalar()
+            start_id = conn.execute(select(func.coalesce(func.max(Post.id), 0))).scalar()
+            # Продолжаем нумерацию сообщений каналов с прошлого прогона
+            message_ids = dict(conn.execute(
+                select(Post.channel_id, func.max(Post.message_id)).group_by(Post.channel_id)
+            ).all())
+        to_add = max(0, total_posts - current)
+        if not to_add:
+            return 0
+
+        batch = []
+        added = 0
+        with self.engine.begin() as conn:
+            while added < to_add:
+                channel_id = self.rng.choices(channel_ids, weights)[0]
+                post_date = self.now - timedelta(seconds=self.rng.randint(0, self.days * 86400))
+                if self.rng.random() < self.album_ratio:
+                    size = min(self.rng.randint(2, 10), to_add - added)
+                    album_id = f"{channel_id}_{self.rng.getrandbits(40)}"
+                    text = _text(self.rng)
+                    for position in range(size):
+                        batch.append(self._post(channel_id, message_ids, post_date, text, "photo",
+                                                album_id=album_id, album_position=position + 1, album_total=size))
+                    added += size
+                else:
+                    batch.append(self._post(channel_id, message_ids, post_date, _text(self.rng), _choice(self.rng, MEDIA_MIX)))
+                    added += 1
+                if len(batch) >= BATCH_SIZE:
+                    conn.execute(insert(Post.__table__), batch)
+                    batch = []
+            if batch:
+                conn.execute(insert(Post.__table__), batch)
+
+            # Отбираем часть новых постов, как это делает редактор в интерфейсе
+            new_posts = conn.execute(select(Post.id, Post.text).where(Post.id > start_id)).all()
+            selected = self.rng.sample(new_posts, int(len(new_posts) * self.selected_ratio))
+            if selected:
+                conn.execute(insert(SelectedPost.__table__), [{
+                    "post_id": post_id,
+                    "original_text": text,
+                    "edited_text": text[:200] if self.rng.random() < 0.5 else None,
+                    "status": _choice(self.rng, SELECTED_STATUSES),
+                    "selected_at": self.now - timedelta(seconds=self.rng.randint(0, self.days * 86400)),
+                } for post_id, text in selected])
+                selected_ids = [post_id for post_id, _ in selected]
+                for start in range(0, len(selected_ids), 500):
+                    conn.execute(update(Post.__table__).where(Post.id.in_(selected_ids[start:start + 500])).values(is_selected=True))
+        return added
+
+    def _post(self, channel_id: str, message_ids: dict, post_date: datetime, text: str, media_type,
+              album_id=None, album_position=None, album_total=None) -> dict:
+        message_id = message_ids.get(channel_id, 0) + 1
+        message_ids[channel_id] = message_id
+        row = {
+            "message_id": message_id,
+            "channel_id": channel_id,
+            "channel_name": self.channel_names[channel_id],
+            "text": text,
+            "media_type": None, "media_url": None, "media_size": None, "media_filename": None,
+            "media_duration": None, "media_width": None, "media_height": None,
+            "album_id": album_id, "album_position": album_position, "album_total": album_total,
+            "post_date": post_date,
+            "parsed_at": post_date + timedelta(seconds=self.rng.randint(5, 600)),
+            "is_selected": False,
+        }
+        if media_type:
+            filename = f"{media_type}_{message_id}.{EXTENSIONS[media_type]}"
+            row.update({
+                "media_type": media_type,
+                "media_url": f"/media/{channel_id.replace('-', '')}/{filename}",
+                "media_filename": filename,
+                "media_size": int(self.rng.lognormvariate(12, 1.2)),
+                "media_width": 1280 if media_type in ("photo", "video", "animation") else None,
+                "media_height": 720 if media_type in ("photo", "video", "animation") else None,
+                "media_duration": self.rng.randint(3, 600) if media_type in ("video", "audio", "voice") else None,
+            })
+        return row
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Генератор синтетической ленты постов")
+    parser.add_argument("--posts", type=int, default=10000)
+    parser.add_argument("--channels", type=int, default=100)
+    parser.add_argument("--album-ratio", type=float, default=0.15)
+    parser.add_argument("--selected-ratio", type=float, default=0.005)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--database-url", help="по умолчанию DATABASE_URL из окружения")
+    args = parser.parse_args(argv)
+
+    if args.database_url:
+        engine = create_engine(args.database_url)
+    else:
+        from db import engine
+    from db import Base
+    import models  # noqa: F401 - регистрирует таблицы в Base.metadata
+
+    Base.metadata.create_all(bind=engine)
+    generator = FeedDatasetGenerator(engine, channels=args.channels, album_ratio=args.album_ratio,
+                                     selected_ratio=args.selected_ratio, seed=args.seed)
+    added = generator.grow_to(args.posts)
+    print(f"✅ Добавлено {added} постов, всего в базе не меньше {args.posts}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+import os
+import random
+import asyncio
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+
+from pyrogram.enums import ChatType
+from pyrogram.errors import FloodWait, PeerIdInvalid
+
+# Детерминированная замена pyrogram.Client для бенчмарков: каналы и сообщения
+# генерируются из seed, каждый "запрос к API" считается и может получить задержку или FloodWait.
+
+HISTORY_PAGE_SIZE = 100  # messages.getHistory отдает не больше 100 сообщений за запрос
+DIALOGS_PAGE_SIZE = 100
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024  # pyrogram качает файлы частями по 1 МБ
+SLEEP_THRESHOLD = 10  # как у pyrogram: FloodWait до 10 секунд клиент пересиживает сам
+
+MEDIA_KINDS = ("photo", "video", "document")
+
+class FakeMessage:
+    __slots__ = (
+        "id", "date", "text", "caption", "media_group_id", "chat",
+        "photo", "video", "animation", "voice", "audio", "document", "sticker",
+    )
+
+    def __init__(self, message_id: int, date: datetime, chat, text: Optional[str] = None,
+                 caption: Optional[str] = None, media_group_id: Optional[str] = None):
+        self.id = message_id
+        self.date = date
+        self.chat = chat
+        self.text = text
+        self.caption = caption
+        self.media_group_id = media_group_id
+        self.photo = self.video = self.animation = self.voice = None
+        self.audio = self.document = self.sticker = None
+
+class FakeChannel:
+    def __init__(self, chat_id: int, title: str, username: str):
+        self.chat = SimpleNamespace(
+            id=chat_id, title=title, username=username, type=ChatType.CHANNEL,
+            members_count=1000, description=None,
+        )
+        self.messages: List[FakeMessage] = []  # от новых к старым, как отдает Telegram
+        self.next_id = 1
+
+class FakeTelegramClient:
+    """
+    Реализует ровно то, чем пользуется TelegramParser: connect/get_me/invoke,
+    get_chat, get_chat_history, get_dialogs и download_media.
+    """
+
+    def __init__(self, channels: int = 10, messages_per_channel: int = 200, album_ratio: float = 0.2,
+                 media_ratio: float = 0.5, media_size_kb: int = 64, latency_ms: float = 0.0,
+                 flood_wait_rate: float = 0.0, flood_wait_seconds: int = 1, seed: int = 42):
+        self.rng = random.Random(seed)
+        self.album_ratio = album_ratio
+        self.media_ratio = media_ratio
+        self.media_size = media_size_kb * 1024
+        self.latency = latency_ms / 1000
+        self.flood_wait_rate = flood_wait_rate
+        self.flood_wait_seconds = flood_wait_seconds
+        self.is_connected = False
+        self.clock = datetime(2024, 1, 1)
+
+        self.requests: Dict[str, int] = {}
+        self.flood_waits = 0
+        self.messages_served = 0
+        self.bytes_downloaded = 0
+
+        self.channels: Dict[str, FakeChannel] = {}
+        for index in range(channels):
+            channel = FakeChannel(-1001000000000 - index, f"Бенчмарк канал {index}", f"bench_channel_{index}")
+            self.channels[str(channel.chat.id)] = channel
+            self.channels[channel.chat.username] = channel
+            self.publish(channel, messages_per_channel)
+
+    @property
+    def channel_list(self) -> List[FakeChannel]:
+        return list({id(channel): channel for channel in self.channels.values()}.values())
+
+    def publish(self, channel: FakeChannel, count: int):
+        """Добавляет в канал count новых сообщений (часть - альбомами, часть - с медиа)"""
+        new_messages = []
+        while len(new_messages) < count:
+            if self.rng.random() < self.album_ratio:
+                size = min(self.rng.randint(2, 10), count - len(new_messages))
+                group_id = f"{channel.chat.id}_{channel.next_id}"
+                for position in range(size):
+                    message = self._message(channel, media_group_id=group_id, caption="Альбом" if position == 0 else None)
+                    message.photo = self._media("photo")
+                    new_messages.append(message)
+            else:
+                message = self._message(channel, text=f"Пост {channel.next_id} " + "текст " * self.rng.randint(5, 60))
+                if self.rng.random() < self.media_ratio:
+                    kind = self.rng.choice(MEDIA_KINDS)
+                    setattr(message, kind, self._media(kind))
+                    message.caption, message.text = message.text, None
+                new_messages.append(message)
+        # Новые сообщения оказываются в начале истории
+        channel.messages[:0] = reversed(new_messages)
+
+    def publish_all(self, count: int):
+        for channel in self.channel_list:
+            self.publish(channel, count)
+
+    def _message(self, channel: FakeChannel, **kwargs) -> FakeMessage:
+        self.clock += timedelta(seconds=30)
+        message = FakeMessage(channel.next_id, self.clock, channel.chat, **kwargs)
+        channel.next_id += 1
+        return message
+
+    def _media(self, kind: str):
+        size = max(1, int(self.media_size * self.rng.uniform(0.5, 1.5)))
+        media = SimpleNamespace(file_size=size, width=1280, height=720, duration=None, mime_type=None, file_name=None)
+        if kind == "video":
+            media.duration, media.mime_type = 15, "video/mp4"
+        elif kind == "document":
+            media.mime_type, media.file_name = "application/pdf", f"doc_{self.rng.randint(1, 10 ** 9)}.pdf"
+        return media
+
+    async def _rpc(self, method: str):
+        """Один запрос к API: счетчик, задержка сети и, возможно, FloodWait"""
+        while True:
+            self.requests[method] = self.requests.get(method, 0) + 1
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            if self.flood_wait_rate and self.rng.random() < self.flood_wait_rate:
+                self.flood_waits += 1
+                if self.flood_wait_seconds <= SLEEP_THRESHOLD:
+                    await asyncio.sleep(self.flood_wait_seconds)
+                    continue
+                raise FloodWait(value=self.flood_wait_seconds)
+            return
+
+    def _channel(self, chat_id) -> FakeChannel:
+        channel = self.channels.get(str(chat_id).lstrip("@"))
+        if channel is None:
+            raise PeerIdInvalid()
+        return channel
+
+    # === API, используемое парсером ===
+
+    async def connect(self):
+        self.is_connected = True
+
+    async def disconnect(self):
+        self.is_connected = False
+
+    async def stop(self):
+        self.is_connected = False
+
+    async def get_me(self):
+        await self._rpc("users.GetFullUser")
+        return SimpleNamespace(id=1, first_name="Bench")
+
+    async def invoke(self, query, *args, **kwargs):
+        await self._rpc(type(query).__name__)
+
+    async def get_chat(self, chat_id):
+        channel = self._channel(chat_id)
+        await self._rpc("channels.GetFullChannel")
+        return channel.chat
+
+    async def get_chat_history(self, chat_id, limit: int = 0, offset: int = 0, offset_id: int = 0, **kwargs):
+        channel = self._channel(chat_id)
+        messages = channel.messages[offset:offset + limit] if limit else channel.messages[offset:]
+        for start in range(0, len(messages), HISTORY_PAGE_SIZE):
+            await self._rpc("messages.GetHistory")
+            for message in messages[start:start + HISTORY_PAGE_SIZE]:
+                self.messages_served += 1
+                yield message
+
+    async def get_dialogs(self, limit: int = 0):
+        channels = sorted(self.channel_list, key=lambda channel: channel.messages[0].date if channel.messages else self.clock, reverse=True)
+        if limit:
+            channels = channels[:limit]
+        for start in range(0, len(channels), DIALOGS_PAGE_SIZE):
+            await self._rpc("messages.GetDialogs")
+            for channel in channels[start:start + DIALOGS_PAGE_SIZE]:
+                yield SimpleNamespace(
+                    chat=channel.chat,
+                    top_message=channel.messages[0] if channel.messages else None,
+                    is_creator=False,
+                    is_admin=False,
+                )
+
+    async def download_media(self, media, file_name: str = None, **kwargs):
+        size = getattr(media, "file_size", 0) or 0
+        for _ in range(max(1, -(-size // DOWNLOAD_CHUNK_SIZE))):
+            await self._rpc("upload.GetFile")
+        os.makedirs(os.path.dirname(file_name) or ".", exist_ok=True)
+        with open(file_name, "wb") as f:
+            f.write(b"\0" * size)
+        self.bytes_downloaded += size
+        return file_name
+
+    def stats(self) -> dict:
+        return {
+            "requests": sum(self.requests.values()),
+            "requests_by_method": dict(self.requests),
+            "flood_waits": self.flood_waits,
+            "messages_served": self.messages_served,
+            "bytes_downloaded": self.bytes_downloaded,
+        }
+
+    def reset_stats(self):
+        self.requests = {}
+        self.flood_waits = 0
+        self.messages_served = 0
+        self.bytes_downloaded = 0
@@ -0,0 +1,175 @@
+"""
+Нагрузочный тест API ленты на синтетических данных разного объема.
+
+Запуск из папки backend:
+    python -m benchmarks.feed_load --scales 10000,100000
+    python -m benchmarks.feed_load --scales 1000000 --requests 100 --concurrency 20 --output feed.json
+    python -m benchmarks.feed_load --scales 100000 --cache both
+
+База растет от меньшего объема к большему (10k -> 100k -> 1M в одном файле), на каждом шаге
+эндпоинты гоняются через ASGI-приложение без сети. Время в БД и число запросов берутся
+из заголовка Server-Timing. По умолчанию кэш страниц ленты выключен: иначе почти все запросы
+после прогрева отдаются из памяти и замер показывает кэш, а не запросы к БД. С --cache on
+замеряется работа с кэшем, с --cache both каждый сценарий гоняется в обоих режимах.
+"""
+import os
+import re
+import sys
+import json
+import time
+import random
+import shutil
+import asyncio
+import argparse
+import contextlib
+
+from benchmarks.ingest import prepare_workspace
+
+SERVER_TIMING = re.compile(r'db;dur=([\d.]+);desc="(\d+) queries"')
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Нагрузочный тест API ленты")
+    parser.add_argument("--scales", default="10000,100000", help="объемы постов через запятую")
+    parser.add_argument("--channels", type=int, default=100)
+    parser.add_argument("--requests", type=int, default=200, help="запросов на эндпоинт")
+    parser.add_argument("--heavy-requests", type=int, default=5, help="запросов к /api/media-status")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--limit", type=int, default=50, help="размер страницы ленты")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--cache", choices=("off", "on", "both"), default="off",
+                        help="кэш страниц ленты: выключен, включен или оба прогона подряд")
+    parser.add_argument("--verbose", action="store_true", help="не глушить вывод эндпоинтов")
+    parser.add_argument("--output", help="сохранить результаты в JSON")
+    parser.add_argument("--keep-workspace", action="store_true")
+    return parser.parse_args(argv)
+
+def _percentile(sorted_values, fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))]
+
+async def load(client, name: str, make_url, requests: int, concurrency: int) -> dict:
+    latencies, db_ms, db_queries = [], [], []
+    errors = 0
+    counter = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for index in counter:
+            started = time.perf_counter()
+            response = await client.get(make_url(index))
+            latencies.append((time.perf_counter() - started) * 1000)
+            if response.status_code >= 400:
+                errors += 1
+            timing = SERVER_TIMING.search(response.headers.get("server-timing", ""))
+            if timing:
+                db_ms.append(float(timing.group(1)))
+                db_queries.append(int(timing.group(2)))
+
+    # Прогрев: первый запрос платит за импорт, план запроса и холодный кэш SQLite
+    await client.get(make_url(0))
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(min(concurrency, requests))))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "endpoint": name,
+        "requests": requests,
+        "errors": errors,
+        "rps": round(requests / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(_percentile(latencies, 0.5), 2),
+        "p95_ms": round(_percentile(latencies, 0.95), 2),
+        "p99_ms": round(_percentile(latencies, 0.99), 2),
+        "max_ms": round(latencies[-1], 2) if latencies else 0.0,
+        "avg_db_ms": round(sum(db_ms) / len(db_ms), 2) if db_ms else None,
+        "avg_db_queries": round(sum(db_queries) / len(db_queries), 1) if db_queries else None,
+    }
+
+async def run(args) -> list:
+    import httpx
+    from sqlalchemy import func, select
+    from db import engine, async_engine, Base, SessionLocal
+    from models import Post, Source
+    from benchmarks.dataset import FeedDatasetGenerator
+    from feed_cache import feed_cache
+    import main
+
+    Base.metadata.create_all(bind=engine)
+    generator = FeedDatasetGenerator(engine, channels=args.channels, seed=args.seed)
+    rng = random.Random(args.seed)
+    limit = args.limit
+    cache_modes = ("off", "on") if args.cache == "both" else (args.cache,)
+    results = []
+
+    transport = httpx.ASGITransport(app=main.app)
+    print_header()
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            for scale in sorted(int(value) for value in args.scales.split(",")):
+                started = time.perf_counter()
+                generator.grow_to(scale)
+                print(f"📦 {scale} постов готово за {time.perf_counter() - started:.1f}с")
+
+                db = SessionLocal()
+                active = select(Source.channel_id).where(Source.is_active == True)
+                visible = db.execute(select(func.count(Post.id)).where(Post.channel_id.in_(active))).scalar()
+                db.close()
+                pages = max(1, visible // limit)
+
+                scenarios = [
+                    ("posts_page1", lambda i: f"/api/posts/paginated?offset=0&limit={limit}", args.requests),
+                    # Бесконечная прокрутка: большинство запросов - первые страницы
+                    ("posts_scroll", lambda i: f"/api/posts/paginated?offset={min(pages - 1, int(rng.expovariate(1 / 5))) * limit}&limit={limit}", args.requests),
+                    ("posts_deep", lambda i: f"/api/posts/paginated?offset={rng.randrange(pages) * limit}&limit={limit}", args.requests),
+                    ("selected_posts", lambda i: "/api/selected-posts", args.requests),
+                    ("media_status", lambda i: "/api/media-status", args.heavy_requests),
+                ]
+                for name, make_url, requests in scenarios:
+                    for cache_mode in cache_modes:
+                        feed_cache.enabled = cache_mode == "on"
+                        with contextlib.ExitStack() as stack:
+                            if not args.verbose:
+                                stack.enter_context(contextlib.redirect_stdout(stack.enter_context(open(os.devnull, "w"))))
+                            result = await load(client, name, make_url, requests, args.concurrency)
+                        result["scale"] = scale
+                        result["cache"] = cache_mode
+                        results.append(result)
+                        print_row(result)
+    finally:
+        await async_engine.dispose()
+    return results
+
+def print_header():
+    print(f"{'объем':>9} {'эндпоинт':<16}{'кэш':>5}{'rps':>8}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}{'БД мс':>8}{'SQL':>6}{'ошибки':>8}")
+
+def print_row(result: dict):
+    db_ms = result["avg_db_ms"] if result["avg_db_ms"] is not None else "-"
+    queries = result["avg_db_queries"] if result["avg_db_queries"] is not None else "-"
+    print(
+        f"{result['scale']:>9} {result['endpoint']:<16}{result['cache']:>5}{result['rps']:>8}{result['p50_ms']:>9}{result['p95_ms']:>9}"
+        f"{result['p99_ms']:>9}{result['max_ms']:>9}{db_ms:>8}{queries:>6}{result['errors']:>8}"
+    )
+
+def main(argv=None):
+    args = parse_args(argv)
+    repo_backend = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    sys.path.insert(0, repo_backend)
+    if not args.verbose:
+        os.environ.setdefault("LOG_LEVEL", "WARNING")
+    workspace = prepare_workspace()
+    try:
+        results = asyncio.run(run(args))
+    finally:
+        os.chdir(repo_backend)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "results": results}, f, ensure_ascii=False, indent=2)
+    if args.keep_workspace:
+        print(f"📁 Рабочая папка бенчмарка: {workspace}")
+    else:
+        shutil.rmtree(workspace, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,249 @@
+"""
+Бенчмарк загрузки постов: TelegramParser с поддельным клиентом, реальные БД и эндпоинты.
+
+Запуск из папки backend:
+    python -m benchmarks.ingest --channels 20 --messages 300 --latency-ms 20
+    python -m benchmarks.ingest --output bench.json
+    python -m benchmarks.ingest --baseline bench.json --max-regression 0.2   # код выхода 1 при регрессии
+    python -m benchmarks.ingest --replay fixtures/channels.zip --speed 0.1  # записанные каналы, см. telegram_replay
+
+Сценарии: parse_channel (parse_channel_posts по всем каналам), parse_all (parse_all_sources),
+check_new (несколько раундов POST /api/posts/check-new с новыми сообщениями между раундами).
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import shutil
+import tempfile
+import tracemalloc
+import contextlib
+
+from benchmarks.fake_telegram import FakeTelegramClient
+from benchmarks.telegram_replay import ReplayClient
+
+SCENARIOS = ("parse_channel", "parse_all", "check_new")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Бенчмарк загрузки постов без Telegram")
+    parser.add_argument("--channels", type=int, default=10)
+    parser.add_argument("--messages", type=int, default=200, help="сообщений в канале на старте")
+    parser.add_argument("--album-ratio", type=float, default=0.2, help="доля альбомов среди публикаций")
+    parser.add_argument("--media-ratio", type=float, default=0.5, help="доля одиночных постов с медиа")
+    parser.add_argument("--media-kb", type=int, default=64, help="средний размер медиафайла")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="задержка каждого запроса к API")
+    parser.add_argument("--flood-wait-rate", type=float, default=0.0, help="вероятность FloodWait на запрос")
+    parser.add_argument("--flood-wait-seconds", type=int, default=1)
+    parser.add_argument("--limit", type=int, default=50, help="limit для parse_channel_posts")
+    parser.add_argument("--rounds", type=int, default=3, help="раундов check_new")
+    parser.add_argument("--new-per-round", type=int, default=5, help="новых сообщений в канале перед раундом")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--replay", help="фикстура benchmarks.telegram_replay вместо синтетических каналов")
+    parser.add_argument("--speed", type=float, default=1.0, help="множитель записанных задержек для --replay (0 - без задержек)")
+    parser.add_argument("--no-memory", action="store_true", help="не включать tracemalloc (точнее скорость)")
+    parser.add_argument("--verbose", action="store_true", help="не глушить вывод парсера")
+    parser.add_argument("--keep-workspace", action="store_true", help="не удалять папку с БД и медиа после прогона")
+    parser.add_argument("--output", help="сохранить результаты в JSON")
+    parser.add_argument("--baseline", help="JSON прошлого прогона для сравнения")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="допустимое падение msgs/sec")
+    return parser.parse_args(argv)
+
+def prepare_workspace() -> str:
+    """
+    Отдельная папка с той же структурой, что и репозиторий: парсер пишет медиа в ../frontend/public/media,
+    а файлы сессий ищет в sessions/. База - свежий SQLite-файл. Вызывать до импорта db/main.
+    """
+    workspace = tempfile.mkdtemp(prefix="smm_bench_")
+    backend_dir = os.path.join(workspace, "backend")
+    os.makedirs(os.path.join(backend_dir, "sessions"))
+    os.makedirs(os.path.join(workspace, "frontend", "public", "media"))
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workspace, 'bench.db')}"
+    os.chdir(backend_dir)
+    return workspace
+
+class DBQueryCounter:
+    def __init__(self, *engines):
+        from sqlalchemy import event
+
+        self.count = 0
+        for engine in engines:
+            event.listen(engine, "after_cursor_execute", self._on_execute)
+
+    def _on_execute(self, *args):
+        self.count += 1
+
+async def run_scenario(name: str, fake, queries: DBQueryCounter, measure_memory: bool, verbose: bool, body) -> dict:
+    fake.reset_stats()
+    queries.count = 0
+    if measure_memory:
+        tracemalloc.start()
+    with contextlib.ExitStack() as stack:
+        if not verbose:
+            stack.enter_context(contextlib.redirect_stdout(stack.enter_context(open(os.devnull, "w"))))
+        started = time.perf_counter()
+        details = await body()
+        elapsed = time.perf_counter() - started
+    peak = 0
+    if measure_memory:
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    stats = fake.stats()
+    return {
+        "scenario": name,
+        "seconds": round(elapsed, 3),
+        "messages": stats["messages_served"],
+        "msgs_per_sec": round(stats["messages_served"] / elapsed, 1) if elapsed else 0.0,
+        "requests": stats["requests"],
+        "requests_by_method": stats["requests_by_method"],
+        "flood_waits": stats["flood_waits"],
+        "bytes_downloaded": stats["bytes_downloaded"],
+        "db_queries": queries.count,
+        "peak_memory_mb": round(peak / 1024 / 1024, 2) if measure_memory else None,
+        **details,
+    }
+
+async def run(args) -> list:
+    # Импорты после prepare_workspace: модули читают DATABASE_URL и пути при импорте
+    import httpx
+    from sqlalchemy import func, select
+    from db import engine, async_engine, AsyncSessionLocal, Base, SessionLocal
+    from models import Source, Post
+    from telegram_parser import TelegramParser, quick_check_cache
+    from multi_user_telegram import multi_user_manager
+    import main
+
+    Base.metadata.create_all(bind=engine)
+
+    if args.replay:
+        # Новейшие сообщения придерживаются, чтобы раундам check_new было что "публиковать"
+        fake = ReplayClient(args.replay, speed=args.speed, hold_back=args.rounds * args.new_per_round)
+    else:
+        fake = FakeTelegramClient(
+            channels=args.channels,
+            messages_per_channel=args.messages,
+            album_ratio=args.album_ratio,
+            media_ratio=args.media_ratio,
+            media_size_kb=args.media_kb,
+            latency_ms=args.latency_ms,
+            flood_wait_rate=args.flood_wait_rate,
+            flood_wait_seconds=args.flood_wait_seconds,
+            seed=args.seed,
+        )
+    parser = TelegramParser()
+    parser.session_name = "bench_session"
+    parser.client = fake
+    parser._initialized = True
+    open(f"sessions/{parser.session_name}.session", "w").close()
+    # Без пользователей в БД менеджер отдает первый зарегистрированный парсер
+    multi_user_manager.user_parsers["bench"] = parser
+
+    db = SessionLocal()
+    for channel in fake.channel_list:
+        db.add(Source(channel_id=str(channel.chat.id), channel_name=channel.chat.title, channel_username=channel.chat.username))
+    db.commit()
+    db.close()
+
+    async def count_posts() -> int:
+        async with AsyncSessionLocal() as session:
+            return (await session.execute(select(func.count(Post.id)))).scalar()
+
+    queries = DBQueryCounter(engine, async_engine.sync_engine)
+    scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    results = []
+
+    async def parse_channel():
+        posts = 0
+        for channel in fake.channel_list:
+            result = await parser.parse_channel_posts(str(channel.chat.id), limit=args.limit)
+            posts += len(result.get("posts", []))
+        return {"posts_parsed": posts}
+
+    async def parse_all():
+        before = await count_posts()
+        async with AsyncSessionLocal() as session:
+            result = await parser.parse_all_sources(session)
+        return {"status": result.get("status"), "posts_saved": await count_posts() - before}
+
+    async def check_new():
+        before = await count_posts()
+        statuses = []
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            for _ in range(args.rounds):
+                fake.publish_all(args.new_per_round)
+                # Раунды считаются разнесенными дольше TTL быстрой проверки
+                quick_check_cache.clear()
+                response = await client.post("/api/posts/check-new")
+                statuses.append(response.status_code)
+        return {"http_statuses": statuses, "posts_saved": await count_posts() - before}
+
+    bodies = {"parse_channel": parse_channel, "parse_all": parse_all, "check_new": check_new}
+    try:
+        for name in scenarios:
+            if name not in bodies:
+                raise SystemExit(f"Неизвестный сценарий {name}, доступны: {', '.join(SCENARIOS)}")
+            results.append(await run_scenario(name, fake, queries, not args.no_memory, args.verbose, bodies[name]))
+    finally:
+        await parser.supervisor.stop()
+        await async_engine.dispose()
+    return results
+
+def print_report(results: list):
+    print(f"{'сценарий':<15}{'сек':>9}{'сообщ.':>9}{'msgs/s':>10}{'запросы':>9}{'FloodWait':>11}{'SQL':>8}{'пик МБ':>9}")
+    for result in results:
+        peak = result["peak_memory_mb"]
+        print(
+            f"{result['scenario']:<15}{result['seconds']:>9.3f}{result['messages']:>9}{result['msgs_per_sec']:>10.1f}"
+            f"{result['requests']:>9}{result['flood_waits']:>11}{result['db_queries']:>8}{(peak if peak is not None else '-'):>9}"
+        )
+
+def compare_with_baseline(results: list, baseline_path: str, max_regression: float) -> bool:
+    """True, если ни один сценарий не стал медленнее baseline больше чем на max_regression"""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {item["scenario"]: item for item in json.load(f)["results"]}
+    ok = True
+    for result in results:
+        previous = baseline.get(result["scenario"])
+        if not previous or not previous["msgs_per_sec"]:
+            continue
+        change = result["msgs_per_sec"] / previous["msgs_per_sec"] - 1
+        marker = "✅"
+        if change < -max_regression:
+            marker, ok = "❌", False
+        print(f"{marker} {result['scenario']}: {previous['msgs_per_sec']} -> {result['msgs_per_sec']} msgs/s ({change:+.0%}), "
+              f"SQL {previous['db_queries']} -> {result['db_queries']}, запросы {previous['requests']} -> {result['requests']}")
+    return ok
+
+def main(argv=None):
+    args = parse_args(argv)
+    repo_backend = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    # После смены рабочей папки модули backend должны импортироваться по абсолютному пути
+    sys.path.insert(0, repo_backend)
+    if args.replay:
+        args.replay = os.path.abspath(args.replay)
+    if not args.verbose:
+        # Логгер пишет в stdout из своего потока, redirect_stdout его не глушит
+        os.environ.setdefault("LOG_LEVEL", "WARNING")
+    workspace = prepare_workspace()
+    try:
+        results = asyncio.run(run(args))
+    finally:
+        os.chdir(repo_backend)
+
+    print_report(results)
+    if args.keep_workspace:
+        print(f"📁 Рабочая папка бенчмарка: {workspace}")
+    else:
+        shutil.rmtree(workspace, ignore_errors=True)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "results": results}, f, ensure_ascii=False, indent=2)
+    if args.baseline and not compare_with_baseline(results, args.baseline, args.max_regression):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,282 @@
+"""
+Запись и воспроизведение трафика Telegram для офлайн-бенчмарков на реальных каналах.
+
+Запись (нужна авторизованная сессия в sessions/ и TELEGRAM_API_ID/HASH в .env), из папки backend:
+    python -m benchmarks.telegram_replay record --session smm_bot_session --channels @channel1,-1001234567890 \\
+        --limit 200 --output fixtures/channels.zip [--media full]
+
+Воспроизведение - через бенчмарк загрузки (speed 1 - исходные задержки, 0.1 - в 10 раз быстрее, 0 - без задержек):
+    python -m benchmarks.ingest --replay fixtures/channels.zip --speed 0.1
+
+Фикстура - zip: fixture.json (чаты, сообщения, задержки запросов) и media/<file_unique_id> с содержимым
+файлов (в режиме --media full; в режиме sizes хранится только размер, при воспроизведении пишутся нули).
+Сообщения хранятся как история канала, а не как ответы на конкретные вызовы, поэтому фикстуру можно
+гонять и на версиях парсера, которые запрашивают историю иначе.
+"""
+import os
+import json
+import time
+import asyncio
+import zipfile
+import argparse
+from datetime import datetime
+from types import SimpleNamespace
+from typing import Dict, List
+
+from pyrogram.enums import ChatType
+
+from benchmarks.fake_telegram import FakeTelegramClient, FakeChannel, FakeMessage, HISTORY_PAGE_SIZE
+
+FIXTURE_VERSION = 1
+MEDIA_KINDS = ("photo", "video", "animation", "voice", "audio", "document", "sticker")
+MEDIA_ATTRS = ("file_size", "width", "height", "duration", "mime_type", "file_name",
+               "title", "performer", "is_animated", "is_video", "emoji")
+
+# === Запись ===
+
+def _chat_to_dict(chat) -> dict:
+    return {
+        "id": chat.id,
+        "title": getattr(chat, "title", None),
+        "username": getattr(chat, "username", None),
+        "type": chat.type.name if getattr(chat, "type", None) else "CHANNEL",
+        "members_count": getattr(chat, "members_count", None),
+        "description": getattr(chat, "description", None),
+    }
+
+def _message_to_dict(message) -> dict:
+    data = {
+        "id": message.id,
+        "date": message.date.isoformat() if message.date else None,
+        "text": str(message.text) if message.text else None,
+        "caption": str(message.caption) if message.caption else None,
+        "media_group_id": message.media_group_id,
+    }
+    for kind in MEDIA_KINDS:
+        media = getattr(message, kind, None)
+        if media:
+            attrs = {attr: getattr(media, attr) for attr in MEDIA_ATTRS if getattr(media, attr, None) is not None}
+            data["media"] = {"kind": kind, "key": getattr(media, "file_unique_id", None) or f"{message.id}_{kind}", **attrs}
+            break
+    return data
+
+class RecordingClient:
+    """Обертка над настоящим pyrogram.Client: пропускает вызовы насквозь и запоминает ответы и задержки"""
+
+    def __init__(self, client, media_mode: str = "sizes"):
+        self._client = client
+        self._media_mode = media_mode
+        self.chats: Dict[str, dict] = {}
+        self.messages: Dict[str, Dict[int, dict]] = {}
+        self.latencies: Dict[str, List[float]] = {}
+        self.media: Dict[str, dict] = {}  # key -> {"size", "seconds", "path"}
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+    def _latency(self, method: str, seconds: float):
+        self.latencies.setdefault(method, []).append(round(seconds, 4))
+
+    def _remember(self, message):
+        chat = message.chat
+        chat_key = str(chat.id)
+        self.chats.setdefault(chat_key, _chat_to_dict(chat))
+        self.messages.setdefault(chat_key, {})[message.id] = _message_to_dict(message)
+
+    async def get_chat(self, chat_id):
+        started = time.perf_counter()
+        chat = await self._client.get_chat(chat_id)
+        self._latency("channels.GetFullChannel", time.perf_counter() - started)
+        self.chats[str(chat.id)] = _chat_to_dict(chat)
+        return chat
+
+    async def get_chat_history(self, chat_id, *args, **kwargs):
+        # Засекаем только ожидание следующего сообщения от клиента - без обработки и скачивания
+        # медиа у вызывающего; ожидания копятся постранично, неполная страница пишется в finally
+        history = self._client.get_chat_history(chat_id, *args, **kwargs).__aiter__()
+        waited = 0.0
+        in_page = 0
+        try:
+            while True:
+                started = time.perf_counter()
+                try:
+                    message = await history.__anext__()
+                except StopAsyncIteration:
+                    break
+                finally:
+                    waited += time.perf_counter() - started
+                self._remember(message)
+                in_page += 1
+                if in_page == HISTORY_PAGE_SIZE:
+                    self._latency("messages.GetHistory", waited)
+                    waited, in_page = 0.0, 0
+                yield message
+        finally:
+            if in_page:
+                self._latency("messages.GetHistory", waited)
+            if hasattr(history, "aclose"):
+                await history.aclose()
+
+    async def get_dialogs(self, *args, **kwargs):
+        async for dialog in self._client.get_dialogs(*args, **kwargs):
+            if dialog.chat.type.name in ("CHANNEL", "SUPERGROUP"):
+                self.chats.setdefault(str(dialog.chat.id), _chat_to_dict(dialog.chat))
+                if dialog.top_message:
+                    self._remember(dialog.top_message)
+            yield dialog
+
+    async def download_media(self, media, *args, **kwargs):
+        started = time.perf_counter()
+        file_path = await self._client.download_media(media, *args, **kwargs)
+        key = getattr(media, "file_unique_id", None)
+        if key and file_path and os.path.exists(file_path):
+            self.media[key] = {
+                "size": os.path.getsize(file_path),
+                "seconds": round(time.perf_counter() - started, 4),
+                "path": file_path if self._media_mode == "full" else None,
+            }
+        return file_path
+
+    def save(self, path: str):
+        fixture = {
+            "version": FIXTURE_VERSION,
+            "recorded_at": datetime.now().isoformat(),
+            "chats": self.chats,
+            "messages": {chat_id: sorted(messages.values(), key=lambda item: -item["id"])
+                         for chat_id, messages in self.messages.items()},
+            "latencies": self.latencies,
+            "media": {key: {"size": info["size"], "seconds": info["seconds"], "stored": bool(info["path"])}
+                      for key, info in self.media.items()},
+        }
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr("fixture.json", json.dumps(fixture, ensure_ascii=False, separators=(",", ":")))
+            for key, info in self.media.items():
+                if info["path"]:
+                    archive.write(info["path"], f"media/{key}")
+
+async def record(args):
+    from telegram_parser import TelegramParser
+
+    parser = TelegramParser()
+    parser.session_name = args.session
+    await parser.initialize_client()
+    if not await parser.is_authorized():
+        raise SystemExit(f"❌ Сессия {args.session} не авторизована")
+
+    recorder = RecordingClient(parser.client, media_mode=args.media)
+    parser.client = recorder
+    try:
+        for channel_id in [value.strip() for value in args.channels.split(",") if value.strip()]:
+            result = await parser.parse_channel_posts(channel_id, limit=args.limit)
+            print(f"📼 {channel_id}: {result.get('status')}, постов {len(result.get('posts', []))}")
+        # Диалоги нужны для пакетной проверки новых постов
+        async for _ in recorder.get_dialogs():
+            pass
+        recorder.save(args.output)
+    finally:
+        parser.client = recorder._client
+        await parser.stop()
+
+    total = sum(len(messages) for messages in recorder.messages.values())
+    print(f"✅ Записано {len(recorder.chats)} чатов, {total} сообщений, {len(recorder.media)} медиа -> {args.output}")
+
+# === Воспроизведение ===
+
+class ReplayClient(FakeTelegramClient):
+    """
+    Отдает записанные каналы через интерфейс поддельного клиента бенчмарков.
+    Задержки берутся из записи и умножаются на speed; hold_back новейших сообщений каждого канала
+    скрыты до publish_all - так сценарий проверки новых постов видит "новые" сообщения.
+    """
+
+    def __init__(self, path: str, speed: float = 1.0, hold_back: int = 0):
+        self.speed = speed
+        self.latency = 0.0
+        self.flood_wait_rate = 0.0
+        self.flood_wait_seconds = 0
+        self.is_connected = False
+        self.channels: Dict[str, FakeChannel] = {}
+        self._archive = zipfile.ZipFile(path)
+        fixture = json.loads(self._archive.read("fixture.json"))
+        if fixture.get("version") != FIXTURE_VERSION:
+            raise ValueError(f"Неподдерживаемая версия фикстуры: {fixture.get('version')}")
+        self._latencies = fixture["latencies"]
+        self._latency_index: Dict[str, int] = {}
+        self._media = fixture["media"]
+        self._pending: Dict[int, List[FakeMessage]] = {}
+
+        for chat_id, chat in fixture["chats"].items():
+            if chat["type"] not in ("CHANNEL", "SUPERGROUP"):
+                continue
+            channel = FakeChannel(chat["id"], chat["title"], chat["username"])
+            channel.chat.type = ChatType[chat["type"]]
+            channel.chat.members_count = chat.get("members_count")
+            channel.chat.description = chat.get("description")
+            messages = [self._message(channel, data) for data in fixture["messages"].get(chat_id, [])]
+            channel.messages = messages[hold_back:]
+            self._pending[id(channel)] = messages[:hold_back]
+            self.channels[str(channel.chat.id)] = channel
+            if channel.chat.username:
+                self.channels[channel.chat.username] = channel
+        self.reset_stats()
+
+    @staticmethod
+    def _message(channel: FakeChannel, data: dict) -> FakeMessage:
+        message = FakeMessage(
+            data["id"], datetime.fromisoformat(data["date"]) if data["date"] else None, channel.chat,
+            text=data["text"], caption=data["caption"], media_group_id=data["media_group_id"],
+        )
+        media = data.get("media")
+        if media:
+            attrs = {attr: media.get(attr) for attr in MEDIA_ATTRS}
+            setattr(message, media["kind"], SimpleNamespace(file_unique_id=media["key"], **attrs))
+        return message
+
+    def publish(self, channel: FakeChannel, count: int):
+        """Открывает следующие count скрытых сообщений канала (от старых к новым)"""
+        pending = self._pending.get(id(channel), [])
+        revealed = pending[-count:] if count else []
+        del pending[len(pending) - len(revealed):]
+        channel.messages[:0] = revealed
+
+    async def _rpc(self, method: str):
+        self.requests[method] = self.requests.get(method, 0) + 1
+        samples = self._latencies.get(method)
+        if self.speed and samples:
+            index = self._latency_index.get(method, 0)
+            self._latency_index[method] = index + 1
+            await asyncio.sleep(samples[index % len(samples)] * self.speed)
+
+    async def download_media(self, media, file_name: str = None, **kwargs):
+        key = getattr(media, "file_unique_id", None)
+        info = self._media.get(key, {})
+        self.requests["upload.GetFile"] = self.requests.get("upload.GetFile", 0) + 1
+        if self.speed and info.get("seconds"):
+            await asyncio.sleep(info["seconds"] * self.speed)
+        os.makedirs(os.path.dirname(file_name) or ".", exist_ok=True)
+        with open(file_name, "wb") as f:
+            if info.get("stored"):
+                f.write(self._archive.read(f"media/{key}"))
+            else:
+                f.write(b"\0" * (info.get("size") or getattr(media, "file_size", None) or 1))
+        self.bytes_downloaded += os.path.getsize(file_name)
+        return file_name
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Запись трафика Telegram в фикстуру для бенчмарков")
+    commands = parser.add_subparsers(dest="command", required=True)
+    record_parser = commands.add_parser("record")
+    record_parser.add_argument("--session", default="smm_bot_session", help="имя файла сессии в sessions/")
+    record_parser.add_argument("--channels", required=True, help="каналы через запятую (id или @username)")
+    record_parser.add_argument("--limit", type=int, default=100)
+    record_parser.add_argument("--media", choices=("sizes", "full"), default="sizes",
+                               help="full - сохранить содержимое медиа, sizes - только размеры")
+    record_parser.add_argument("--output", required=True)
+    args = parser.parse_args(argv)
+
+    if args.command == "record":
+        asyncio.run(record(args))
+
+if __name__ == "__main__":
+    main()
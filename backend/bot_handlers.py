@@ -1,9 +1,8 @@
-import asyncio, logging, os
-from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton, Bot, WebAppInfo
+import asyncio, fcntl, logging, os, secrets
+from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton, Bot, WebAppInfo, InputMediaPhoto, InputMediaVideo
 from telegram.constants import ParseMode
 from telegram.ext import ContextTypes, Application, CommandHandler, MessageHandler, filters
-from models import Channel, Post
-from db import get_session
+from channel_post_writer import channel_post_writer
 from sqlalchemy.orm import Session
 from dotenv import load_dotenv
 
@@ -12,6 +11,13 @@ load_dotenv()
 BOT_TOKEN = os.getenv('BOT_TOKEN')
 WEBAPP_HOST = os.getenv('WEBAPP_HOST')
 WEBAPP_URL = os.getenv("WEBAPP_URL")
+# Webhook mode: updates arrive at the FastAPI app instead of long polling
+BOT_WEBHOOK_URL = os.getenv("BOT_WEBHOOK_URL")  # e.g. https://example.com/api/telegram/webhook
+# Must be the same in every worker, otherwise only the worker that registered the webhook accepts updates
+BOT_WEBHOOK_SECRET = os.getenv("BOT_WEBHOOK_SECRET")
+# Lock file that lets only one of several uvicorn workers call set_webhook
+BOT_WEBHOOK_LOCK = os.getenv("BOT_WEBHOOK_LOCK", "bot_webhook.lock")
+_webhook_lock = None
 
 app = (
     Application.builder()
@@ -39,48 +45,97 @@ async def save_channel_post(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     if not msg:
         return
     
-    # Use synchronous database session
-    db = next(get_session())
-    try:
-        # ensure channel exists
-        ch = db.query(Channel).filter(Channel.id == str(msg.chat.id)).first()
-        if not ch:
-            ch = Channel(id=str(msg.chat.id), title=msg.chat.title, username=msg.chat.username)
-            db.add(ch)
-            db.commit()
-        
-        html_content = msg.html_text or (msg.caption_html if msg.caption else '')
-        media_type, file_id = None, None
-        if msg.photo:
-            media_type, file_id = 'photo', msg.photo[-1].file_id
-        elif msg.video:
-            media_type, file_id = 'video', msg.video.file_id
-        elif msg.animation:
-            media_type, file_id = 'animation', msg.animation.file_id
-        elif msg.document:
-            media_type, file_id = 'document', msg.document.file_id
-        
-        post = Post(
-            channel_id=ch.id, 
-            html=html_content, 
-            media_type=media_type, 
-            file_id=file_id
-        )
-        db.add(post)
-        db.commit()
-    finally:
-        db.close()
+    html_content = msg.text_html or (msg.caption_html if msg.caption else '')
+    media_type = None
+    if msg.photo:
+        media_type = 'photo'
+    elif msg.video:
+        media_type = 'video'
+    elif msg.animation:
+        media_type = 'animation'
+    elif msg.document:
+        media_type = 'document'
+    
+    # Запись в БД делает единственный писатель пачками - здесь только очередь
+    await channel_post_writer.put({
+        "message_id": msg.message_id,
+        "channel_id": str(msg.chat.id),
+        "channel_name": msg.chat.title,
+        "channel_username": msg.chat.username,
+        "text": html_content,
+        "media_type": media_type,
+        "album_id": msg.media_group_id,
+        "post_date": msg.date.replace(tzinfo=None),
+    })
 
 app.add_handler(MessageHandler(filters.UpdateType.CHANNEL_POST, save_channel_post))
 
-async def handle_post_publish(channel_id: str, text: str, media_type: str = None, file_id: str = None, db: Session = None):
-    """Publish post to channel."""
+async def handle_post_publish(channel_id: str, text: str, media_type: str = None, file_id=None, db: Session = None):
+    """Publish post to channel. file_id may be a Telegram file_id or a local file path."""
     if media_type and file_id:
         if media_type == "photo":
-            await bot.send_photo(channel_id, file_id, caption=text, parse_mode="HTML")
+            return await bot.send_photo(channel_id, file_id, caption=text, parse_mode="HTML")
         elif media_type == "video":
-            await bot.send_video(channel_id, file_id, caption=text, parse_mode="HTML")
+            return await bot.send_video(channel_id, file_id, caption=text, parse_mode="HTML")
         elif media_type == "animation":
-            await bot.send_animation(channel_id, file_id, caption=text, parse_mode="HTML")
-    else:
-        await bot.send_message(channel_id, text, parse_mode="HTML")
\ No newline at end of file
+            return await bot.send_animation(channel_id, file_id, caption=text, parse_mode="HTML")
+    return await bot.send_message(channel_id, text, parse_mode="HTML")
+
+async def handle_album_publish(channel_id: str, text: str, media: list):
+    """Publish album (list of (media_type, file) pairs) as one media group. Caption goes on the first item."""
+    input_media = []
+    for i, (media_type, file) in enumerate(media):
+        media_class = InputMediaVideo if media_type == "video" else InputMediaPhoto
+        if i == 0 and text:
+            input_media.append(media_class(file, caption=text, parse_mode="HTML"))
+        else:
+            input_media.append(media_class(file))
+    return await bot.send_media_group(channel_id, input_media)
+
+def require_webhook_secret():
+    """Fail startup in webhook mode without a shared BOT_WEBHOOK_SECRET."""
+    if not BOT_WEBHOOK_SECRET:
+        raise RuntimeError("BOT_WEBHOOK_SECRET не задан: в режиме вебхука он обязателен и должен быть общим для всех воркеров")
+
+def _claim_webhook_registration() -> bool:
+    """True in the one process that holds the lock file; it stays locked until the process exits."""
+    global _webhook_lock
+    if _webhook_lock is not None:
+        return True
+    lock = open(BOT_WEBHOOK_LOCK, "w")
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock.close()
+        return False
+    _webhook_lock = lock
+    return True
+
+async def start_webhook():
+    """Start update processing inside the FastAPI process; one worker registers the webhook."""
+    require_webhook_secret()
+    await app.initialize()
+    await app.start()
+    if not _claim_webhook_registration():
+        print("🤖 Вебхук регистрирует другой воркер, этот только принимает обновления")
+        return
+    await app.bot.set_webhook(
+        BOT_WEBHOOK_URL,
+        secret_token=BOT_WEBHOOK_SECRET,
+        allowed_updates=["message", "channel_post"],
+    )
+    print(f"🤖 Бот работает через вебхук: {BOT_WEBHOOK_URL}")
+
+async def stop_webhook():
+    """Stop update processing (the webhook stays registered for the next start)."""
+    if app.running:
+        await app.stop()
+    await app.shutdown()
+
+def verify_webhook_secret(secret_token: str | None) -> bool:
+    """Check X-Telegram-Bot-Api-Secret-Token sent by Telegram."""
+    return bool(secret_token and BOT_WEBHOOK_SECRET) and secrets.compare_digest(secret_token, BOT_WEBHOOK_SECRET)
+
+async def enqueue_update(data: dict):
+    """Queue an incoming update; the Application processes it in the background."""
+    await app.update_queue.put(Update.de_json(data, app.bot))
\ No newline at end of file
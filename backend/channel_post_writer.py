@@ -0,0 +1,137 @@
+import os
+import asyncio
+import logging
+from typing import List, Optional
+
+from db import SessionLocal
+from models import Source, Post
+from tracing import background_task
+from metrics import add_ingested_post
+
+logger = logging.getLogger(__name__)
+
+class ChannelPostWriter:
+    """
+    Единственный писатель для channel_post от бота: обработчики только кладут посты в очередь,
+    а писатель сохраняет накопившееся одной транзакцией.
+    """
+
+    def __init__(self, batch_size: Optional[int] = None, max_queue: int = 10000):
+        self.batch_size = batch_size or int(os.getenv('BOT_INGEST_BATCH_SIZE', '200'))
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self.max_retries = int(os.getenv('BOT_INGEST_RETRIES', '3'))
+        self.known_channels: Optional[set] = None  # channel_id уже существующих Source
+        self._task: Optional[asyncio.Task] = None
+        self._in_flight: Optional[asyncio.Task] = None  # Текущая запись пачки
+
+    def start(self):
+        if self._task is None or self._task.done():
+            # Первый put обычно приходит из вебхука - не наследуем контекст его запроса
+            self._task = background_task(self._run())
+
+    async def put(self, post_data: dict):
+        """Ставит пост в очередь на запись (запускает писателя при первом вызове)"""
+        self.start()
+        await self.queue.put(post_data)
+
+    async def stop(self):
+        """Дожидается текущей записи, дописывает остаток очереди и останавливает писателя"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        # Поток с записью отменой не остановить - ждем его, иначе остаток запишется параллельно
+        if self._in_flight:
+            await self._in_flight
+            self._in_flight = None
+        batch = []
+        while not self.queue.empty():
+            batch.append(self.queue.get_nowait())
+        if batch:
+            await self._flush(batch)
+
+    async def _run(self):
+        while True:
+            batch = [await self.queue.get()]
+            # Забираем все, что накопилось, пока писали предыдущую пачку
+            while len(batch) < self.batch_size and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            # Отмена писателя (stop) не должна обрывать запись на середине
+            self._in_flight = asyncio.create_task(self._flush(batch))
+            await asyncio.shield(self._in_flight)
+            self._in_flight = None
+
+    async def _flush(self, batch: List[dict]):
+        """
+        Пишет пачку в отдельном потоке (не блокируя event loop). Временные ошибки (блокировка БД,
+        обрыв соединения) повторяются с паузой; если пачка так и не записалась, посты пишутся
+        по одному - теряются только те, которые не удается сохранить сами по себе.
+        """
+        for attempt in range(self.max_retries + 1):
+            try:
+                await asyncio.to_thread(self._write_batch, batch)
+                return
+            except Exception as e:
+                if attempt >= self.max_retries:
+                    logger.error("❌ Ошибка пакетной записи постов бота: %s, пишем %s постов по одному", e, len(batch))
+                    break
+                delay = 0.5 * 2 ** attempt
+                logger.warning("⚠️ Ошибка пакетной записи постов бота: %s, повтор через %s сек", e, delay)
+                await asyncio.sleep(delay)
+
+        for post_data in batch:
+            try:
+                await asyncio.to_thread(self._write_batch, [post_data])
+            except Exception as e:
+                logger.error("❌ Пост %s канала %s не сохранен: %s", post_data.get("message_id"), post_data.get("channel_id"), e)
+
+    def _write_batch(self, batch: List[dict]):
+        """Сохраняет пачку постов и недостающие каналы одним коммитом"""
+        db = SessionLocal()
+        try:
+            if self.known_channels is None:
+                self.known_channels = {row[0] for row in db.query(Source.channel_id).all()}
+
+            for post_data in batch:
+                channel_id = post_data["channel_id"]
+                if channel_id not in self.known_channels:
+                    # Бот пишет и в собственные целевые каналы: новый канал попадает в ленту
+                    # и в парсинг только после того, как его включит администратор
+                    db.add(Source(
+                        channel_id=channel_id,
+                        channel_name=post_data["channel_name"],
+                        channel_username=post_data.get("channel_username"),
+                        is_active=False,
+                    ))
+                    self.known_channels.add(channel_id)
+
+            # Отбрасываем повторные доставки одного и того же сообщения
+            existing = set(db.query(Post.channel_id, Post.message_id).filter(
+                Post.channel_id.in_({post_data["channel_id"] for post_data in batch}),
+                Post.message_id.in_({post_data["message_id"] for post_data in batch})
+            ).all())
+            new_posts = []
+            for post_data in batch:
+                key = (post_data["channel_id"], post_data["message_id"])
+                if key not in existing:
+                    existing.add(key)
+                    # channel_username - поле Source; словарь не меняем, он нужен для повтора
+                    new_posts.append(Post(**{key: value for key, value in post_data.items() if key != "channel_username"}))
+
+            for post in new_posts:
+                add_ingested_post(db, post)
+            db.commit()
+            logger.info("💾 Бот: сохранено %s постов из %s обновлений", len(new_posts), len(batch))
+        except Exception:
+            db.rollback()
+            # Кэш каналов мог разойтись с БД после отката
+            self.known_channels = None
+            raise
+        finally:
+            db.close()
+
+# Глобальный экземпляр писателя
+channel_post_writer = ChannelPostWriter()
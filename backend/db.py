@@ -1,21 +1,99 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import os
 from dotenv import load_dotenv
 
+from metrics import instrument_engine
+from query_profiler import query_profiler
+from tracing import trace_engine
+from feed_cache import feed_cache
+
 load_dotenv()
 
 # Используем in-memory SQLite для решения проблем с правами
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///:memory:")
 
-engine = create_engine(DATABASE_URL)
+# Синхронный и асинхронный движки должны видеть одну и ту же in-memory базу,
+# поэтому :memory: заменяем на именованную базу с общим кэшем
+if DATABASE_URL in ("sqlite://", "sqlite:///:memory:"):
+    DATABASE_URL = "sqlite:///file:smm_memdb?mode=memory&cache=shared&uri=true"
+
+def _async_database_url(url: str) -> str:
+    """URL для асинхронного драйвера: aiosqlite для SQLite, asyncpg для Postgres"""
+    for prefix in ("postgresql+psycopg2://", "postgresql://", "postgres://"):
+        if url.startswith(prefix):
+            return "postgresql+asyncpg://" + url[len(prefix):]
+    if url.startswith("sqlite:///"):
+        return "sqlite+aiosqlite:///" + url[len("sqlite:///"):]
+    return url
+
+def _engine_options(url: str) -> dict:
+    """Настройки пула соединений для Postgres (у SQLite свой пул по умолчанию)"""
+    if not url.startswith(("postgresql", "postgres")):
+        return {}
+    return {
+        "pool_size": int(os.getenv("DB_POOL_SIZE", "10")),
+        "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "20")),
+        "pool_timeout": float(os.getenv("DB_POOL_TIMEOUT", "30")),
+        "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", "1800")),
+        "pool_pre_ping": True,
+    }
+
+ASYNC_DATABASE_URL = _async_database_url(DATABASE_URL)
+
+engine = create_engine(DATABASE_URL, **_engine_options(DATABASE_URL))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+# Асинхронный стек для async-эндпоинтов и парсера: запросы не блокируют event loop
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **_engine_options(ASYNC_DATABASE_URL))
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+# Длительность запросов обоих движков в /metrics
+instrument_engine(engine)
+instrument_engine(async_engine.sync_engine)
+# Счетчик запросов на HTTP-запрос и журнал медленных запросов
+query_profiler.instrument(engine)
+query_profiler.instrument(async_engine.sync_engine)
+# Спаны SQL-запросов внутри трассируемых запросов (при TRACING_EXPORTER)
+trace_engine(engine)
+trace_engine(async_engine.sync_engine)
+# Сброс кэша страниц ленты после коммитов в posts/sources/selected_posts
+feed_cache.instrument(engine)
+feed_cache.instrument(async_engine.sync_engine)
+feed_cache.bind(async_engine)
+
+def upgrade_schema(bind=engine):
+    """
+    create_all не трогает существующие таблицы: столбцы, добавленные в модели позже
+    (например, поля публикации в selected_posts), добавляются через ALTER TABLE вместе с индексами.
+    Такие столбцы nullable, поэтому старые строки остаются корректными. Вызывать после create_all.
+    """
+    inspector = inspect(bind)
+    with bind.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                column_type = column.type.compile(dialect=bind.dialect)
+                conn.exec_driver_sql(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}")
+                print(f"🛠️ Добавлен столбец {table.name}.{column.name}")
+                for index in table.indexes:
+                    if column.name in index.columns:
+                        index.create(conn, checkfirst=True)
+
 def get_session():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+async def get_async_session():
+    async with AsyncSessionLocal() as db:
+        yield db
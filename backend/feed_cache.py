@@ -0,0 +1,82 @@
+import os
+import asyncio
+from typing import Callable, Hashable, Tuple
+
+from sqlalchemy import DDL, event, text
+
+from ttl_cache import AsyncTTLCache
+
+# Кэш готовых JSON-страниц ленты. Лента меняется только когда кто-то коммитит изменения
+# в posts/sources/selected_posts, поэтому ключ страницы включает номер версии ленты.
+# Версия хранится в базе (таблица feed_version) и растет в той же транзакции, что и изменение,
+# поэтому ее видят все процессы: демон Telegram, воркеры uvicorn, скрипты. Каждый запрос
+# читает версию одним SELECT по первичному ключу; старые версии вытесняются по LRU/TTL.
+
+FEED_CACHE_TTL = float(os.getenv("FEED_CACHE_TTL", "30"))  # 0 - кэш выключен
+FEED_CACHE_SIZE = int(os.getenv("FEED_CACHE_SIZE", "512"))  # 0 - тоже выключен
+FEED_TABLES = {"posts", "sources", "selected_posts"}
+
+class FeedCache:
+    def __init__(self, maxsize: int = FEED_CACHE_SIZE, ttl: float = FEED_CACHE_TTL):
+        self.enabled = ttl > 0 and maxsize > 0
+        self.pages = AsyncTTLCache("feed_pages", maxsize=maxsize, ttl=ttl)
+        self._async_engine = None
+        self._select_version = self._bump_version = None
+
+    def track_version(self, table):
+        """Таблица-счетчик версии ленты: одна строка id=1, создается вместе с таблицей"""
+        self._select_version = text(f"SELECT version FROM {table.name} WHERE id = 1")
+        self._bump_version = f"UPDATE {table.name} SET version = version + 1 WHERE id = 1"
+        event.listen(table, "after_create", DDL(f"INSERT INTO {table.name} (id, version) VALUES (1, 0)"))
+
+    def bind(self, async_engine):
+        """Движок, через который запросы читают текущую версию, не блокируя event loop"""
+        self._async_engine = async_engine
+
+    async def version(self) -> int:
+        async with self._async_engine.connect() as conn:
+            return await conn.scalar(self._select_version) or 0
+
+    async def get_or_render(self, key: Tuple[Hashable, ...], render: Callable[[], bytes]) -> bytes:
+        """
+        Тело страницы из кэша или render() в пуле потоков. Одновременные запросы одной
+        страницы ждут один render. Версия читается до render, поэтому страница под ключом
+        версии может быть только новее ее, но не старее.
+        """
+        if not self.enabled:
+            return await asyncio.to_thread(render)
+        version = await self.version()
+        return await self.pages.get_or_load((version,) + key, lambda: asyncio.to_thread(render))
+
+    def instrument(self, engine):
+        """Отслеживает INSERT/UPDATE/DELETE по таблицам ленты и поднимает версию при коммите"""
+
+        @event.listens_for(engine, "after_cursor_execute")
+        def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            if context is None or not (context.isinsert or context.isupdate or context.isdelete):
+                return
+            table = getattr(getattr(context.compiled, "statement", None), "table", None)
+            # Текстовый SQL без таблицы считаем изменением ленты
+            if table is None or getattr(table, "name", None) in FEED_TABLES:
+                conn.info["feed_changed"] = True
+
+        @event.listens_for(engine, "commit")
+        def commit(conn):
+            # Событие приходит до COMMIT в базе: UPDATE счетчика попадает в ту же транзакцию,
+            # и блокировка строки держится только на время самого коммита
+            if conn.info.pop("feed_changed", False) and self._bump_version:
+                cursor = conn.connection.cursor()
+                try:
+                    cursor.execute(self._bump_version)
+                finally:
+                    cursor.close()
+
+        @event.listens_for(engine, "rollback")
+        def rollback(conn):
+            conn.info.pop("feed_changed", None)
+
+    async def stats(self) -> dict:
+        version = await self.version() if self._async_engine is not None else None
+        return {"enabled": self.enabled, "version": version, **self.pages.stats()}
+
+feed_cache = FeedCache()
@@ -0,0 +1,70 @@
+from typing import List
+
+import orjson
+from fastapi.responses import Response
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from models import Post, SelectedPost, Source
+
+# Быстрый путь для ленты: select по колонкам вместо ORM-объектов (без identity map и
+# отслеживания изменений), строки сразу в dict по полям схемы ответа и orjson вместо
+# from_orm + повторной валидации и jsonable_encoder в FastAPI. Формат JSON тот же:
+# datetime в ISO 8601, поля и их порядок - как в PostResponse/SelectedPostResponse.
+
+class RowSerializer:
+    """Колонки модели по полям pydantic-схемы ответа; собирается один раз при импорте"""
+
+    def __init__(self, model, schema):
+        self.fields = tuple(schema.__fields__)
+        self.columns = tuple(getattr(model, name) for name in self.fields)
+
+    def select(self):
+        return select(*self.columns)
+
+    def rows(self, result) -> List[dict]:
+        fields = self.fields
+        return [dict(zip(fields, row)) for row in result]
+
+def dumps(content) -> bytes:
+    return orjson.dumps(content)
+
+def json_response(content, status_code: int = 200) -> Response:
+    """JSON-ответ из объекта или уже сериализованного тела (bytes из кэша ленты)"""
+    body = content if isinstance(content, bytes) else dumps(content)
+    return Response(content=body, status_code=status_code, media_type="application/json")
+
+def active_channel_ids(db: Session) -> List[str]:
+    return db.execute(select(Source.channel_id).where(Source.is_active == True)).scalars().all()
+
+def list_posts(db: Session, serializer: RowSerializer) -> List[dict]:
+    """Все посты активных источников, новые сверху"""
+    channel_ids = active_channel_ids(db)
+    if not channel_ids:
+        return []
+    query = serializer.select().where(Post.channel_id.in_(channel_ids)).order_by(Post.post_date.desc())
+    return serializer.rows(db.execute(query))
+
+def posts_page(db: Session, serializer: RowSerializer, offset: int, limit: int) -> dict:
+    """Страница ленты в формате /api/posts/paginated"""
+    channel_ids = active_channel_ids(db)
+    if not channel_ids:
+        return {"posts": [], "has_more": False, "total": 0}
+
+    visible = Post.channel_id.in_(channel_ids)
+    total_posts = db.execute(select(func.count()).select_from(Post).where(visible)).scalar()
+    posts = serializer.rows(db.execute(
+        serializer.select().where(visible).order_by(Post.post_date.desc()).offset(offset).limit(limit)
+    ))
+    return {
+        "posts": posts,
+        "has_more": offset + len(posts) < total_posts,
+        "total": total_posts,
+        "offset": offset,
+        "limit": limit,
+        "loaded_count": len(posts),
+    }
+
+def list_selected_posts(db: Session, serializer: RowSerializer) -> List[dict]:
+    """Отобранные посты, последние отобранные сверху"""
+    return serializer.rows(db.execute(serializer.select().order_by(SelectedPost.selected_at.desc())))
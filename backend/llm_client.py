@@ -0,0 +1,174 @@
+import os
+import json
+import asyncio
+import random
+import logging
+from typing import AsyncIterator, List, Optional
+import aiohttp
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# HTTP статусы, после которых запрос имеет смысл повторить
+RETRY_STATUSES = {408, 409, 429, 500, 502, 503, 504}
+
+class LLMError(Exception):
+    """Ошибка обращения к LLM API"""
+
+    def __init__(self, message: str, status: Optional[int] = None):
+        super().__init__(message)
+        self.status = status
+
+class LLMClient:
+    """Общий асинхронный клиент OpenAI-совместимого API с пулом соединений и ретраями"""
+
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        base_url: Optional[str] = None,
+        max_concurrency: Optional[int] = None,
+        timeout: Optional[float] = None,
+        max_retries: Optional[int] = None,
+        pool_size: Optional[int] = None,
+    ):
+        self.api_key = api_key or os.getenv('OPENAI_API_KEY')
+        # OPENAI_BASE_URL позволяет направить клиент на локальную заглушку или прокси
+        self.base_url = (base_url or os.getenv('OPENAI_BASE_URL', 'https://api.openai.com/v1')).rstrip('/')
+        self.max_concurrency = max_concurrency or int(os.getenv('OPENAI_MAX_CONCURRENCY', '4'))
+        self.timeout = timeout or float(os.getenv('OPENAI_TIMEOUT', '60'))
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv('OPENAI_MAX_RETRIES', '4'))
+        self.pool_size = pool_size or int(os.getenv('OPENAI_POOL_SIZE', '10'))
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        """Возвращает общую HTTP-сессию (keep-alive пул соединений)"""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=60, ttl_dns_cache=300)
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout, connect=10),
+                headers={
+                    "Authorization": f"Bearer {self.api_key}",
+                    "Content-Type": "application/json",
+                },
+            )
+        return self._session
+
+    @staticmethod
+    def _retry_delay(attempt: int, headers=None) -> float:
+        """Пауза перед повтором: Retry-After от сервера или экспоненциальный backoff с джиттером"""
+        if headers:
+            retry_after_ms = headers.get('retry-after-ms')
+            if retry_after_ms:
+                try:
+                    return float(retry_after_ms) / 1000
+                except ValueError:
+                    pass
+            retry_after = headers.get('Retry-After')
+            if retry_after:
+                try:
+                    return float(retry_after)
+                except ValueError:
+                    pass
+        return min(30.0, 2 ** attempt) + random.uniform(0, 0.5)
+
+    async def chat_completion(self, **payload) -> dict:
+        """POST /chat/completions с ограничением параллелизма, таймаутами и повторами"""
+        url = f"{self.base_url}/chat/completions"
+        last_error: Optional[Exception] = None
+
+        for attempt in range(self.max_retries + 1):
+            headers = None
+            try:
+                # Семафор держим только на время самого запроса, не во время паузы
+                async with self._semaphore:
+                    async with self._get_session().post(url, json=payload) as response:
+                        if response.status == 200:
+                            return await response.json()
+                        body = await response.text()
+                        headers = response.headers
+                        last_error = LLMError(f"LLM API вернул {response.status}: {body[:500]}", response.status)
+                        if response.status not in RETRY_STATUSES:
+                            raise last_error
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                last_error = LLMError(f"Ошибка соединения с LLM API: {e!r}")
+
+            if attempt < self.max_retries:
+                delay = self._retry_delay(attempt, headers)
+                logging.warning(f"LLM request failed ({last_error}), retry {attempt + 1}/{self.max_retries} in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+        raise last_error
+
+    async def chat(self, messages: List[dict], model: str, max_tokens: int, temperature: float) -> str:
+        """Возвращает текст ответа модели"""
+        data = await self.chat_completion(
+            model=model,
+            messages=messages,
+            max_tokens=max_tokens,
+            temperature=temperature,
+        )
+        return data["choices"][0]["message"]["content"].strip()
+
+    async def stream_chat(self, messages: List[dict], model: str, max_tokens: int, temperature: float) -> AsyncIterator[str]:
+        """Потоковый ответ модели: отдает куски текста по мере генерации (SSE от API)"""
+        url = f"{self.base_url}/chat/completions"
+        payload = {
+            "model": model,
+            "messages": messages,
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            "stream": True,
+        }
+        # Общий таймаут не подходит для длинного стрима - ограничиваем паузы между кусками
+        timeout = aiohttp.ClientTimeout(total=None, connect=10, sock_read=self.timeout)
+        last_error: Optional[Exception] = None
+        started = False
+
+        for attempt in range(self.max_retries + 1):
+            headers = None
+            try:
+                async with self._semaphore:
+                    async with self._get_session().post(url, json=payload, timeout=timeout) as response:
+                        if response.status == 200:
+                            async for raw_line in response.content:
+                                line = raw_line.decode('utf-8').strip()
+                                if not line.startswith('data:'):
+                                    continue
+                                data = line[len('data:'):].strip()
+                                if data == '[DONE]':
+                                    return
+                                chunk = json.loads(data)
+                                choices = chunk.get("choices") or []
+                                delta = choices[0].get("delta", {}).get("content") if choices else None
+                                if delta:
+                                    started = True
+                                    yield delta
+                            return
+                        body = await response.text()
+                        headers = response.headers
+                        last_error = LLMError(f"LLM API вернул {response.status}: {body[:500]}", response.status)
+                        if response.status not in RETRY_STATUSES:
+                            raise last_error
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                last_error = LLMError(f"Ошибка соединения с LLM API: {e!r}")
+                # Часть ответа уже отдана клиенту - повтор продублировал бы текст
+                if started:
+                    raise last_error
+
+            if attempt < self.max_retries:
+                delay = self._retry_delay(attempt, headers)
+                logging.warning(f"LLM stream failed ({last_error}), retry {attempt + 1}/{self.max_retries} in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+        raise last_error
+
+    async def close(self):
+        """Закрывает пул соединений"""
+        if self._session and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+# Глобальный экземпляр клиента
+llm_client = LLMClient()
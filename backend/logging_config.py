@@ -0,0 +1,156 @@
+import os
+import sys
+import json
+import time
+import queue
+import atexit
+import logging
+import threading
+import logging.handlers
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+from tracing import current_span
+
+# Логи пишутся через очередь: вызывающий код только кладет запись, а форматирование
+# и запись в stdout/файл делает отдельный поток. Горячие циклы парсера логируют
+# подробности на DEBUG (при INFO они не форматируются вовсе), итоги - на INFO.
+
+# LOG_LEVEL - для логгеров приложения, LOG_LIBRARY_LEVEL - для всех остальных (pyrogram, httpx, sqlalchemy...),
+# чтобы LOG_LEVEL=DEBUG не включал отладочный вывод библиотек
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_LIBRARY_LEVEL = os.getenv("LOG_LIBRARY_LEVEL", "WARNING").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")  # text | json
+LOG_FILE = os.getenv("LOG_FILE", "")
+# Сколько DEBUG-записей в секунду пропускать на один канал (0 - без ограничения)
+LOG_CHANNEL_RATE = float(os.getenv("LOG_CHANNEL_RATE", "20"))
+
+# Логгеры модулей приложения (logging.getLogger(__name__)); "__main__" - при запуске python main.py
+APP_LOGGERS = ("main", "__main__", "telegram_parser", "telegram_daemon", "channel_post_writer")
+
+# Поля LogRecord, которые не надо дублировать в JSON как extra
+_RECORD_FIELDS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "taskName"}
+
+class ChannelSampler(logging.Filter):
+    """
+    Token bucket на канал для DEBUG-записей с extra={"channel_id": ...}: при тысячах сообщений в канале
+    в лог попадает не больше rate подробных записей в секунду. INFO и выше (итоги, ошибки) проходят всегда,
+    число отброшенных дописывается к следующей записи канала (поле sampled_out).
+    """
+
+    def __init__(self, rate: float = LOG_CHANNEL_RATE):
+        super().__init__()
+        self.rate = rate
+        self._buckets: Dict[str, list] = {}  # channel_id -> [токены, время пополнения, отброшено]
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        channel_id = getattr(record, "channel_id", None)
+        if not self.rate or channel_id is None:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(channel_id)
+            if bucket is None:
+                bucket = self._buckets[channel_id] = [self.rate, now, 0]
+            bucket[0] = min(self.rate, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            if record.levelno < logging.INFO:
+                if bucket[0] < 1:
+                    bucket[2] += 1
+                    return False
+                bucket[0] -= 1
+            if bucket[2]:
+                record.sampled_out, bucket[2] = bucket[2], 0
+        return True
+
+    def dropped(self) -> Dict[str, int]:
+        with self._lock:
+            return {channel_id: bucket[2] for channel_id, bucket in self._buckets.items() if bucket[2]}
+
+class ContextFilter(logging.Filter):
+    """Добавляет trace_id/span_id текущего спана - читается в потоке вызова, а не в потоке записи"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        span = current_span()
+        if span is not None and span.trace_id:
+            record.trace_id, record.span_id = span.trace_id, span.span_id
+        return True
+
+class JsonFormatter(logging.Formatter):
+    """Одна JSON-строка на запись: время, уровень, логгер, сообщение и все поля из extra"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_FIELDS and not key.startswith("_"):
+                data[key] = value if isinstance(value, (str, int, float, bool, type(None))) else str(value)
+        if record.exc_text:
+            data["exc"] = record.exc_text
+        return json.dumps(data, ensure_ascii=False)
+
+class TextFormatter(logging.Formatter):
+    """Как привычный print: только сообщение, плюс пометка о сэмплировании"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        text = super().format(record)
+        sampled_out = getattr(record, "sampled_out", None)
+        if sampled_out:
+            text += f" (+{sampled_out} записей канала отброшено)"
+        return text
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Стандартный prepare форматирует сообщение в вызывающем потоке; нам достаточно
+        # подставить аргументы, а traceback и JSON соберет поток записи
+        record.message = record.getMessage()
+        record.msg, record.args = record.message, None
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.exc_info = None
+        return record
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_queue_handler: Optional[logging.Handler] = None
+sampler = ChannelSampler()
+
+def setup_logging(level: str = LOG_LEVEL, fmt: str = LOG_FORMAT, log_file: str = LOG_FILE,
+                  library_level: str = LOG_LIBRARY_LEVEL):
+    """Подключает очередь к корневому логгеру; повторные вызовы ничего не делают"""
+    global _listener, _queue_handler
+    if _listener is not None:
+        return
+
+    formatter = JsonFormatter() if fmt == "json" else TextFormatter("%(message)s")
+    handlers = [logging.StreamHandler(sys.stdout)]
+    if log_file:
+        handlers.append(logging.FileHandler(log_file, encoding="utf-8"))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    _queue_handler = _QueueHandler(log_queue)
+    _queue_handler.addFilter(sampler)
+    _queue_handler.addFilter(ContextFilter())
+
+    root = logging.getLogger()
+    root.setLevel(library_level)
+    for name in APP_LOGGERS:
+        logging.getLogger(name).setLevel(level)
+    root.addHandler(_queue_handler)
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+def shutdown_logging():
+    """Дописывает очередь и останавливает поток записи"""
+    global _listener, _queue_handler
+    if _listener is not None:
+        logging.getLogger().removeHandler(_queue_handler)
+        _listener.stop()
+        _listener = _queue_handler = None
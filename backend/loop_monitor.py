@@ -0,0 +1,143 @@
+import os
+import sys
+import time
+import asyncio
+import threading
+import traceback
+from collections import deque
+from datetime import datetime
+from typing import Optional
+
+# Монитор задержки event loop: одна блокирующая операция в async-эндпоинте
+# (os.walk, синхронный ORM или HTTP-клиент) останавливает парсинг и ответы для всех пользователей.
+
+LOOP_MONITOR_INTERVAL = float(os.getenv("LOOP_MONITOR_INTERVAL", "0.1"))
+LOOP_BLOCK_THRESHOLD_MS = float(os.getenv("LOOP_BLOCK_THRESHOLD_MS", "250"))
+
+_BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def _percentile(sorted_values, fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+def _culprit(frames) -> Optional[str]:
+    """Самый глубокий кадр кода приложения - обычно это и есть блокирующий вызов"""
+    for frame in reversed(frames):
+        filename = os.path.abspath(frame.filename)
+        if filename.startswith(_BACKEND_DIR) and filename.endswith(".py") and filename != os.path.abspath(__file__):
+            return f"{os.path.relpath(filename, _BACKEND_DIR)}:{frame.lineno} in {frame.name}"
+    return None
+
+class LoopMonitor:
+    """
+    Корутина замеряет, насколько позже запланированного просыпается sleep (это и есть лаг),
+    а сторожевой поток снимает стек потока event loop, если тот не отвечает дольше порога.
+    """
+
+    def __init__(self, interval: float = LOOP_MONITOR_INTERVAL, threshold_ms: float = LOOP_BLOCK_THRESHOLD_MS):
+        self.interval = interval
+        self.threshold_ms = threshold_ms
+        self.lag_samples: deque = deque(maxlen=3000)  # ~5 минут при интервале 0.1с
+        self.stalls: deque = deque(maxlen=50)
+        self.max_lag_ms = 0.0
+        self.started_at: Optional[datetime] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._heartbeat = 0.0
+        self._pending_stall: Optional[dict] = None
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        if self.running:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stopped.clear()
+        self.started_at = datetime.now()
+        self._task = asyncio.create_task(self._sample())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+        print(f"⏲️ Монитор event loop запущен (порог блокировки {self.threshold_ms:.0f} мс)")
+
+    async def stop(self):
+        self._stopped.set()
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _sample(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self._heartbeat = now
+            lag_ms = max(0.0, (now - expected) * 1000)
+            self.lag_samples.append(lag_ms)
+            self.max_lag_ms = max(self.max_lag_ms, lag_ms)
+
+            stall = self._pending_stall
+            if stall is not None:
+                # Цикл ожил - фиксируем полную длительность блокировки
+                stall["blocked_ms"] = round(lag_ms, 1)
+                self._pending_stall = None
+                print(f"🐌 Event loop был заблокирован {lag_ms:.0f} мс: {stall['culprit']}")
+
+    def _watch(self):
+        check_every = max(0.01, self.threshold_ms / 1000 / 2)
+        while not self._stopped.wait(check_every):
+            blocked_ms = (time.monotonic() - self._heartbeat - self.interval) * 1000
+            if blocked_ms < self.threshold_ms or self._pending_stall is not None:
+                continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            frames = traceback.extract_stack(frame)
+            stall = {
+                "at": datetime.now().isoformat(),
+                "blocked_ms": round(blocked_ms, 1),  # уточняется, когда цикл проснется
+                "task": self._current_task_name(),
+                "culprit": _culprit(frames) or "unknown",
+                "stack": traceback.format_list(frames[-25:]),
+            }
+            self._pending_stall = stall
+            self.stalls.append(stall)
+
+    def _current_task_name(self) -> Optional[str]:
+        # asyncio.current_task() нельзя вызывать из другого потока - читаем словарь текущих задач
+        try:
+            task = asyncio.tasks._current_tasks.get(self._loop)
+        except Exception:
+            return None
+        if task is None:
+            return None
+        coro = task.get_coro()
+        return f"{task.get_name()} ({getattr(coro, '__qualname__', coro)})"
+
+    def report(self) -> dict:
+        samples = sorted(self.lag_samples)
+        return {
+            "running": self.running,
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "interval_ms": self.interval * 1000,
+            "threshold_ms": self.threshold_ms,
+            "samples": len(samples),
+            "lag_p50_ms": round(_percentile(samples, 0.5), 2),
+            "lag_p99_ms": round(_percentile(samples, 0.99), 2),
+            "lag_max_ms": round(self.max_lag_ms, 2),
+            "stalls": list(reversed(self.stalls)),
+        }
+
+loop_monitor = LoopMonitor()
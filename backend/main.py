@@ -1,24 +1,58 @@
 import os
+import json
 import asyncio
-from fastapi import FastAPI, Depends, HTTPException
+import logging
+from fastapi import FastAPI, Depends, HTTPException, Request, Header
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse, FileResponse
+from fastapi.responses import HTMLResponse, FileResponse, StreamingResponse, JSONResponse, PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
 from typing import List, Optional
+from sqlalchemy import func, select, delete
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from datetime import datetime
+from datetime import datetime, timezone
 from dotenv import load_dotenv
 
-from db import engine, Base, get_session
+from db import engine, async_engine, Base, get_session, get_async_session, SessionLocal, upgrade_schema
 from models import Source, Post, SelectedPost, User
 from telegram_parser import telegram_parser
 from multi_user_telegram import multi_user_manager
+from openai_utils import rewrite, rewrite_stream
+from llm_client import llm_client
+from rewrite_jobs import rewrite_job_manager
+from publisher import publish_scheduler
+from channel_post_writer import channel_post_writer
+from metrics import MetricsMiddleware, add_ingested_post, register_gauge, render as render_metrics
+from query_profiler import QueryCountMiddleware, query_profiler
+from loop_monitor import loop_monitor
+from tracing import TracingMiddleware, tracer
+from logging_config import setup_logging, shutdown_logging
+import feed_serializer
+from feed_cache import feed_cache
 
 load_dotenv()
+setup_logging()
+logger = logging.getLogger(__name__)
+
+# TELEGRAM_MODE=remote: клиентами Telegram владеет отдельный демон (telegram_daemon.py),
+# а этот процесс обращается к нему через IPC - так API можно запускать в несколько воркеров
+TELEGRAM_REMOTE = os.getenv('TELEGRAM_MODE', 'local').lower() == 'remote'
+if TELEGRAM_REMOTE:
+    from telegram_ipc import RemoteTelegramManager
+    multi_user_manager = RemoteTelegramManager()
+    telegram_parser = multi_user_manager.legacy_parser
 
 app = FastAPI(title='SMM Bot Web App')
 
+if TELEGRAM_REMOTE:
+    from telegram_ipc import TelegramIPCError
+
+    @app.exception_handler(TelegramIPCError)
+    async def telegram_ipc_error_handler(request: Request, exc: TelegramIPCError):
+        """Демон Telegram недоступен или вернул ошибку"""
+        return JSONResponse(status_code=503, content={"detail": str(exc)})
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -27,6 +61,17 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(QueryCountMiddleware)
+app.add_middleware(TracingMiddleware)
+
+# Глубина очередей считывается в момент запроса /metrics
+register_gauge("bot_ingest_queue_depth", "Постов бота в очереди на запись", lambda: channel_post_writer.queue.qsize())
+register_gauge("publish_pacer_pending", "Отправок, ожидающих слота у планировщика публикаций", lambda: publish_scheduler.pacer.pending())
+register_gauge(
+    "rewrite_jobs_running", "Активных задач пакетного переписывания",
+    lambda: sum(1 for job in rewrite_job_manager.jobs.values() if job["status"] == "running")
+)
 
 # Статические файлы для медиа
 media_path = os.path.abspath("../frontend/public/media")
@@ -62,10 +107,31 @@ async def get_media_file(channel_id: str, filename: str):
 
 # Create database tables
 Base.metadata.create_all(bind=engine)
+upgrade_schema()
 
 @app.on_event("startup")
 async def startup_event():
     """Инициализация при запуске приложения"""
+    loop_monitor.start()
+    
+    if TELEGRAM_REMOTE:
+        # Клиенты, прогрев и планировщик публикаций живут в демоне Telegram
+        print("📡 Telegram работает через демон (TELEGRAM_MODE=remote)")
+    else:
+        await _start_local_telegram()
+    
+    # Режим вебхука: бот принимает обновления в этом же процессе
+    if os.getenv('BOT_TOKEN') and os.getenv('BOT_WEBHOOK_URL'):
+        import bot_handlers
+        # Без общего секрета запросы Telegram нельзя проверить - останавливаем запуск
+        bot_handlers.require_webhook_secret()
+        try:
+            await bot_handlers.start_webhook()
+        except Exception as e:
+            print(f"❌ Ошибка запуска вебхука бота: {e}")
+
+async def _start_local_telegram():
+    """Клиенты Telegram и фоновые задачи в процессе API (режим по умолчанию)"""
     try:
         # Инициализируем старый парсер для обратной совместимости
         await telegram_parser.initialize_client()
@@ -74,6 +140,20 @@ async def startup_event():
         print("🚀 Многопользовательский менеджер Telegram готов")
     except Exception as e:
         print(f"❌ Ошибка инициализации: {e}")
+    
+    # Прогрев: заранее подключаем все сохраненные сессии, а не при первом запросе
+    if os.getenv('TELEGRAM_WARM_START', '').lower() in ('1', 'true', 'yes'):
+        db = SessionLocal()
+        try:
+            await multi_user_manager.warm_up(db)
+        except Exception as e:
+            print(f"❌ Ошибка прогрева сессий: {e}")
+        finally:
+            db.close()
+    
+    # Планировщик публикаций работает только при настроенном боте
+    if os.getenv('BOT_TOKEN'):
+        publish_scheduler.start()
 
 @app.on_event("shutdown") 
 async def shutdown_event():
@@ -81,15 +161,39 @@ async def shutdown_event():
     try:
         print("🔌 Завершаем работу приложения...")
         
-        # Останавливаем старый парсер (для совместимости)
-        await telegram_parser.stop()
-        telegram_parser._auth_cache = None
-        telegram_parser._auth_cache_time = None
+        if TELEGRAM_REMOTE:
+            # Клиенты принадлежат демону - только закрываем соединение с ним
+            await multi_user_manager.close()
+        else:
+            # Останавливаем старый парсер (для совместимости)
+            await telegram_parser.stop()
+            telegram_parser.clear_auth_cache()
+            
+            # Останавливаем всех пользователей
+            await multi_user_manager.stop_all()
+        
+        # Останавливаем планировщик публикаций
+        await publish_scheduler.stop()
+        
+        # Останавливаем обработку апдейтов бота и дописываем оставшиеся посты
+        if os.getenv('BOT_TOKEN') and os.getenv('BOT_WEBHOOK_URL'):
+            import bot_handlers
+            await bot_handlers.stop_webhook()
+        await channel_post_writer.stop()
+        
+        # Закрываем пул соединений к OpenAI
+        await llm_client.close()
+        
+        # Закрываем пул асинхронных соединений к БД
+        await async_engine.dispose()
         
-        # Останавливаем всех пользователей
-        await multi_user_manager.stop_all()
+        await loop_monitor.stop()
+        
+        # Дописываем накопленные спаны трассировки
+        tracer.shutdown()
         
         print("✅ Все парсеры остановлены, сессии сохранены")
+        shutdown_logging()
     except Exception as e:
         print(f"⚠️ Предупреждение при остановке: {e}")
 
@@ -140,10 +244,19 @@ class SelectedPostResponse(BaseModel):
     status: str
     selected_at: datetime
     notes: Optional[str]
+    target_channel_id: Optional[str]
+    publish_at: Optional[datetime]
+    published_at: Optional[datetime]
+    published_message_id: Optional[int]
+    publish_error: Optional[str]
     
     class Config:
         orm_mode = True
 
+# Сериализаторы ленты: колонки для select берутся из полей схем ответа
+post_rows = feed_serializer.RowSerializer(Post, PostResponse)
+selected_post_rows = feed_serializer.RowSerializer(SelectedPost, SelectedPostResponse)
+
 class PostSelect(BaseModel):
     post_id: int
     notes: Optional[str] = None
@@ -153,6 +266,24 @@ class PostEdit(BaseModel):
     status: Optional[str] = "draft"
     notes: Optional[str] = None
 
+class PostSchedule(BaseModel):
+    selected_post_id: int
+    channel_id: str
+    scheduled_time: datetime  # ISO 8601 с часовым поясом (фронтенд шлет toISOString())
+    text: Optional[str] = None
+
+class PostFanout(BaseModel):
+    channel_ids: List[str]
+
+class RewriteRequest(BaseModel):
+    text: str
+    truncate: Optional[int] = None
+
+class BatchRewriteRequest(BaseModel):
+    selected_post_ids: Optional[List[int]] = None  # Если не указаны - все черновики
+    truncate: Optional[int] = None
+    overwrite: bool = False  # Переписать и посты, которые редактор уже поправил вручную
+
 # Telegram session models
 class PhoneRequest(BaseModel):
     phone_number: str
@@ -212,12 +343,12 @@ async def parse_new_posts_for_source(channel_id: str, db: Session, current_parse
         if not current_parser:
             current_parser = await multi_user_manager.get_current_user_parser(db)
             if not current_parser:
-                print(f"⚠️ Нет авторизованных пользователей, пропускаем парсинг для {channel_id}")
+                logger.warning("⚠️ Нет авторизованных пользователей, пропускаем парсинг для %s", channel_id, extra={"channel_id": channel_id})
                 return
         
         is_authorized = await current_parser.is_authorized()
         if not is_authorized:
-            print(f"⚠️ Не авторизован в Telegram, пропускаем парсинг для {channel_id}")
+            logger.warning("⚠️ Не авторизован в Telegram, пропускаем парсинг для %s", channel_id, extra={"channel_id": channel_id})
             return
         
         # Получаем последний пост для этого конкретного канала
@@ -228,7 +359,7 @@ async def parse_new_posts_for_source(channel_id: str, db: Session, current_parse
         last_message_id = last_post_in_channel.message_id if last_post_in_channel else 0
         last_date = last_post_in_channel.post_date if last_post_in_channel else None
         
-        print(f"📊 Оптимизированный автопарсинг {channel_id}: последний message_id={last_message_id}, дата={last_date}")
+        logger.debug("📊 Оптимизированный автопарсинг %s: последний message_id=%s, дата=%s", channel_id, last_message_id, last_date, extra={"channel_id": channel_id})
         
         # Умная проверка - парсим только новее последнего поста
         check_limit = 15  # Проверяем 15 последних постов из канала
@@ -239,11 +370,11 @@ async def parse_new_posts_for_source(channel_id: str, db: Session, current_parse
         )
         
         if result["status"] == "error":
-            print(f"❌ Ошибка парсинга канала {channel_id}: {result['message']}")
+            logger.warning("❌ Ошибка парсинга канала %s: %s", channel_id, result['message'], extra={"channel_id": channel_id})
             return
         
         posts_data = result.get("posts", [])
-        print(f"📝 Получено {len(posts_data)} постов для проверки из канала {channel_id}")
+        logger.debug("📝 Получено %s постов для проверки из канала %s", len(posts_data), channel_id, extra={"channel_id": channel_id})
         
         # Фильтруем только действительно новые посты
         new_posts_count = 0
@@ -269,28 +400,28 @@ async def parse_new_posts_for_source(channel_id: str, db: Session, current_parse
                 
                 if not existing_post:
                     new_post = Post(**post_data)
-                    db.add(new_post)
+                    add_ingested_post(db, new_post)
                     new_posts_count += 1
-                    print(f"  ✅ Добавлен новый пост: message_id={message_id}, дата={post_date}")
+                    logger.debug("  ✅ Добавлен новый пост: message_id=%s, дата=%s", message_id, post_date, extra={"channel_id": channel_id})
                 else:
-                    print(f"  ⚠️ Пост {message_id} уже существует в БД")
+                    logger.debug("  ⚠️ Пост %s уже существует в БД", message_id, extra={"channel_id": channel_id})
                     
             except Exception as e:
-                print(f"❌ Ошибка при сохранении поста {post_data.get('message_id', 'unknown')}: {e}")
+                logger.warning("❌ Ошибка при сохранении поста %s: %s", post_data.get('message_id', 'unknown'), e, extra={"channel_id": channel_id})
                 continue
         
         if new_posts_count > 0:
             try:
                 db.commit()
-                print(f"✅ Оптимизированный автопарсинг - добавлено {new_posts_count} новых постов для канала {channel_id}")
+                logger.info("✅ Оптимизированный автопарсинг - добавлено %s новых постов для канала %s", new_posts_count, channel_id, extra={"channel_id": channel_id})
             except Exception as e:
-                print(f"❌ Ошибка при коммите: {e}")
+                logger.warning("❌ Ошибка при коммите: %s", e, extra={"channel_id": channel_id})
                 db.rollback()
         else:
-            print(f"📭 Новых постов не найдено для канала {channel_id}")
+            logger.debug("📭 Новых постов не найдено для канала %s", channel_id, extra={"channel_id": channel_id})
                 
     except Exception as e:
-        print(f"❌ Общая ошибка при оптимизированном парсинге канала {channel_id}: {e}")
+        logger.warning("❌ Общая ошибка при оптимизированном парсинге канала %s: %s", channel_id, e, extra={"channel_id": channel_id})
 
 @app.delete("/api/sources/{source_id}")
 def remove_source(source_id: int, db: Session = Depends(get_session)):
@@ -382,7 +513,7 @@ def remove_source(source_id: int, db: Session = Depends(get_session)):
         raise HTTPException(status_code=500, detail=f"Ошибка при удалении источника: {str(e)}")
 
 @app.post("/api/sources/parse-all")
-async def parse_all_sources(db: Session = Depends(get_session)):
+async def parse_all_sources(db: AsyncSession = Depends(get_async_session)):
     """Парсинг всех активных источников"""
     # Получаем парсер для текущего пользователя
     current_parser = await multi_user_manager.get_current_user_parser(db)
@@ -402,7 +533,7 @@ async def parse_all_sources(db: Session = Depends(get_session)):
 @app.post("/api/sources/parse-new/{channel_id}")
 async def parse_new_source(channel_id: str, db: Session = Depends(get_session)):
     """Оптимизированный быстрый парсинг для нового источника"""
-    print(f"🚀 Оптимизированный автопарсинг нового источника: {channel_id}")
+    logger.info("🚀 Оптимизированный автопарсинг нового источника: %s", channel_id, extra={"channel_id": channel_id})
     
     # Получаем парсер для текущего пользователя
     current_parser = await multi_user_manager.get_current_user_parser(db)
@@ -423,7 +554,7 @@ async def parse_new_source(channel_id: str, db: Session = Depends(get_session)):
         last_message_id = last_post_in_channel.message_id if last_post_in_channel else 0
         last_date = last_post_in_channel.post_date if last_post_in_channel else None
         
-        print(f"📊 Последний пост в БД для канала {channel_id}: message_id={last_message_id}, дата={last_date}")
+        logger.debug("📊 Последний пост в БД для канала %s: message_id=%s, дата=%s", channel_id, last_message_id, last_date, extra={"channel_id": channel_id})
         
         # Парсим только новые посты
         check_limit = 20  # Проверяем 20 последних постов из канала
@@ -439,7 +570,7 @@ async def parse_new_source(channel_id: str, db: Session = Depends(get_session)):
         posts_data = result.get("posts", [])
         new_posts_count = 0
         
-        print(f"📝 Получено {len(posts_data)} постов для проверки")
+        logger.debug("📝 Получено %s постов для проверки", len(posts_data), extra={"channel_id": channel_id})
         
         for post_data in posts_data:
             message_id = post_data.get("message_id")
@@ -458,25 +589,25 @@ async def parse_new_source(channel_id: str, db: Session = Depends(get_session)):
             if not existing_post:
                 try:
                     new_post = Post(**post_data)
-                    db.add(new_post)
+                    add_ingested_post(db, new_post)
                     new_posts_count += 1
-                    print(f"  ✅ Добавлен новый пост: message_id={message_id}, дата={post_date}")
+                    logger.debug("  ✅ Добавлен новый пост: message_id=%s, дата=%s", message_id, post_date, extra={"channel_id": channel_id})
                 except Exception as e:
-                    print(f"❌ Ошибка при сохранении поста {message_id}: {e}")
+                    logger.warning("❌ Ошибка при сохранении поста %s: %s", message_id, e, extra={"channel_id": channel_id})
                     continue
             else:
-                print(f"  ⚠️ Пост {message_id} уже существует в БД")
+                logger.debug("  ⚠️ Пост %s уже существует в БД", message_id, extra={"channel_id": channel_id})
         
         if new_posts_count > 0:
             try:
                 db.commit()
-                print(f"✅ Добавлено {new_posts_count} новых постов для канала {channel_id}")
+                logger.info("✅ Добавлено %s новых постов для канала %s", new_posts_count, channel_id, extra={"channel_id": channel_id})
             except Exception as e:
-                print(f"❌ Ошибка при коммите: {e}")
+                logger.warning("❌ Ошибка при коммите: %s", e, extra={"channel_id": channel_id})
                 db.rollback()
                 new_posts_count = 0
         else:
-            print(f"📭 Новых постов не найдено для канала {channel_id}")
+            logger.debug("📭 Новых постов не найдено для канала %s", channel_id, extra={"channel_id": channel_id})
         
         return {
             "message": f"Оптимизированный автопарсинг завершен. Добавлено {new_posts_count} постов",
@@ -485,58 +616,31 @@ async def parse_new_source(channel_id: str, db: Session = Depends(get_session)):
         }
         
     except Exception as e:
-        print(f"❌ Ошибка при оптимизированном автопарсинге канала {channel_id}: {e}")
+        logger.warning("❌ Ошибка при оптимизированном автопарсинге канала %s: %s", channel_id, e, extra={"channel_id": channel_id})
         return {"message": f"Ошибка: {str(e)}", "new_posts": 0}
 
 # === ПОСТЫ ===
 @app.get("/api/posts", response_model=List[PostResponse])
-def get_posts(db: Session = Depends(get_session)):
+async def get_posts():
     """Получить все посты с активных источников"""
-    # Получаем ID активных источников
-    active_sources = db.query(Source).filter(Source.is_active == True).all()
-    if not active_sources:
-        return []
-    
-    source_ids = [s.channel_id for s in active_sources]
-    posts = db.query(Post).filter(Post.channel_id.in_(source_ids)).order_by(Post.post_date.desc()).all()
-    return [PostResponse.from_orm(post) for post in posts]
+    def render():
+        # Сессия открывается в потоке рендера: соединения SQLite нельзя передавать между потоками
+        with SessionLocal() as db:
+            return feed_serializer.dumps(feed_serializer.list_posts(db, post_rows))
+
+    return feed_serializer.json_response(await feed_cache.get_or_render(("posts",), render))
 
 @app.get("/api/posts/paginated")
-def get_posts_paginated(
-    offset: int = 0, 
-    limit: int = 10, 
-    db: Session = Depends(get_session)
-):
-    """Получить посты с пагинацией"""
-    # Получаем активные источники
-    active_sources = db.query(Source).filter(Source.is_active == True).all()
-    if not active_sources:
-        return {"posts": [], "has_more": False, "total": 0}
-    
-    source_ids = [s.channel_id for s in active_sources]
-    
-    # Создаем базовый запрос
-    query = db.query(Post).filter(Post.channel_id.in_(source_ids))
-    
-    # Получаем общее количество постов
-    total_posts = query.count()
-    
-    # Получаем посты с пагинацией, сортировка по дате (новые сверху)
-    posts = query.order_by(Post.post_date.desc()).offset(offset).limit(limit).all()
-    
-    # Проверяем есть ли еще посты в БД
-    has_more = offset + len(posts) < total_posts
-    
-    print(f"📊 Пагинация: offset={offset}, limit={limit}, загружено={len(posts)}, всего={total_posts}, has_more={has_more}")
-    
-    return {
-        "posts": [PostResponse.from_orm(post) for post in posts],
-        "has_more": has_more,
-        "total": total_posts,
-        "offset": offset,
-        "limit": limit,
-        "loaded_count": len(posts)
-    }
+async def get_posts_paginated(offset: int = 0, limit: int = 10):
+    """Получить посты с пагинацией (новые сверху); страницы кэшируются до следующего коммита в ленту"""
+    def render():
+        with SessionLocal() as db:
+            page = feed_serializer.posts_page(db, post_rows, offset, limit)
+        logger.debug("📊 Пагинация: offset=%s, limit=%s, загружено=%s, всего=%s, has_more=%s",
+                     offset, limit, len(page["posts"]), page["total"], page["has_more"])
+        return feed_serializer.dumps(page)
+
+    return feed_serializer.json_response(await feed_cache.get_or_render(("posts_page", offset, limit), render))
 
 @app.post("/api/posts/select")
 def select_post(post_select: PostSelect, db: Session = Depends(get_session)):
@@ -566,10 +670,13 @@ def select_post(post_select: PostSelect, db: Session = Depends(get_session)):
 
 # === ОТОБРАННЫЕ ПОСТЫ ===
 @app.get("/api/selected-posts", response_model=List[SelectedPostResponse])
-def get_selected_posts(db: Session = Depends(get_session)):
+async def get_selected_posts():
     """Получить все отобранные посты"""
-    selected_posts = db.query(SelectedPost).order_by(SelectedPost.selected_at.desc()).all()
-    return [SelectedPostResponse.from_orm(post) for post in selected_posts]
+    def render():
+        with SessionLocal() as db:
+            return feed_serializer.dumps(feed_serializer.list_selected_posts(db, selected_post_rows))
+
+    return feed_serializer.json_response(await feed_cache.get_or_render(("selected_posts",), render))
 
 @app.put("/api/selected-posts/{selected_post_id}")
 def edit_selected_post(selected_post_id: int, post_edit: PostEdit, db: Session = Depends(get_session)):
@@ -603,8 +710,116 @@ def remove_selected_post(selected_post_id: int, db: Session = Depends(get_sessio
     db.commit()
     return {"message": "Пост удален из отобранных"}
 
+@app.post("/api/posts/schedule")
+def schedule_post(post_schedule: PostSchedule, db: Session = Depends(get_session)):
+    """Запланировать публикацию отобранного поста в канал"""
+    selected_post = db.query(SelectedPost).filter(SelectedPost.id == post_schedule.selected_post_id).first()
+    if not selected_post:
+        raise HTTPException(status_code=404, detail="Отобранный пост не найден")
+    
+    publish_at = post_schedule.scheduled_time
+    if publish_at.tzinfo is None:
+        # Локальное время браузера без пояса нельзя однозначно перевести в UTC
+        raise HTTPException(status_code=400, detail="Время публикации должно содержать часовой пояс")
+    publish_at = publish_at.astimezone(timezone.utc).replace(tzinfo=None)
+    
+    if post_schedule.text is not None:
+        selected_post.edited_text = post_schedule.text
+    selected_post.target_channel_id = post_schedule.channel_id
+    selected_post.publish_at = publish_at
+    selected_post.status = "ready"
+    selected_post.publish_attempts = 0
+    selected_post.publish_error = None
+    db.commit()
+    
+    return {
+        "message": "Публикация запланирована",
+        "selected_post_id": selected_post.id,
+        "channel_id": selected_post.target_channel_id,
+        "publish_at": publish_at.isoformat()
+    }
+
+@app.post("/api/selected-posts/{selected_post_id}/publish")
+async def publish_selected_post(selected_post_id: int, post_fanout: PostFanout):
+    """Опубликовать отобранный пост сразу в несколько каналов"""
+    if not os.getenv('BOT_TOKEN'):
+        raise HTTPException(status_code=503, detail="BOT_TOKEN не настроен")
+    if not post_fanout.channel_ids:
+        raise HTTPException(status_code=400, detail="Не указаны каналы для публикации")
+    
+    result = await publish_scheduler.publish_to_channels(selected_post_id, post_fanout.channel_ids)
+    if result["status"] == "error" and "results" not in result:
+        raise HTTPException(status_code=result["code"], detail=result["message"])
+    return result
+
+# === AI ПЕРЕПИСЫВАНИЕ ===
+@app.post("/api/rewrite")
+async def rewrite_post_text(rewrite_request: RewriteRequest):
+    """Переписать текст поста через OpenAI (повторные запросы отдаются из кэша)"""
+    result = await rewrite(rewrite_request.text, rewrite_request.truncate)
+    return {"result": result}
+
+@app.get("/api/selected-posts/{selected_post_id}/rewrite/stream")
+async def stream_selected_post_rewrite(selected_post_id: int, truncate: Optional[int] = None):
+    """Потоковое AI-переписывание поста (SSE): токены идут по мере генерации, итог сохраняется в edited_text"""
+    # Синхронные сессии - в пуле потоков: генератор SSE работает в event loop
+    def load_text():
+        with SessionLocal() as session:
+            return session.execute(
+                select(SelectedPost.original_text).where(SelectedPost.id == selected_post_id)
+            ).first()
+
+    def save_text(text: str):
+        with SessionLocal() as session:
+            session.query(SelectedPost).filter(SelectedPost.id == selected_post_id).update(
+                {"edited_text": text}, synchronize_session=False
+            )
+            session.commit()
+
+    row = await asyncio.to_thread(load_text)
+    if row is None:
+        raise HTTPException(status_code=404, detail="Отобранный пост не найден")
+    source_text = row.original_text or ""
+
+    def sse(event: str, data: dict) -> str:
+        return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+    async def event_stream():
+        try:
+            async for event in rewrite_stream(source_text, truncate):
+                if event["type"] == "token":
+                    yield sse("token", {"text": event["text"]})
+                elif event["type"] == "condense":
+                    yield sse("condense", {})
+                elif event["type"] == "done":
+                    # Сохраняем результат в отдельной сессии - стрим живет дольше запроса
+                    await asyncio.to_thread(save_text, event["text"])
+                    yield sse("done", {"edited_text": event["text"]})
+        except Exception as e:
+            print(f"❌ Ошибка потокового переписывания поста {selected_post_id}: {e}")
+            yield sse("error", {"message": str(e)})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.post("/api/selected-posts/rewrite-batch")
+async def start_batch_rewrite(batch_request: BatchRewriteRequest):
+    """Запустить пакетное переписывание отобранных постов (по id или всех черновиков)"""
+    return await rewrite_job_manager.start_job(batch_request.selected_post_ids, batch_request.truncate, batch_request.overwrite)
+
+@app.get("/api/selected-posts/rewrite-batch/{job_id}")
+def get_batch_rewrite_status(job_id: str):
+    """Прогресс пакетного переписывания"""
+    job = rewrite_job_manager.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Задача не найдена")
+    return job
+
 @app.delete("/api/posts/clear-all")
-async def clear_all_posts(db: Session = Depends(get_session)):
+async def clear_all_posts(db: AsyncSession = Depends(get_async_session)):
     """Полная очистка всех постов из базы данных"""
     try:
         print("🛑 Безопасно завершаем Telegram клиент перед очисткой постов...")
@@ -619,18 +834,18 @@ async def clear_all_posts(db: Session = Depends(get_session)):
         print("🗑️ Кэш авторизации очищен")
         
         # Подсчитываем количество постов перед удалением
-        total_posts = db.query(Post).count()
-        total_selected = db.query(SelectedPost).count()
+        total_posts = await db.scalar(select(func.count()).select_from(Post))
+        total_selected = await db.scalar(select(func.count()).select_from(SelectedPost))
         
         print(f"📊 Найдено {total_posts} постов и {total_selected} отобранных постов для удаления")
         
         # Удаляем все отобранные посты
-        db.query(SelectedPost).delete()
+        await db.execute(delete(SelectedPost))
         
         # Удаляем все посты
-        db.query(Post).delete()
+        await db.execute(delete(Post))
         
-        db.commit()
+        await db.commit()
         
         print(f"✅ Удаление завершено: {total_posts} постов и {total_selected} отобранных постов")
         
@@ -642,7 +857,7 @@ async def clear_all_posts(db: Session = Depends(get_session)):
         }
         
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         print(f"❌ Ошибка при очистке постов: {e}")
         return {
             "status": "error",
@@ -664,14 +879,11 @@ async def get_telegram_status(db: Session = Depends(get_session)):
                 "timestamp": datetime.now().isoformat()
             }
         
-        # Проверяем авторизацию (используем кэш для уменьшения нагрузки на API)
+        # Статус авторизации: из памяти супервизора соединения, иначе через кэш
         is_authorized = await current_parser.is_authorized()
         
         # Диагностическая информация
-        session_file = f"sessions/{current_parser.session_name}.session"
-        session_exists = os.path.exists(session_file)
-        client_connected = current_parser.client.is_connected if current_parser.client else False
-        client_initialized = current_parser._initialized
+        parser_status = await current_parser.get_status()
         
         # Информация о текущем пользователе
         current_user = db.query(User).filter(
@@ -690,9 +902,10 @@ async def get_telegram_status(db: Session = Depends(get_session)):
         return {
             "authorized": is_authorized,
             "current_user": user_info,
-            "session_file_exists": session_exists,
-            "client_connected": client_connected,
-            "client_initialized": client_initialized,
+            "session_file_exists": parser_status["session_file_exists"],
+            "client_connected": parser_status["client_connected"],
+            "client_initialized": parser_status["client_initialized"],
+            "connection": parser_status["connection"],
             "timestamp": datetime.now().isoformat()
         }
     except Exception as e:
@@ -703,6 +916,19 @@ async def get_telegram_status(db: Session = Depends(get_session)):
             "timestamp": datetime.now().isoformat()
         }
 
+@app.get("/api/telegram/cache-stats")
+async def get_telegram_cache_stats():
+    """Статистика кэшей авторизации и быстрых проверок"""
+    return {"caches": await multi_user_manager.get_cache_stats()}
+
+@app.get("/api/telegram/warm-up")
+async def get_telegram_warm_up():
+    """Отчет о последнем прогреве сессий при старте"""
+    report = await multi_user_manager.get_warm_up_report()
+    if report is None:
+        return {"status": "not_run", "message": "Прогрев не выполнялся (TELEGRAM_WARM_START выключен)"}
+    return {"status": "success", **report}
+
 @app.get("/api/users")
 async def get_users(db: Session = Depends(get_session)):
     """Получить список всех пользователей"""
@@ -859,6 +1085,19 @@ async def switch_user(user_id: int, db: Session = Depends(get_session)):
         print(f"❌ Ошибка переключения пользователя: {e}")
         raise HTTPException(status_code=400, detail=f"Ошибка переключения: {str(e)}")
 
+@app.post("/api/telegram/webhook")
+async def telegram_webhook(request: Request, x_telegram_bot_api_secret_token: Optional[str] = Header(None)):
+    """Прием обновлений бота от Telegram: проверяем секрет, ставим в очередь и сразу отвечаем"""
+    if not (os.getenv('BOT_TOKEN') and os.getenv('BOT_WEBHOOK_URL')):
+        raise HTTPException(status_code=404, detail="Вебхук бота не настроен")
+    
+    import bot_handlers
+    if not bot_handlers.verify_webhook_secret(x_telegram_bot_api_secret_token):
+        raise HTTPException(status_code=403, detail="Неверный секрет вебхука")
+    
+    await bot_handlers.enqueue_update(await request.json())
+    return {"ok": True}
+
 # Совместимость: старые эндпоинты
 @app.post("/api/telegram/clear-auth-cache")
 async def clear_auth_cache():
@@ -914,7 +1153,7 @@ async def get_telegram_channels(search: str = None, db: Session = Depends(get_se
 
 # === ПАРСИНГ ===
 @app.post("/api/parse")
-async def parse_channels(db: Session = Depends(get_session)):
+async def parse_channels(db: AsyncSession = Depends(get_async_session)):
     """Запустить парсинг всех активных каналов"""
     # Получаем парсер для текущего пользователя
     current_parser = await multi_user_manager.get_current_user_parser(db)
@@ -928,7 +1167,7 @@ async def parse_channels(db: Session = Depends(get_session)):
     return result
 
 @app.post("/api/parse-limited")
-async def parse_channels_limited(db: Session = Depends(get_session)):
+async def parse_channels_limited(db: AsyncSession = Depends(get_async_session)):
     """Запустить ограниченный парсинг (только 5 постов)"""
     # Получаем парсер для текущего пользователя
     current_parser = await multi_user_manager.get_current_user_parser(db)
@@ -972,16 +1211,16 @@ async def parse_single_channel(channel_id: str, db: Session = Depends(get_sessio
             
             if not existing_post:
                 new_post = Post(**post_data)
-                db.add(new_post)
+                add_ingested_post(db, new_post)
                 new_posts += 1
         except Exception as e:
-            print(f"Ошибка при сохранении поста {post_data.get('message_id', 'unknown')}: {e}")
+            logger.warning("Ошибка при сохранении поста %s: %s", post_data.get('message_id', 'unknown'), e, extra={"channel_id": channel_id})
             continue
     
     try:
         db.commit()
     except Exception as e:
-        print(f"Ошибка при коммите в базу данных: {e}")
+        logger.warning("Ошибка при коммите в базу данных: %s", e, extra={"channel_id": channel_id})
         db.rollback()
         # Пытаемся сохранить посты по одному
         new_posts = 0
@@ -994,11 +1233,11 @@ async def parse_single_channel(channel_id: str, db: Session = Depends(get_sessio
                 
                 if not existing_post:
                     new_post = Post(**post_data)
-                    db.add(new_post)
+                    add_ingested_post(db, new_post)
                     db.commit()
                     new_posts += 1
             except Exception as post_error:
-                print(f"Ошибка при сохранении поста {post_data.get('message_id', 'unknown')}: {post_error}")
+                logger.warning("Ошибка при сохранении поста %s: %s", post_data.get('message_id', 'unknown'), post_error, extra={"channel_id": channel_id})
                 db.rollback()
                 continue
     
@@ -1023,60 +1262,40 @@ async def redownload_media(channel_id: str, message_id: int, db: Session = Depen
         raise HTTPException(status_code=401, detail="Не авторизован в Telegram")
     
     try:
-        # Получаем информацию о канале
-        channel_info = await current_parser.get_channel_info(channel_id)
-        if not channel_info:
-            raise HTTPException(status_code=404, detail=f"Канал {channel_id} не найден или недоступен")
-        
-        # Создаем папку для медиа файлов
-        media_dir = os.path.abspath(f"../frontend/public/media/{channel_id.replace('-', '')}")
-        os.makedirs(media_dir, exist_ok=True)
-        
-        # Получаем конкретное сообщение
-        if not current_parser.client.is_connected:
-            await current_parser.client.connect()
-            
-        try:
-            # Используем get_messages для получения конкретного сообщения
-            messages = await current_parser.client.get_messages(channel_id, message_ids=[message_id])
-            if not messages or not messages[0]:
-                raise HTTPException(status_code=404, detail=f"Сообщение {message_id} не найдено")
-            
-            message = messages[0]
+        result = await current_parser.redownload_media(channel_id, message_id)
+        if result["status"] == "not_found":
+            raise HTTPException(status_code=404, detail=result["message"])
+        if result["status"] == "error":
+            raise HTTPException(status_code=500, detail=result["message"])
+        
+        media_info = result["media_info"]
+        if media_info:
+            # Обновляем информацию о медиа в базе данных
+            post = db.query(Post).filter(
+                Post.channel_id == channel_id,
+                Post.message_id == message_id
+            ).first()
             
-            # Пытаемся скачать медиа
-            media_info = await current_parser._parse_media(message, media_dir, channel_id)
+            if post:
+                post.media_type = media_info.get("type")
+                post.media_url = media_info.get("url")
+                post.media_size = media_info.get("size")
+                post.media_filename = media_info.get("filename")
+                post.media_duration = media_info.get("duration")
+                post.media_width = media_info.get("width")
+                post.media_height = media_info.get("height")
+                db.commit()
             
-            if media_info:
-                # Обновляем информацию о медиа в базе данных
-                post = db.query(Post).filter(
-                    Post.channel_id == channel_id,
-                    Post.message_id == message_id
-                ).first()
-                
-                if post:
-                    post.media_type = media_info.get("type")
-                    post.media_url = media_info.get("url")
-                    post.media_size = media_info.get("size")
-                    post.media_filename = media_info.get("filename")
-                    post.media_duration = media_info.get("duration")
-                    post.media_width = media_info.get("width")
-                    post.media_height = media_info.get("height")
-                    db.commit()
-                
-                return {
-                    "status": "success",
-                    "message": f"Медиафайл для сообщения {message_id} успешно скачан",
-                    "media_info": media_info
-                }
-            else:
-                return {
-                    "status": "error", 
-                    "message": f"Не удалось скачать медиафайл для сообщения {message_id}"
-                }
-                
-        except Exception as msg_error:
-            raise HTTPException(status_code=500, detail=f"Ошибка получения сообщения: {str(msg_error)}")
+            return {
+                "status": "success",
+                "message": f"Медиафайл для сообщения {message_id} успешно скачан",
+                "media_info": media_info
+            }
+        else:
+            return {
+                "status": "error", 
+                "message": f"Не удалось скачать медиафайл для сообщения {message_id}"
+            }
             
     except HTTPException:
         raise
@@ -1178,12 +1397,12 @@ async def cleanup_media(db: Session = Depends(get_session)):
         }
 
 @app.post("/api/posts/check-new")
-async def check_and_parse_new_posts(db: Session = Depends(get_session)):
+async def check_and_parse_new_posts(db: AsyncSession = Depends(get_async_session)):
     """Ультра-оптимизированный эндпоинт с предварительной проверкой по дате"""
     return await check_and_parse_new_posts_ultra_optimized(db)
 
 @app.post("/api/posts/parse-more")
-async def parse_more_posts(limit: int = 5, db: Session = Depends(get_session)):
+async def parse_more_posts(limit: int = 5, db: AsyncSession = Depends(get_async_session)):
     """Спарсить еще несколько старых постов со всех активных источников"""
     # Получаем парсер для текущего пользователя
     current_parser = await multi_user_manager.get_current_user_parser(db)
@@ -1196,7 +1415,9 @@ async def parse_more_posts(limit: int = 5, db: Session = Depends(get_session)):
         raise HTTPException(status_code=401, detail="Пользователь не авторизован в Telegram")
     
     # Получаем активные источники
-    sources = db.query(Source).filter(Source.is_active == True).all()
+    sources = (await db.execute(
+        select(Source.channel_id, Source.channel_name).where(Source.is_active == True)
+    )).all()
     if not sources:
         return {"message": "Нет активных источников для парсинга", "new_posts": 0}
     
@@ -1206,7 +1427,9 @@ async def parse_more_posts(limit: int = 5, db: Session = Depends(get_session)):
     for source in sources:
         try:
             # Получаем количество постов в БД для этого канала
-            posts_count = db.query(Post).filter(Post.channel_id == source.channel_id).count()
+            posts_count = await db.scalar(
+                select(func.count()).select_from(Post).where(Post.channel_id == source.channel_id)
+            )
             
             # Парсим с offset равным количеству постов в БД, без ограничений по дате
             result = await current_parser.parse_channel_posts(source.channel_id, limit=limit, offset=posts_count, until_date=None)
@@ -1218,21 +1441,21 @@ async def parse_more_posts(limit: int = 5, db: Session = Depends(get_session)):
                 for post_data in posts_data:
                     try:
                         # Проверяем, не существует ли уже этот пост
-                        existing_post = db.query(Post).filter(
+                        existing_post = (await db.execute(select(Post.id).where(
                             Post.channel_id == post_data["channel_id"],
                             Post.message_id == post_data["message_id"]
-                        ).first()
+                        ))).first()
                         
                         if not existing_post:
                             new_post = Post(**post_data)
-                            db.add(new_post)
+                            add_ingested_post(db, new_post)
                             new_posts += 1
                     except Exception as e:
-                        print(f"Ошибка при сохранении поста {post_data.get('message_id', 'unknown')}: {e}")
+                        logger.warning("Ошибка при сохранении поста %s: %s", post_data.get('message_id', 'unknown'), e, extra={"channel_id": source.channel_id})
                         continue
                 
                 if new_posts > 0:
-                    db.commit()
+                    await db.commit()
                     total_posts += new_posts
                     
                 results.append({
@@ -1263,13 +1486,31 @@ async def parse_more_posts(limit: int = 5, db: Session = Depends(get_session)):
         "parsed_channels": results
     }
 
-# Frontend fallback
-@app.get("/{path:path}", response_class=HTMLResponse)
-async def spa_fallback(path: str):
-    static_file = '../frontend/dist/index.html'
-    if os.path.exists(static_file):
-        return FileResponse(static_file)
-    return HTMLResponse("Frontend not built. Run 'npm run build' in frontend directory.")
+@app.get("/api/diagnostics/queries")
+async def get_query_diagnostics():
+    """SQL по эндпоинтам: среднее и максимум запросов на вызов, подозрения на N+1, медленные запросы"""
+    return query_profiler.report()
+
+@app.delete("/api/diagnostics/queries")
+async def reset_query_diagnostics():
+    """Сбросить накопленную статистику запросов"""
+    query_profiler.reset()
+    return {"message": "Статистика SQL-запросов сброшена"}
+
+@app.get("/api/diagnostics/feed-cache")
+async def get_feed_cache_diagnostics():
+    """Версия и попадания кэша страниц ленты"""
+    return await feed_cache.stats()
+
+@app.get("/api/diagnostics/event-loop")
+async def get_event_loop_diagnostics():
+    """Задержка event loop (p50/p99) и стеки последних блокировок"""
+    return loop_monitor.report()
+
+@app.get("/metrics")
+async def get_metrics():
+    """Метрики в формате Prometheus"""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
 
 @app.get("/api/media-status")
 def get_media_status(db: Session = Depends(get_session)):
@@ -1327,7 +1568,7 @@ def get_media_status(db: Session = Depends(get_session)):
 @app.post("/api/posts/check-new-optimized")
 async def check_and_parse_new_posts_optimized(db: Session = Depends(get_session)):
     """Оптимизированная проверка новых постов - парсим только те, которых нет в БД"""
-    print(f"🔍 Запуск оптимизированной проверки новых постов")
+    logger.info("🔍 Запуск оптимизированной проверки новых постов")
     
     # Получаем парсер для текущего пользователя
     current_parser = await multi_user_manager.get_current_user_parser(db)
@@ -1348,7 +1589,7 @@ async def check_and_parse_new_posts_optimized(db: Session = Depends(get_session)
     parsed_channels = []
     
     for source in active_sources:
-        print(f"🔄 Проверяем канал: {source.channel_name}")
+        logger.debug("🔄 Проверяем канал: %s", source.channel_name, extra={"channel_id": source.channel_id})
         try:
             # Получаем последний пост для этого канала из БД
             last_post_in_db = db.query(Post).filter(
@@ -1358,7 +1599,7 @@ async def check_and_parse_new_posts_optimized(db: Session = Depends(get_session)
             last_message_id_in_db = last_post_in_db.message_id if last_post_in_db else 0
             last_date_in_db = last_post_in_db.post_date if last_post_in_db else None
             
-            print(f"📊 Последний пост в БД для {source.channel_name}: message_id={last_message_id_in_db}, дата={last_date_in_db}")
+            logger.debug("📊 Последний пост в БД для %s: message_id=%s, дата=%s", source.channel_name, last_message_id_in_db, last_date_in_db, extra={"channel_id": source.channel_id})
             
             # Проверяем, есть ли новые посты (парсим небольшое количество для проверки)
             check_limit = 20  # Проверяем 20 последних постов из канала
@@ -1369,11 +1610,11 @@ async def check_and_parse_new_posts_optimized(db: Session = Depends(get_session)
             )
             
             if result["status"] == "error":
-                print(f"❌ Ошибка парсинга канала {source.channel_name}: {result['message']}")
+                logger.warning("❌ Ошибка парсинга канала %s: %s", source.channel_name, result['message'], extra={"channel_id": source.channel_id})
                 continue
             
             posts_data = result.get("posts", [])
-            print(f"📝 Получено {len(posts_data)} постов для проверки из {source.channel_name}")
+            logger.debug("📝 Получено %s постов для проверки из %s", len(posts_data), source.channel_name, extra={"channel_id": source.channel_id})
             
             # Фильтруем только действительно новые посты
             new_posts_data = []
@@ -1393,19 +1634,19 @@ async def check_and_parse_new_posts_optimized(db: Session = Depends(get_session)
                 
                 if not existing_post:
                     new_posts_data.append(post_data)
-                    print(f"  ✅ Новый пост найден: message_id={message_id}, дата={post_date}")
+                    logger.debug("  ✅ Новый пост найден: message_id=%s, дата=%s", message_id, post_date, extra={"channel_id": source.channel_id})
                 else:
-                    print(f"  ⚠️ Пост {message_id} уже существует в БД")
+                    logger.debug("  ⚠️ Пост %s уже существует в БД", message_id, extra={"channel_id": source.channel_id})
             
             # Сохраняем только новые посты
             channel_new_posts = 0
             for post_data in new_posts_data:
                 try:
                     new_post = Post(**post_data)
-                    db.add(new_post)
+                    add_ingested_post(db, new_post)
                     channel_new_posts += 1
                 except Exception as e:
-                    print(f"❌ Ошибка при сохранении поста {post_data.get('message_id')}: {e}")
+                    logger.warning("❌ Ошибка при сохранении поста %s: %s", post_data.get('message_id'), e, extra={"channel_id": source.channel_id})
                     continue
             
             if channel_new_posts > 0:
@@ -1416,15 +1657,15 @@ async def check_and_parse_new_posts_optimized(db: Session = Depends(get_session)
                         "channel_name": source.channel_name,
                         "new_posts": channel_new_posts
                     })
-                    print(f"✅ Сохранено {channel_new_posts} новых постов для канала {source.channel_name}")
+                    logger.info("✅ Сохранено %s новых постов для канала %s", channel_new_posts, source.channel_name, extra={"channel_id": source.channel_id})
                 except Exception as e:
-                    print(f"❌ Ошибка при коммите для канала {source.channel_name}: {e}")
+                    logger.warning("❌ Ошибка при коммите для канала %s: %s", source.channel_name, e, extra={"channel_id": source.channel_id})
                     db.rollback()
             else:
-                print(f"📭 Новых постов не найдено для канала {source.channel_name}")
+                logger.debug("📭 Новых постов не найдено для канала %s", source.channel_name, extra={"channel_id": source.channel_id})
                 
         except Exception as e:
-            print(f"❌ Ошибка при проверке канала {source.channel_name}: {e}")
+            logger.warning("❌ Ошибка при проверке канала %s: %s", source.channel_name, e, extra={"channel_id": source.channel_id})
             continue
     
     message = f"Оптимизированная проверка завершена. Найдено {total_new_posts} новых постов"
@@ -1439,9 +1680,9 @@ async def check_and_parse_new_posts_optimized(db: Session = Depends(get_session)
     }
 
 @app.post("/api/posts/check-new-ultra-optimized")
-async def check_and_parse_new_posts_ultra_optimized(db: Session = Depends(get_session)):
+async def check_and_parse_new_posts_ultra_optimized(db: AsyncSession = Depends(get_async_session)):
     """Ультра-оптимизированная проверка новых постов с быстрой предварительной проверкой по дате"""
-    print(f"🚀 Запуск УЛЬТРА-оптимизированной проверки новых постов")
+    logger.info("🚀 Запуск УЛЬТРА-оптимизированной проверки новых постов")
     
     # Получаем парсер для текущего пользователя
     current_parser = await multi_user_manager.get_current_user_parser(db)
@@ -1454,7 +1695,9 @@ async def check_and_parse_new_posts_ultra_optimized(db: Session = Depends(get_se
         raise HTTPException(status_code=401, detail="Не авторизован в Telegram")
     
     # Получаем активные источники
-    active_sources = db.query(Source).filter(Source.is_active == True).all()
+    active_sources = (await db.execute(
+        select(Source.channel_id, Source.channel_name).where(Source.is_active == True)
+    )).all()
     if not active_sources:
         return {"message": "Нет активных источников", "new_posts": 0}
     
@@ -1462,19 +1705,47 @@ async def check_and_parse_new_posts_ultra_optimized(db: Session = Depends(get_se
     parsed_channels = []
     channels_to_parse = []  # Только каналы с новыми постами
     
-    print(f"📊 Этап 1: Быстрая проверка {len(active_sources)} каналов по дате...")
+    logger.info("📊 Этап 1: Пакетная проверка %s каналов по списку диалогов...", len(active_sources))
+    
+    # Водяные знаки из БД одним запросом: последний message_id и дата по каждому каналу
+    watermark_rows = (await db.execute(
+        select(
+            Post.channel_id,
+            func.max(Post.message_id),
+            func.max(Post.post_date)
+        ).where(
+            Post.channel_id.in_([source.channel_id for source in active_sources])
+        ).group_by(Post.channel_id)
+    )).all()
+    last_ids_in_db = {row[0]: row[1] for row in watermark_rows}
+    last_dates_in_db = {row[0]: row[2] for row in watermark_rows}
+    sources_by_channel = {source.channel_id: source for source in active_sources}
+    
+    # ЭТАП 1: Сравниваем top-сообщения диалогов с БД (несколько запросов на все каналы)
+    bulk_result = await current_parser.bulk_check_new_posts({
+        source.channel_id: last_ids_in_db.get(source.channel_id) for source in active_sources
+    })
+    
+    if bulk_result["status"] == "success":
+        for channel_id, latest_info in bulk_result["changed"].items():
+            source = sources_by_channel[channel_id]
+            logger.debug("✅ %s: НАЙДЕНЫ новые посты!", source.channel_name, extra={"channel_id": source.channel_id})
+            channels_to_parse.append({
+                "source": source,
+                "last_date_in_db": last_dates_in_db.get(channel_id),
+                "latest_info": latest_info
+            })
+        # Каналы, которых нет в диалогах (не подписаны или в архиве), проверяем по одному
+        fallback_sources = [sources_by_channel[channel_id] for channel_id in bulk_result["missing"]]
+    else:
+        logger.warning("⚠️ Пакетная проверка не удалась: %s, проверяем каналы по одному", bulk_result['message'])
+        fallback_sources = active_sources
     
-    # ЭТАП 1: Быстрая проверка всех каналов по дате (экономим время)
-    for source in active_sources:
+    for source in fallback_sources:
         try:
-            # Получаем последний пост для этого канала из БД
-            last_post_in_db = db.query(Post).filter(
-                Post.channel_id == source.channel_id
-            ).order_by(Post.post_date.desc()).first()
-            
-            last_date_in_db = last_post_in_db.post_date if last_post_in_db else None
+            last_date_in_db = last_dates_in_db.get(source.channel_id)
             
-            print(f"📅 Последний пост в БД для {source.channel_name}: дата={last_date_in_db}")
+            logger.debug("📅 Последний пост в БД для %s: дата=%s", source.channel_name, last_date_in_db, extra={"channel_id": source.channel_id})
             
             # Быстрая проверка только по дате
             check_result = await current_parser.quick_check_new_posts(
@@ -1483,17 +1754,17 @@ async def check_and_parse_new_posts_ultra_optimized(db: Session = Depends(get_se
             )
             
             if check_result["status"] == "success" and check_result.get("has_new_posts", False):
-                print(f"✅ {source.channel_name}: НАЙДЕНЫ новые посты!")
+                logger.debug("✅ %s: НАЙДЕНЫ новые посты!", source.channel_name, extra={"channel_id": source.channel_id})
                 channels_to_parse.append({
                     "source": source,
                     "last_date_in_db": last_date_in_db,
                     "latest_info": check_result
                 })
             else:
-                print(f"📭 {source.channel_name}: новых постов НЕТ")
+                logger.debug("📭 %s: новых постов НЕТ", source.channel_name, extra={"channel_id": source.channel_id})
                 
         except Exception as e:
-            print(f"❌ Ошибка быстрой проверки канала {source.channel_name}: {e}")
+            logger.warning("❌ Ошибка быстрой проверки канала %s: %s", source.channel_name, e, extra={"channel_id": source.channel_id})
             # В случае ошибки проверки, добавляем канал для полного парсинга
             channels_to_parse.append({
                 "source": source,
@@ -1501,7 +1772,7 @@ async def check_and_parse_new_posts_ultra_optimized(db: Session = Depends(get_se
                 "latest_info": None
             })
     
-    print(f"🎯 Этап 1 завершен: {len(channels_to_parse)} из {len(active_sources)} каналов имеют новые посты")
+    logger.info("🎯 Этап 1 завершен: %s из %s каналов имеют новые посты", len(channels_to_parse), len(active_sources))
     
     if not channels_to_parse:
         return {
@@ -1509,25 +1780,27 @@ async def check_and_parse_new_posts_ultra_optimized(db: Session = Depends(get_se
             "new_posts": 0,
             "checked_channels": len(active_sources),
             "channels_with_new_posts": 0,
-            "optimization": "ultra-enabled"
+            "optimization": "ultra-enabled",
+            "bulk_check_requests": bulk_result.get("requests"),
+            "fallback_checks": len(fallback_sources)
         }
     
-    print(f"📥 Этап 2: Полный парсинг только каналов с новыми постами...")
+    logger.info("📥 Этап 2: Полный парсинг только каналов с новыми постами...")
     
     # ЭТАП 2: Полный парсинг только каналов с новыми постами
     for channel_info in channels_to_parse:
         source = channel_info["source"]
         last_date_in_db = channel_info["last_date_in_db"]
         
-        print(f"🔄 Парсим канал с новыми постами: {source.channel_name}")
+        logger.debug("🔄 Парсим канал с новыми постами: %s", source.channel_name, extra={"channel_id": source.channel_id})
         
         try:
             # Получаем последний message_id из БД для более точной фильтрации
-            last_post_in_db = db.query(Post).filter(
-                Post.channel_id == source.channel_id
-            ).order_by(Post.post_date.desc()).first()
-            
-            last_message_id_in_db = last_post_in_db.message_id if last_post_in_db else 0
+            last_message_id_in_db = await db.scalar(
+                select(Post.message_id).where(
+                    Post.channel_id == source.channel_id
+                ).order_by(Post.post_date.desc()).limit(1)
+            ) or 0
             
             # Парсим с ограничением по дате
             check_limit = 20  # Проверяем больше постов, так как знаем что есть новые
@@ -1538,11 +1811,11 @@ async def check_and_parse_new_posts_ultra_optimized(db: Session = Depends(get_se
             )
             
             if result["status"] == "error":
-                print(f"❌ Ошибка парсинга канала {source.channel_name}: {result['message']}")
+                logger.warning("❌ Ошибка парсинга канала %s: %s", source.channel_name, result['message'], extra={"channel_id": source.channel_id})
                 continue
             
             posts_data = result.get("posts", [])
-            print(f"📝 Получено {len(posts_data)} постов для обработки из {source.channel_name}")
+            logger.debug("📝 Получено %s постов для обработки из %s", len(posts_data), source.channel_name, extra={"channel_id": source.channel_id})
             
             # Фильтруем только действительно новые посты
             channel_new_posts = 0
@@ -1555,43 +1828,43 @@ async def check_and_parse_new_posts_ultra_optimized(db: Session = Depends(get_se
                     continue
                 
                 # Дополнительная проверка в БД
-                existing_post = db.query(Post).filter(
+                existing_post = (await db.execute(select(Post.id).where(
                     Post.channel_id == post_data["channel_id"],
                     Post.message_id == message_id
-                ).first()
+                ))).first()
                 
                 if not existing_post:
                     try:
                         new_post = Post(**post_data)
-                        db.add(new_post)
+                        add_ingested_post(db, new_post)
                         channel_new_posts += 1
-                        print(f"  ✅ Добавлен новый пост: message_id={message_id}, дата={post_date}")
+                        logger.debug("  ✅ Добавлен новый пост: message_id=%s, дата=%s", message_id, post_date, extra={"channel_id": source.channel_id})
                     except Exception as e:
-                        print(f"❌ Ошибка при сохранении поста {message_id}: {e}")
+                        logger.warning("❌ Ошибка при сохранении поста %s: %s", message_id, e, extra={"channel_id": source.channel_id})
                         continue
                 else:
-                    print(f"  ⚠️ Пост {message_id} уже существует в БД")
+                    logger.debug("  ⚠️ Пост %s уже существует в БД", message_id, extra={"channel_id": source.channel_id})
             
             if channel_new_posts > 0:
                 try:
-                    db.commit()
+                    await db.commit()
                     total_new_posts += channel_new_posts
                     parsed_channels.append({
                         "channel_name": source.channel_name,
                         "new_posts": channel_new_posts
                     })
-                    print(f"✅ Сохранено {channel_new_posts} новых постов для канала {source.channel_name}")
+                    logger.info("✅ Сохранено %s новых постов для канала %s", channel_new_posts, source.channel_name, extra={"channel_id": source.channel_id})
                 except Exception as e:
-                    print(f"❌ Ошибка при коммите для канала {source.channel_name}: {e}")
-                    db.rollback()
+                    logger.warning("❌ Ошибка при коммите для канала %s: %s", source.channel_name, e, extra={"channel_id": source.channel_id})
+                    await db.rollback()
             else:
-                print(f"📭 После фильтрации новых постов не найдено для канала {source.channel_name}")
+                logger.debug("📭 После фильтрации новых постов не найдено для канала %s", source.channel_name, extra={"channel_id": source.channel_id})
                 
         except Exception as e:
-            print(f"❌ Ошибка при парсинге канала {source.channel_name}: {e}")
+            logger.warning("❌ Ошибка при парсинге канала %s: %s", source.channel_name, e, extra={"channel_id": source.channel_id})
             continue
     
-    print(f"🎯 Этап 2 завершен: обработано {len(channels_to_parse)} каналов")
+    logger.info("🎯 Этап 2 завершен: обработано %s каналов", len(channels_to_parse))
     
     message = f"Ультра-оптимизированная проверка завершена. Найдено {total_new_posts} новых постов"
     if total_new_posts == 0:
@@ -1607,6 +1880,16 @@ async def check_and_parse_new_posts_ultra_optimized(db: Session = Depends(get_se
         "performance": {
             "quick_check_completed": True,
             "full_parse_only_needed_channels": True,
+            "bulk_check_requests": bulk_result.get("requests"),
+            "fallback_checks": len(fallback_sources),
             "time_saved": f"Проверили {len(active_sources)} каналов, парсили только {len(channels_to_parse)}"
         }
-    }
\ No newline at end of file
+    }
+
+# Frontend fallback - регистрируется последним, иначе перехватывает объявленные ниже GET-эндпоинты API
+@app.get("/{path:path}", response_class=HTMLResponse)
+async def spa_fallback(path: str):
+    static_file = '../frontend/dist/index.html'
+    if os.path.exists(static_file):
+        return FileResponse(static_file)
+    return HTMLResponse("Frontend not built. Run 'npm run build' in frontend directory.")
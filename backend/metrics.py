@@ -0,0 +1,258 @@
+import time
+import bisect
+import threading
+from typing import Callable, Dict, List, Sequence, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session as OrmSession
+
+# Метрики в текстовом формате Prometheus без внешних зависимостей.
+# Обновление - словарь и счетчик под локом, поэтому их можно держать включенными в проде.
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+def _format_labels(labelnames: Sequence[str], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels: Sequence) -> Tuple[str, ...]:
+        return tuple(str(value) for value in labels)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"] + self._samples()
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels, amount: float = 1):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {value}" for key, value in items]
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values: Dict[Tuple[str, ...], list] = {}  # key -> [счетчики по бакетам..., sum, count]
+
+    def observe(self, value: float, *labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                state[index] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = [(key, list(state)) for key, state in self._values.items()]
+        lines = []
+        for key, state in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                bucket_labels = _format_labels(self.labelnames, key, 'le="%s"' % bound)
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            inf_labels = _format_labels(self.labelnames, key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{inf_labels} {state[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {state[-2]}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {state[-1]}")
+        return lines
+
+class Gauge(_Metric):
+    """Значение считывается функцией в момент выгрузки (глубина очередей и т.п.)"""
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, callback: Callable[[], float]):
+        super().__init__(name, documentation)
+        self.callback = callback
+
+    def _samples(self) -> List[str]:
+        try:
+            return [f"{self.name} {float(self.callback())}"]
+        except Exception:
+            return []
+
+REGISTRY: List[_Metric] = []
+
+def render() -> str:
+    """Все метрики в формате Prometheus text exposition"""
+    return "\n".join(line for metric in REGISTRY for line in metric.render()) + "\n"
+
+# === Метрики приложения ===
+
+TELEGRAM_RPC_SECONDS = Histogram(
+    "telegram_rpc_duration_seconds", "Длительность вызовов Telegram API по методу", ["method"]
+)
+TELEGRAM_RPC_ERRORS = Counter(
+    "telegram_rpc_errors_total", "Ошибки вызовов Telegram API", ["method", "error"]
+)
+TELEGRAM_FLOOD_WAITS = Counter(
+    "telegram_flood_wait_total", "FloodWait от Telegram по методу", ["method"]
+)
+TELEGRAM_FLOOD_WAIT_SLEPT = Counter(
+    "telegram_flood_wait_sleep_seconds_total", "Сколько секунд проспали из-за FloodWait"
+)
+MESSAGES_SCANNED = Counter(
+    "ingest_messages_scanned_total", "Просмотрено сообщений при парсинге канала", ["channel_id"]
+)
+POSTS_INSERTED = Counter(
+    "ingest_posts_inserted_total", "Сохранено новых постов в БД", ["channel_id"]
+)
+MEDIA_DOWNLOAD_SECONDS = Histogram(
+    "media_download_duration_seconds", "Длительность скачивания медиа по типу", ["media_type"],
+    buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300),
+)
+MEDIA_DOWNLOAD_BYTES = Counter(
+    "media_download_bytes_total", "Скачано байт медиа по типу", ["media_type"]
+)
+MEDIA_DOWNLOAD_ERRORS = Counter(
+    "media_download_errors_total", "Неудачные скачивания медиа по типу", ["media_type"]
+)
+DB_QUERY_SECONDS = Histogram(
+    "db_query_duration_seconds", "Длительность SQL-запросов по типу", ["operation"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "Длительность HTTP-запросов по эндпоинту", ["method", "route", "status"]
+)
+
+def register_gauge(name: str, documentation: str, callback: Callable[[], float]) -> Gauge:
+    return Gauge(name, documentation, callback)
+
+# === Инструментирование ===
+
+def instrument_pyrogram(client_class):
+    """Оборачивает Client.invoke: все методы pyrogram идут через него"""
+    from pyrogram.errors import FloodWait
+
+    if getattr(client_class.invoke, "_instrumented", False):
+        return
+    original_invoke = client_class.invoke
+
+    async def invoke(self, query, *args, **kwargs):
+        method = type(query).__name__
+        started = time.perf_counter()
+        try:
+            return await original_invoke(self, query, *args, **kwargs)
+        except FloodWait:
+            TELEGRAM_FLOOD_WAITS.inc(method)
+            raise
+        except Exception as e:
+            TELEGRAM_RPC_ERRORS.inc(method, type(e).__name__)
+            raise
+        finally:
+            TELEGRAM_RPC_SECONDS.observe(time.perf_counter() - started, method)
+
+    invoke._instrumented = True
+    client_class.invoke = invoke
+
+def instrument_engine(engine):
+    """Замер длительности SQL-запросов через события движка"""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        context._metrics_started = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, "_metrics_started", None)
+        if started is not None:
+            operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "OTHER"
+            DB_QUERY_SECONDS.observe(time.perf_counter() - started, operation)
+
+def add_ingested_post(session, post):
+    """
+    Добавляет в сессию пост, полученный парсером или ботом. В ingest_posts_inserted_total
+    он попадет после коммита сессии: прочие вставки Post (импорт, фикстуры, тесты) не считаются.
+    """
+    session.add(post)
+    pending = getattr(session, "sync_session", session).info.setdefault("_ingested_posts", {})
+    pending[post.channel_id] = pending.get(post.channel_id, 0) + 1
+
+def _count_ingested_commits():
+    @event.listens_for(OrmSession, "after_commit")
+    def after_commit(session):
+        for channel_id, count in session.info.pop("_ingested_posts", {}).items():
+            POSTS_INSERTED.inc(channel_id, amount=count)
+
+    @event.listens_for(OrmSession, "after_rollback")
+    def after_rollback(session):
+        session.info.pop("_ingested_posts", None)
+
+_count_ingested_commits()
+
+_route_paths: Dict[object, str] = {}
+
+def route_template(scope) -> str:
+    """Шаблон пути эндпоинта (/api/posts/{post_id}), а не конкретный URL - иначе метки не ограничены"""
+    endpoint = scope.get("endpoint")
+    if endpoint is None:
+        return "unmatched"
+    path = _route_paths.get(endpoint)
+    if path is None:
+        router = scope["app"].router
+        for route in router.routes:
+            if getattr(route, "endpoint", None) is endpoint:
+                path = route.path
+                break
+        _route_paths[endpoint] = path = path or "unknown"
+    return path
+
+class MetricsMiddleware:
+    """ASGI-middleware: длительность запросов по шаблону пути (а не по конкретному URL)"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        started = time.perf_counter()
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_REQUEST_SECONDS.observe(
+                time.perf_counter() - started, scope["method"], route_template(scope), status["code"]
+            )
@@ -2,6 +2,7 @@ from datetime import datetime
 from sqlalchemy import Column, Integer, String, DateTime, Text, Boolean
 from sqlalchemy.orm import relationship
 from db import Base
+from feed_cache import feed_cache
 
 class User(Base):
     """Пользователи системы с их Telegram сессиями"""
@@ -58,6 +59,48 @@ class SelectedPost(Base):
     post_id = Column(Integer)  # Ссылка на Post.id
     original_text = Column(Text)  # Оригинальный текст
     edited_text = Column(Text, nullable=True)  # Отредактированный текст
-    status = Column(String, default="draft")  # draft, ready, published
+    status = Column(String, default="draft")  # draft, ready, published, failed
     selected_at = Column(DateTime, default=datetime.utcnow)
-    notes = Column(Text, nullable=True)  # Заметки
\ No newline at end of file
+    notes = Column(Text, nullable=True)  # Заметки
+    target_channel_id = Column(String, nullable=True)  # Канал, куда публиковать
+    publish_at = Column(DateTime, nullable=True, index=True)  # Время публикации (UTC)
+    published_at = Column(DateTime, nullable=True)  # Когда фактически опубликован
+    published_message_id = Column(Integer, nullable=True)  # ID сообщения в целевом канале
+    publish_attempts = Column(Integer, default=0)  # Количество неудачных попыток публикации
+    publish_error = Column(Text, nullable=True)  # Последняя ошибка публикации
+
+class MediaFileCache(Base):
+    """Telegram file_id для уже загруженных ботом локальных медиафайлов"""
+    __tablename__ = "media_file_cache"
+
+    id = Column(Integer, primary_key=True)
+    local_path = Column(String, unique=True, index=True)  # Абсолютный путь к файлу
+    file_size = Column(Integer)  # Размер файла при загрузке
+    file_mtime = Column(Integer)  # Время изменения файла при загрузке
+    media_type = Column(String)  # photo, video, animation
+    file_id = Column(String)  # file_id, который вернул Telegram
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class RewriteCache(Base):
+    """Кэш результатов AI-переписывания текстов"""
+    __tablename__ = "rewrite_cache"
+
+    id = Column(Integer, primary_key=True)
+    cache_key = Column(String, unique=True, index=True)  # sha256 от версии промпта, модели, параметров и текста
+    kind = Column(String)  # rewrite, condense
+    model = Column(String)  # Модель, которой получен результат
+    prompt_version = Column(String)  # Версия промпта
+    result = Column(Text)  # Ответ модели
+    hits = Column(Integer, default=0)  # Сколько раз результат взят из кэша
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+    last_used_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+class FeedVersion(Base):
+    """Номер версии ленты - общий для всех процессов ключ кэша страниц ленты"""
+    __tablename__ = "feed_version"
+
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, default=0)  # Растет при каждом коммите в posts/sources/selected_posts
+
+# Версия ленты для кэша страниц (строка создается вместе с таблицей)
+feed_cache.track_version(FeedVersion.__table__)
@@ -1,13 +1,16 @@
 import os
+import time
 import asyncio
 from datetime import datetime
-from typing import Dict, Optional
+from typing import Dict, Optional, Union
 from pyrogram import Client
 from pyrogram.errors import SessionPasswordNeeded, PhoneCodeInvalid, PhoneCodeExpired
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-from telegram_parser import TelegramParser
-from models import User
+from telegram_parser import TelegramParser, auth_cache, quick_check_cache
+from models import User, Source
 
 class MultiUserTelegramManager:
     """Менеджер для работы с несколькими пользователями Telegram"""
@@ -16,6 +19,7 @@ class MultiUserTelegramManager:
         self.user_parsers: Dict[str, TelegramParser] = {}  # phone_number -> TelegramParser
         self.api_id = os.getenv('TELEGRAM_API_ID')
         self.api_hash = os.getenv('TELEGRAM_API_HASH')
+        self.last_warm_up: Optional[dict] = None  # Отчет о последнем прогреве сессий
         
     def get_session_name(self, phone_number: str) -> str:
         """Генерирует имя файла сессии для пользователя"""
@@ -36,13 +40,18 @@ class MultiUserTelegramManager:
             
         return self.user_parsers[phone_number]
     
-    async def get_current_user_parser(self, db: Session) -> Optional[TelegramParser]:
+    async def get_current_user_parser(self, db: Union[Session, AsyncSession]) -> Optional[TelegramParser]:
         """Получает парсер для текущего авторизованного пользователя"""
         # Ищем любого активного пользователя с последним логином
-        user = db.query(User).filter(
+        query = select(User).where(
             User.is_active == True,
             User.last_login.isnot(None)
-        ).order_by(User.last_login.desc()).first()
+        ).order_by(User.last_login.desc()).limit(1)
+        # Вызывается и из синхронных, и из асинхронных эндпоинтов
+        if isinstance(db, AsyncSession):
+            user = (await db.execute(query)).scalars().first()
+        else:
+            user = db.execute(query).scalars().first()
         
         if user:
             return await self.get_parser_for_user(user.phone_number)
@@ -175,6 +184,85 @@ class MultiUserTelegramManager:
         except Exception as e:
             print(f"❌ Ошибка очистки неактивных сессий: {e}")
     
+    async def warm_up(self, db: Session) -> dict:
+        """
+        Прогрев при старте: параллельно подключает всех пользователей с файлом сессии
+        и заранее резолвит каналы-источники, чтобы первый запрос после рестарта не платил за это
+        """
+        started = time.perf_counter()
+        users = [
+            user for user in db.query(User).filter(User.is_active == True).all()
+            if user.session_file and os.path.exists(user.session_file)
+        ]
+        channel_ids = [row[0] for row in db.query(Source.channel_id).filter(Source.is_active == True).all()]
+        print(f"🔥 Прогрев {len(users)} сессий и {len(channel_ids)} источников...")
+
+        results = await asyncio.gather(
+            *[self._warm_up_user(user.phone_number, channel_ids) for user in users]
+        )
+
+        self.last_warm_up = {
+            "finished_at": datetime.utcnow().isoformat(),
+            "total_ms": round((time.perf_counter() - started) * 1000),
+            "users": results,
+        }
+        print(f"🔥 Прогрев завершен за {self.last_warm_up['total_ms']} мс")
+        return self.last_warm_up
+
+    async def _warm_up_user(self, phone_number: str, channel_ids: list) -> dict:
+        """Подключает одного пользователя и резолвит источники, замеряя каждый этап"""
+        timings = {}
+        report = {"phone_number": phone_number, "authorized": False, "timings_ms": timings, "error": None}
+        stage_started = time.perf_counter()
+
+        def mark(stage: str):
+            nonlocal stage_started
+            now = time.perf_counter()
+            timings[stage] = round((now - stage_started) * 1000)
+            stage_started = now
+
+        try:
+            parser = await self.get_parser_for_user(phone_number)
+            await parser.initialize_client()
+            mark("client_init")
+
+            if not parser.client.is_connected:
+                await parser.client.connect()
+            mark("connect")
+
+            report["authorized"] = await parser.is_authorized()
+            mark("auth")
+            if not report["authorized"]:
+                return report
+
+            # Резолв пиров заполняет кэш сессии - дальше запросы к каналам не тратят на это время
+            semaphore = asyncio.Semaphore(5)
+            failed = []
+
+            async def resolve(channel_id: str):
+                async with semaphore:
+                    try:
+                        peer = int(channel_id) if channel_id.lstrip('-').isdigit() else channel_id
+                        await parser.client.resolve_peer(peer)
+                    except Exception as e:
+                        failed.append({"channel_id": channel_id, "error": str(e)})
+
+            await asyncio.gather(*[resolve(channel_id) for channel_id in channel_ids])
+            mark("resolve_peers")
+            report["resolved_peers"] = len(channel_ids) - len(failed)
+            report["failed_peers"] = failed
+        except Exception as e:
+            print(f"⚠️ Ошибка прогрева сессии {phone_number}: {e}")
+            report["error"] = str(e)
+        return report
+
+    async def get_warm_up_report(self) -> Optional[dict]:
+        return self.last_warm_up
+
+    async def get_cache_stats(self) -> list:
+        """Статистика общих кэшей парсеров"""
+        return [auth_cache.stats(), quick_check_cache.stats()]
+
     async def stop_all(self):
         """Останавливает всех парсеров"""
         for phone_number, parser in self.user_parsers.items():
@@ -1,9 +1,19 @@
-import os, logging, openai, html
+import os, asyncio, logging, html, re, json, hashlib
+from typing import AsyncIterator
+from datetime import datetime, timedelta
 from dotenv import load_dotenv
 
+from db import SessionLocal
+from models import RewriteCache
+from llm_client import llm_client
+
 load_dotenv()
 
-openai.api_key = os.getenv('OPENAI_API_KEY')
+REWRITE_MODEL = 'gpt-4o-mini'
+
+# Версия промптов: меняйте при любой правке REWRITE_PROMPT / CONDENSE_PROMPT,
+# чтобы старые закэшированные ответы не выдавались для нового промпта
+PROMPT_VERSION = '1'
 
 REWRITE_PROMPT = (
     "Перепиши немного пост своими словами не меняя его сути, сохраняя теги <b>,<i>,<u>,<s>,<tg-spoiler>,<a>,<code>,<pre>,<blockquote>. "
@@ -13,36 +23,189 @@ CONDENSE_PROMPT = (
     "Сократи текст до лимита, сохранив основную мысль и ссылки."
 )
 
-async def rewrite(html_text: str, truncate: int | None = None) -> str:
+# Настройки кэша переписываний
+REWRITE_CACHE_TTL = timedelta(days=int(os.getenv('REWRITE_CACHE_TTL_DAYS', '30')))
+REWRITE_CACHE_MAX_ENTRIES = int(os.getenv('REWRITE_CACHE_MAX_ENTRIES', '5000'))
+
+def _normalize_text(text: str) -> str:
+    """Нормализует текст, чтобы одинаковые посты (в т.ч. репосты) давали один ключ"""
+    text = html.unescape(text).replace('\r\n', '\n').replace('\r', '\n')
+    lines = [re.sub(r'[ \t\u00a0]+', ' ', line).strip() for line in text.split('\n')]
+    return re.sub(r'\n{3,}', '\n\n', '\n'.join(lines)).strip()
+
+def _cache_key(kind: str, model: str, params: dict, text: str) -> str:
+    """Ключ кэша: версия промпта, модель, параметры и хэш нормализованного текста"""
+    payload = json.dumps({
+        "kind": kind,
+        "prompt_version": PROMPT_VERSION,
+        "model": model,
+        "params": params,
+        "input": hashlib.sha256(_normalize_text(text).encode('utf-8')).hexdigest(),
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def _cache_get(key: str) -> str | None:
+    """Достает результат из кэша, если он не устарел"""
+    db = SessionLocal()
+    try:
+        entry = db.query(RewriteCache).filter(RewriteCache.cache_key == key).first()
+        if not entry:
+            return None
+        now = datetime.utcnow()
+        if entry.created_at and now - entry.created_at > REWRITE_CACHE_TTL:
+            db.delete(entry)
+            db.commit()
+            return None
+        entry.hits = (entry.hits or 0) + 1
+        entry.last_used_at = now
+        db.commit()
+        return entry.result
+    except Exception as e:
+        logging.warning(f"Rewrite cache read failed: {e}")
+        db.rollback()
+        return None
+    finally:
+        db.close()
+
+def _cache_put(key: str, kind: str, model: str, result: str):
+    """Сохраняет результат в кэш и вытесняет устаревшие/самые старые записи"""
+    db = SessionLocal()
+    try:
+        now = datetime.utcnow()
+        entry = db.query(RewriteCache).filter(RewriteCache.cache_key == key).first()
+        if entry:
+            entry.result = result
+            entry.created_at = now
+            entry.last_used_at = now
+        else:
+            db.add(RewriteCache(
+                cache_key=key,
+                kind=kind,
+                model=model,
+                prompt_version=PROMPT_VERSION,
+                result=result,
+                created_at=now,
+                last_used_at=now,
+            ))
+        db.flush()
+
+        # Удаляем записи с истекшим TTL
+        db.query(RewriteCache).filter(
+            RewriteCache.created_at < now - REWRITE_CACHE_TTL
+        ).delete(synchronize_session=False)
+
+        # Ограничиваем размер кэша: вытесняем давно не использованные записи
+        total = db.query(RewriteCache).count()
+        if total > REWRITE_CACHE_MAX_ENTRIES:
+            stale_ids = [
+                row[0] for row in db.query(RewriteCache.id)
+                .order_by(RewriteCache.last_used_at.asc())
+                .limit(total - REWRITE_CACHE_MAX_ENTRIES)
+                .all()
+            ]
+            db.query(RewriteCache).filter(
+                RewriteCache.id.in_(stale_ids)
+            ).delete(synchronize_session=False)
+
+        db.commit()
+    except Exception as e:
+        logging.warning(f"Rewrite cache write failed: {e}")
+        db.rollback()
+    finally:
+        db.close()
+
+# Синхронные сессии SQLAlchemy - в пуле потоков, чтобы чтение и запись кэша не блокировали event loop
+async def _cache_get_async(key: str) -> str | None:
+    return await asyncio.to_thread(_cache_get, key)
+
+async def _cache_put_async(key: str, kind: str, model: str, result: str):
+    await asyncio.to_thread(_cache_put, key, kind, model, result)
+
+def _chat_cache_key(kind: str, text: str, max_tokens: int, temperature: float) -> str:
+    return _cache_key(kind, REWRITE_MODEL, {"max_tokens": max_tokens, "temperature": temperature}, text)
+
+async def _cached_chat(kind: str, system_prompt: str, text: str, max_tokens: int, temperature: float) -> str:
+    """Запрос к chat API с кэшированием ответа по содержимому"""
+    key = _chat_cache_key(kind, text, max_tokens, temperature)
+    cached = await _cache_get_async(key)
+    if cached is not None:
+        return cached
+
+    out = await llm_client.chat(
+        model=REWRITE_MODEL,
+        messages=[
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": text}
+        ],
+        max_tokens=max_tokens,
+        temperature=temperature,
+    )
+    await _cache_put_async(key, kind, REWRITE_MODEL, out)
+    return out
+
+async def rewrite(html_text: str, truncate: int | None = None, raise_errors: bool = False) -> str:
     if not html_text:
         return ''
     try:
-        chat = await openai.chat.completions.acreate(
-            model='gpt-4o-mini',
-            messages=[
-                {"role": "system", "content": REWRITE_PROMPT},
-                {"role": "user", "content": html.unescape(html_text)}
-            ],
-            max_tokens=800,
-            temperature=0.7,
-        )
-        out = chat.choices[0].message.content.strip()
+        out = await _cached_chat('rewrite', REWRITE_PROMPT, html.unescape(html_text), 800, 0.7)
         if truncate and len(out) > truncate:
-            chat2 = await openai.chat.completions.acreate(
-                model='gpt-4o-mini',
-                messages=[
-                    {"role": "system", "content": CONDENSE_PROMPT},
-                    {"role": "user", "content": out}
-                ],
-                max_tokens=800,
-                temperature=0.4,
-            )
-            out = chat2.choices[0].message.content.strip()
+            out = await _cached_chat('condense', CONDENSE_PROMPT, out, 800, 0.4)
         return out
     except Exception as e:
         logging.exception(e)
+        if raise_errors:
+            raise
         return html_text
 
+async def _cached_chat_stream(kind: str, system_prompt: str, text: str, max_tokens: int, temperature: float) -> AsyncIterator[str]:
+    """Потоковый запрос к chat API; из кэша ответ отдается одним куском"""
+    key = _chat_cache_key(kind, text, max_tokens, temperature)
+    cached = await _cache_get_async(key)
+    if cached is not None:
+        yield cached
+        return
+
+    parts = []
+    async for token in llm_client.stream_chat(
+        model=REWRITE_MODEL,
+        messages=[
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": text}
+        ],
+        max_tokens=max_tokens,
+        temperature=temperature,
+    ):
+        parts.append(token)
+        yield token
+    await _cache_put_async(key, kind, REWRITE_MODEL, ''.join(parts).strip())
+
+async def rewrite_stream(html_text: str, truncate: int | None = None) -> AsyncIterator[dict]:
+    """
+    Потоковая версия rewrite. Отдает события:
+    {"type": "token", "text": ...} - очередной кусок текста,
+    {"type": "condense"} - текст длиннее лимита, дальше идет сокращенная версия,
+    {"type": "done", "text": ...} - итоговый текст.
+    """
+    if not html_text:
+        yield {"type": "done", "text": ""}
+        return
+
+    parts = []
+    async for token in _cached_chat_stream('rewrite', REWRITE_PROMPT, html.unescape(html_text), 800, 0.7):
+        parts.append(token)
+        yield {"type": "token", "text": token}
+    out = ''.join(parts).strip()
+
+    if truncate and len(out) > truncate:
+        yield {"type": "condense"}
+        parts = []
+        async for token in _cached_chat_stream('condense', CONDENSE_PROMPT, out, 800, 0.4):
+            parts.append(token)
+            yield {"type": "token", "text": token}
+        out = ''.join(parts).strip()
+
+    yield {"type": "done", "text": out}
+
 async def rewrite_text(text: str, max_length: int = None) -> str:
     """
     Rewrite text using OpenAI GPT model
@@ -53,16 +216,12 @@ async def rewrite_text(text: str, max_length: int = None) -> str:
         if max_length:
             prompt += f"\n\nМаксимальная длина: {max_length} символов"
         
-        response = openai.Completion.create(
-            engine="text-davinci-003",
-            prompt=prompt,
+        return await llm_client.chat(
+            model=REWRITE_MODEL,
+            messages=[{"role": "user", "content": prompt}],
             max_tokens=max_length or 1024,
             temperature=0.7,
-            n=1,
-            stop=None
         )
-        
-        return response.choices[0].text.strip()
     
     except Exception as e:
         print(f"Error rewriting text: {e}")
@@ -0,0 +1,438 @@
+import os
+import re
+import copy
+import html
+import time
+import asyncio
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from sqlalchemy.orm import Session
+
+from db import SessionLocal
+from models import SelectedPost, Post, MediaFileCache
+from tracing import background_task
+
+# Та же папка, из которой main.py раздает медиа
+MEDIA_ROOT = os.path.abspath("../frontend/public/media")
+
+# Типы медиа, которые умеет отправлять handle_post_publish
+PUBLISHABLE_MEDIA = {"photo", "video", "animation"}
+# Типы медиа, которые можно смешивать в одном send_media_group
+ALBUM_MEDIA = {"photo", "video"}
+# Максимум элементов в одном альбоме Telegram
+ALBUM_MAX_ITEMS = 10
+# Лимит подписи к медиа в Bot API (символы после разбора HTML)
+CAPTION_MAX_LENGTH = 1024
+# Фрагменты текста BadRequest, означающие, что сохраненный file_id больше не годится
+STALE_FILE_ID_ERRORS = ("wrong file identifier", "wrong remote file identifier", "wrong file_id", "file reference", "file_reference")
+
+def _retry_after_seconds(error) -> float:
+    """retry_after из RetryAfter: int в PTB 20, timedelta в более новых версиях"""
+    retry_after = error.retry_after
+    if isinstance(retry_after, timedelta):
+        return retry_after.total_seconds()
+    return float(retry_after)
+
+def local_media_path(post: Post) -> Optional[str]:
+    """Путь к скачанному медиафайлу поста, если он есть на диске"""
+    if not post.media_url:
+        return None
+    filename = post.media_url.split('/')[-1]
+    for folder in (post.channel_id.replace('-', ''), post.channel_id):
+        file_path = os.path.join(MEDIA_ROOT, folder, filename)
+        if os.path.exists(file_path) and os.path.getsize(file_path) > 0:
+            return file_path
+    return None
+
+def _file_signature(path: str):
+    """Размер и время изменения - чтобы не отдать file_id для подмененного файла"""
+    stat = os.stat(path)
+    return stat.st_size, int(stat.st_mtime)
+
+def cached_file_id(db: Session, path: str) -> Optional[str]:
+    """file_id ранее загруженного файла, если файл с тех пор не менялся"""
+    entry = db.query(MediaFileCache).filter(MediaFileCache.local_path == path).first()
+    if not entry:
+        return None
+    if (entry.file_size, entry.file_mtime) != _file_signature(path):
+        return None
+    return entry.file_id
+
+def remember_file_id(db: Session, path: str, media_type: str, file_id: Optional[str]):
+    """Запоминает file_id загруженного файла (None - забыть)"""
+    entry = db.query(MediaFileCache).filter(MediaFileCache.local_path == path).first()
+    if file_id is None:
+        if entry:
+            db.delete(entry)
+            db.commit()
+        return
+    file_size, file_mtime = _file_signature(path)
+    if not entry:
+        entry = MediaFileCache(local_path=path)
+        db.add(entry)
+    entry.file_size = file_size
+    entry.file_mtime = file_mtime
+    entry.media_type = media_type
+    entry.file_id = file_id
+    entry.created_at = datetime.utcnow()
+    db.commit()
+
+def _is_stale_file_id(error) -> bool:
+    """BadRequest из-за устаревшего file_id, а не из-за текста, прав бота или канала"""
+    message = str(getattr(error, "message", error)).lower()
+    return any(fragment in message for fragment in STALE_FILE_ID_ERRORS)
+
+def caption_length(text: str) -> int:
+    """Длина подписи так, как ее считает Telegram: без HTML-тегов, с раскрытыми сущностями"""
+    return len(html.unescape(re.sub(r"<[^>]+>", "", text)))
+
+def _message_file_id(message, media_type: str) -> Optional[str]:
+    """file_id загруженного медиа из ответа Bot API"""
+    if media_type == "photo" and message.photo:
+        return message.photo[-1].file_id
+    if media_type == "video" and message.video:
+        return message.video.file_id
+    if media_type == "animation" and message.animation:
+        return message.animation.file_id
+    return None
+
+def prepare_publication(db: Session, selected_post: SelectedPost) -> dict:
+    """Собирает текст и медиа поста (весь альбом, если пост из альбома) для отправки"""
+    text = selected_post.edited_text or selected_post.original_text or ""
+    post = db.query(Post).filter(Post.id == selected_post.post_id).first()
+
+    items = []
+    if post:
+        if post.album_id:
+            media_posts = db.query(Post).filter(
+                Post.channel_id == post.channel_id,
+                Post.album_id == post.album_id
+            ).order_by(Post.album_position).all()
+        else:
+            media_posts = [post]
+
+        for media_post in media_posts:
+            if media_post.media_type not in PUBLISHABLE_MEDIA:
+                continue
+            file_path = local_media_path(media_post)
+            if not file_path:
+                continue
+            items.append({
+                "media_type": media_post.media_type,
+                "path": file_path,
+                "file_id": cached_file_id(db, file_path),
+            })
+
+    if len(items) > 1:
+        items = [item for item in items if item["media_type"] in ALBUM_MEDIA][:ALBUM_MAX_ITEMS]
+
+    return {"text": text, "items": items}
+
+async def send_publication(pacer: "SendPacer", channel_id: str, publication: dict) -> list:
+    """
+    Отправляет подготовленную публикацию: альбом одним send_media_group, иначе одно сообщение.
+    Локальные файлы загружаются один раз, дальше используется сохраненный file_id.
+    Новые и отклоненные file_id отмечаются в publication["items"] - у каждой отправки своя копия,
+    в базу их записывает save_file_ids после всех отправок.
+    """
+    from telegram.error import BadRequest
+    from bot_handlers import handle_post_publish, handle_album_publish
+
+    text = publication["text"]
+    items = publication["items"]
+    if items and caption_length(text) > CAPTION_MAX_LENGTH:
+        # Telegram все равно отклонит такую подпись - не тратим загрузку медиа
+        raise ValueError(f"Подпись длиннее {CAPTION_MAX_LENGTH} символов ({caption_length(text)}), сократите текст поста")
+
+    async def send():
+        if len(items) > 1:
+            media = [(item["media_type"], item["file_id"] or Path(item["path"])) for item in items]
+            return list(await pacer.send(channel_id, handle_album_publish, channel_id, text, media))
+        if items:
+            item = items[0]
+            return [await pacer.send(
+                channel_id, handle_post_publish,
+                channel_id, text, item["media_type"], item["file_id"] or Path(item["path"])
+            )]
+        return [await pacer.send(channel_id, handle_post_publish, channel_id, text)]
+
+    try:
+        messages = await send()
+    except BadRequest as e:
+        if not any(item["file_id"] for item in items) or not _is_stale_file_id(e):
+            raise
+        # Сохраненный file_id больше не принимается - загружаем файлы заново
+        print(f"⚠️ file_id отклонен Telegram ({e}), загружаем медиа заново")
+        for item in items:
+            if item["file_id"]:
+                item["file_id"] = None
+                item["stale"] = True
+        messages = await send()
+
+    for item, message in zip(items, messages):
+        if not item["file_id"]:
+            item["file_id"] = _message_file_id(message, item["media_type"])
+
+    return messages
+
+def save_file_ids(db: Session, items: List[dict], sent_items: List[List[dict]]):
+    """
+    Записывает итог отправок в кэш file_id одним проходом: items - медиа как их подготовил
+    prepare_publication, sent_items - копии после каждой отправки. Новый file_id из ответа
+    Telegram сохраняется, отклоненный без замены - забывается.
+    """
+    for index, item in enumerate(items):
+        sent = [copies[index] for copies in sent_items]
+        fresh = next((entry["file_id"] for entry in sent if entry["file_id"] and entry["file_id"] != item["file_id"]), None)
+        if fresh:
+            remember_file_id(db, item["path"], item["media_type"], fresh)
+        elif item["file_id"] and any(entry.get("stale") for entry in sent):
+            remember_file_id(db, item["path"], item["media_type"], None)
+
+class SendPacer:
+    """Очередь отправки под лимиты Bot API: общий темп бота и интервал на каждый чат"""
+
+    def __init__(self, global_per_second: Optional[float] = None, per_chat_interval: Optional[float] = None, max_retries: int = 5):
+        # Bot API: ~30 сообщений/сек на бота, ~20 сообщений/мин в один канал или группу
+        self.global_per_second = global_per_second or float(os.getenv('BOT_GLOBAL_RATE', '25'))
+        self.per_chat_interval = per_chat_interval or float(os.getenv('BOT_PER_CHAT_INTERVAL', '3'))
+        self.max_retries = max_retries
+        self._next_global = 0.0
+        self._next_chat: Dict[str, float] = {}
+        self._blocked_until: Dict[str, float] = {}  # Пауза чата после 429
+
+    async def acquire(self, chat_id: str):
+        """Ждет свободный слот сначала для чата, затем в общем потоке бота"""
+        while True:
+            now = time.monotonic()
+            chat_slot = max(now, self._next_chat.get(chat_id, 0.0), self._blocked_until.get(chat_id, 0.0))
+            self._next_chat[chat_id] = chat_slot + self.per_chat_interval
+            if chat_slot > now:
+                await asyncio.sleep(chat_slot - now)
+            # Если пока ждали, чат получил 429 - занимаем новый слот после паузы
+            if self._blocked_until.get(chat_id, 0.0) <= time.monotonic():
+                break
+
+        now = time.monotonic()
+        slot = max(now, self._next_global)
+        self._next_global = slot + 1 / self.global_per_second
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    def pending(self) -> int:
+        """Сколько чатов сейчас ждут своего слота"""
+        now = time.monotonic()
+        return sum(1 for slot in self._next_chat.values() if slot > now)
+
+    async def send(self, chat_id: str, send_func, *args, **kwargs):
+        """Отправка через пейсер с повтором на 429 (retry_after) и сетевых ошибках"""
+        from telegram.error import BadRequest, RetryAfter, TimedOut, NetworkError
+
+        for attempt in range(self.max_retries + 1):
+            await self.acquire(chat_id)
+            try:
+                return await send_func(*args, **kwargs)
+            except BadRequest:
+                # В PTB BadRequest - подкласс NetworkError, но повтор того же запроса не поможет
+                raise
+            except RetryAfter as e:
+                if attempt >= self.max_retries:
+                    raise
+                delay = _retry_after_seconds(e)
+                print(f"⏳ Bot API 429 для {chat_id}: ждем {delay} сек")
+                # Ставим чат на паузу, чтобы остальные отправки в него тоже подождали
+                self._blocked_until[chat_id] = time.monotonic() + delay
+            except (TimedOut, NetworkError) as e:
+                if attempt >= self.max_retries:
+                    raise
+                delay = min(30, 2 ** attempt)
+                print(f"⚠️ Сетевая ошибка при отправке в {chat_id}: {e}, повтор через {delay} сек")
+                await asyncio.sleep(delay)
+
+class PublishScheduler:
+    """Фоновый воркер: публикует отобранные посты со статусом ready по расписанию"""
+
+    def __init__(self, poll_interval: Optional[float] = None, batch_size: int = 50):
+        self.poll_interval = poll_interval or float(os.getenv('PUBLISH_POLL_INTERVAL', '15'))
+        self.max_attempts = int(os.getenv('PUBLISH_MAX_ATTEMPTS', '3'))
+        self.batch_size = batch_size
+        self.pacer = SendPacer()
+        self._task: Optional[asyncio.Task] = None
+        self._in_flight: set = set()
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = background_task(self._run())
+            print(f"🗓️ Планировщик публикаций запущен (опрос каждые {self.poll_interval} сек)")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.dispatch_due()
+            except Exception as e:
+                print(f"❌ Ошибка планировщика публикаций: {e}")
+            await asyncio.sleep(self.poll_interval)
+
+    async def dispatch_due(self) -> int:
+        """Отправляет все посты, время публикации которых наступило"""
+        db = SessionLocal()
+        try:
+            due_ids = [
+                row[0] for row in db.query(SelectedPost.id).filter(
+                    SelectedPost.status == "ready",
+                    SelectedPost.target_channel_id.isnot(None),
+                    SelectedPost.publish_at.isnot(None),
+                    SelectedPost.publish_at <= datetime.utcnow(),
+                ).order_by(SelectedPost.publish_at).limit(self.batch_size).all()
+            ]
+        finally:
+            db.close()
+
+        due_ids = [selected_id for selected_id in due_ids if selected_id not in self._in_flight]
+        if due_ids:
+            print(f"📤 К публикации по расписанию: {len(due_ids)} постов")
+            # Параллелизм ограничивает пейсер: разные каналы идут одновременно, один канал - по очереди
+            await asyncio.gather(*(self.publish(selected_id) for selected_id in due_ids))
+        return len(due_ids)
+
+    async def publish(self, selected_post_id: int) -> dict:
+        """Публикует один отобранный пост в его целевой канал и обновляет статус"""
+        self._in_flight.add(selected_post_id)
+        db = SessionLocal()
+        try:
+            selected_post = db.query(SelectedPost).filter(SelectedPost.id == selected_post_id).first()
+            if not selected_post or not selected_post.target_channel_id:
+                return {"status": "error", "message": "Пост или целевой канал не найден"}
+
+            try:
+                publication = prepare_publication(db, selected_post)
+                sent = copy.deepcopy(publication)
+                try:
+                    messages = await send_publication(self.pacer, selected_post.target_channel_id, sent)
+                finally:
+                    save_file_ids(db, publication["items"], [sent["items"]])
+            except Exception as e:
+                selected_post.publish_attempts = (selected_post.publish_attempts or 0) + 1
+                selected_post.publish_error = str(e)
+                # ValueError - ошибка в самом посте (например, длинная подпись), повтор не поможет
+                if isinstance(e, ValueError) or selected_post.publish_attempts >= self.max_attempts:
+                    selected_post.status = "failed"
+                else:
+                    selected_post.publish_at = datetime.utcnow() + timedelta(minutes=selected_post.publish_attempts)
+                db.commit()
+                print(f"❌ Не удалось опубликовать пост {selected_post_id}: {e}")
+                return {"status": "error", "message": str(e)}
+
+            message_ids = [message.message_id for message in messages]
+            selected_post.status = "published"
+            selected_post.published_at = datetime.utcnow()
+            selected_post.published_message_id = message_ids[0]
+            selected_post.publish_error = None
+            db.commit()
+            print(f"✅ Пост {selected_post_id} опубликован в {selected_post.target_channel_id} ({len(message_ids)} сообщ.)")
+            return {"status": "success", "message_id": message_ids[0], "message_ids": message_ids}
+        finally:
+            db.close()
+            self._in_flight.discard(selected_post_id)
+
+    async def publish_to_channels(self, selected_post_id: int, channel_ids: List[str]) -> dict:
+        """
+        Публикует один пост сразу в несколько каналов.
+        Медиа загружаются один раз (в первый успешный канал), остальные каналы получают
+        file_id и отправляются параллельно через общий пейсер.
+        Ошибки до отправки возвращаются с HTTP-кодом в "code".
+        """
+        started = time.perf_counter()
+        channel_ids = list(dict.fromkeys(channel_ids))  # Без дублей, порядок сохраняем
+        if selected_post_id in self._in_flight:
+            return {"status": "error", "code": 409, "message": "Пост уже публикуется"}
+        self._in_flight.add(selected_post_id)
+        db = SessionLocal()
+        try:
+            selected_post = db.query(SelectedPost).filter(SelectedPost.id == selected_post_id).first()
+            if not selected_post:
+                return {"status": "error", "code": 404, "message": "Отобранный пост не найден"}
+            if selected_post.status == "published":
+                return {"status": "error", "code": 409, "message": "Пост уже опубликован"}
+            # Снимаем пост с расписания до рассылки, чтобы планировщик не отправил его повторно;
+            # если ни один канал не принял пост, расписание возвращается
+            scheduled_at = selected_post.publish_at
+            if scheduled_at is not None:
+                selected_post.publish_at = None
+                db.commit()
+            publication = prepare_publication(db, selected_post)
+            sent_items: List[List[dict]] = []  # Копии медиа после отправки в каждый канал
+
+            async def send_to(channel_id: str, source: dict) -> dict:
+                # Своя копия на канал: параллельные отправки не правят общие items и не пишут в сессию
+                target = copy.deepcopy(source)
+                sent_items.append(target["items"])
+                target_started = time.perf_counter()
+                try:
+                    messages = await send_publication(self.pacer, channel_id, target)
+                    return {
+                        "channel_id": channel_id,
+                        "status": "success",
+                        "message_ids": [message.message_id for message in messages],
+                        "latency_ms": round((time.perf_counter() - target_started) * 1000),
+                    }
+                except Exception as e:
+                    print(f"❌ Ошибка публикации поста {selected_post_id} в {channel_id}: {e}")
+                    return {
+                        "channel_id": channel_id,
+                        "status": "error",
+                        "error": str(e),
+                        "latency_ms": round((time.perf_counter() - target_started) * 1000),
+                    }
+
+            results = []
+            remaining = channel_ids
+            current = publication
+            # Пока у медиа нет file_id, отправляем по одному каналу - чтобы загрузить файлы один раз
+            while remaining and any(not item["file_id"] for item in current["items"]):
+                result = await send_to(remaining[0], current)
+                results.append(result)
+                remaining = remaining[1:]
+                # Следующие каналы получают file_id, полученные (или сброшенные) этой отправкой
+                current = {"text": publication["text"], "items": sent_items[-1]}
+                if result["status"] == "success":
+                    break
+            results.extend(await asyncio.gather(*(send_to(channel_id, current) for channel_id in remaining)))
+            save_file_ids(db, publication["items"], sent_items)
+
+            succeeded = [result for result in results if result["status"] == "success"]
+            if succeeded:
+                selected_post.status = "published"
+                selected_post.published_at = datetime.utcnow()
+                selected_post.published_message_id = succeeded[0]["message_ids"][0]
+                db.commit()
+            elif scheduled_at is not None:
+                selected_post.publish_at = scheduled_at
+                db.commit()
+
+            print(f"📣 Пост {selected_post_id} разослан: {len(succeeded)}/{len(channel_ids)} каналов")
+            return {
+                "status": "success" if len(succeeded) == len(channel_ids) else ("partial" if succeeded else "error"),
+                "selected_post_id": selected_post_id,
+                "published": len(succeeded),
+                "failed": len(channel_ids) - len(succeeded),
+                "results": results,
+                "total_ms": round((time.perf_counter() - started) * 1000),
+            }
+        finally:
+            db.close()
+            self._in_flight.discard(selected_post_id)
+
+# Глобальный экземпляр планировщика
+publish_scheduler = PublishScheduler()
@@ -0,0 +1,205 @@
+import os
+import re
+import sys
+import time
+import threading
+import contextvars
+from collections import deque
+from datetime import datetime
+from typing import Dict, Optional
+
+from sqlalchemy import event
+
+from metrics import route_template
+
+# Профилировщик SQL по HTTP-запросам: сколько запросов и сколько времени в БД на каждый
+# вызов эндпоинта, медленные запросы с параметрами и местом вызова, подозрения на N+1.
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+# Один и тот же запрос столько раз за HTTP-запрос - вероятно, запрос в цикле по строкам
+N_PLUS_ONE_THRESHOLD = int(os.getenv("N_PLUS_ONE_THRESHOLD", "10"))
+
+_BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+_SKIP_FILES = {os.path.abspath(__file__), os.path.join(_BACKEND_DIR, "metrics.py"), os.path.join(_BACKEND_DIR, "db.py")}
+_WHITESPACE = re.compile(r"\s+")
+
+class RequestQueries:
+    """Счетчики одного HTTP-запроса; один объект на запрос, разделяется потоками и greenlet-ами"""
+
+    __slots__ = ("count", "total_ms", "statements", "closed")
+
+    def __init__(self):
+        self.closed = False  # Запрос завершен - запросы задач, переживших его, не считаем
+        self.count = 0
+        self.total_ms = 0.0
+        self.statements: Dict[str, int] = {}
+
+    def add(self, statement: str, elapsed_ms: float):
+        self.count += 1
+        self.total_ms += elapsed_ms
+        self.statements[statement] = self.statements.get(statement, 0) + 1
+
+_current: contextvars.ContextVar[Optional[RequestQueries]] = contextvars.ContextVar("request_queries", default=None)
+
+def _normalize(statement: str) -> str:
+    return _WHITESPACE.sub(" ", statement).strip()[:300]
+
+def _frame_call_site(frame) -> Optional[str]:
+    while frame is not None:
+        filename = os.path.abspath(frame.f_code.co_filename)
+        if (
+            filename.startswith(_BACKEND_DIR) and filename.endswith(".py")
+            and filename not in _SKIP_FILES and "site-packages" not in filename
+        ):
+            return f"{os.path.relpath(filename, _BACKEND_DIR)}:{frame.f_lineno} in {frame.f_code.co_name}"
+        frame = frame.f_back
+    return None
+
+def _call_site() -> str:
+    """Первая строка кода приложения в стеке вызова запроса"""
+    site = _frame_call_site(sys._getframe(2))
+    if site is None:
+        # Асинхронный движок выполняет запрос в дочернем greenlet - код приложения в родительском
+        try:
+            import greenlet
+            parent = greenlet.getcurrent().parent
+            if parent is not None:
+                site = _frame_call_site(parent.gr_frame)
+        except Exception:
+            pass
+    return site or "unknown"
+
+class QueryProfiler:
+    """Сводка по эндпоинтам и журнал медленных запросов (в памяти процесса)"""
+
+    def __init__(self, slow_query_ms: float = SLOW_QUERY_MS, n_plus_one_threshold: int = N_PLUS_ONE_THRESHOLD):
+        self.slow_query_ms = slow_query_ms
+        self.n_plus_one_threshold = n_plus_one_threshold
+        self.endpoints: Dict[str, dict] = {}
+        self.slow_queries: deque = deque(maxlen=100)
+        self._lock = threading.Lock()
+
+    def instrument(self, engine):
+        """Подписывается на события движка (для async_engine передавать async_engine.sync_engine)"""
+
+        @event.listens_for(engine, "before_cursor_execute")
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            context._profiler_started = time.perf_counter()
+
+        @event.listens_for(engine, "after_cursor_execute")
+        def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            started = getattr(context, "_profiler_started", None)
+            if started is None:
+                return
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            normalized = _normalize(statement)
+
+            stats = _current.get()
+            if stats is not None and not stats.closed:
+                stats.add(normalized, elapsed_ms)
+
+            if elapsed_ms >= self.slow_query_ms:
+                self._log_slow(normalized, parameters, elapsed_ms)
+
+    def _log_slow(self, statement: str, parameters, elapsed_ms: float):
+        call_site = _call_site()
+        params = repr(parameters)
+        if len(params) > 500:
+            params = params[:500] + "..."
+        print(f"🐢 Медленный запрос {elapsed_ms:.0f} мс ({call_site}): {statement} | параметры: {params}")
+        self.slow_queries.append({
+            "at": datetime.now().isoformat(),
+            "duration_ms": round(elapsed_ms, 1),
+            "statement": statement,
+            "parameters": params,
+            "call_site": call_site,
+        })
+
+    def record_request(self, route: str, stats: RequestQueries):
+        with self._lock:
+            entry = self.endpoints.get(route)
+            if entry is None:
+                entry = self.endpoints[route] = {
+                    "requests": 0,
+                    "queries": 0,
+                    "max_queries": 0,
+                    "db_ms": 0.0,
+                    "max_db_ms": 0.0,
+                    "n_plus_one": {},
+                }
+            entry["requests"] += 1
+            entry["queries"] += stats.count
+            entry["max_queries"] = max(entry["max_queries"], stats.count)
+            entry["db_ms"] += stats.total_ms
+            entry["max_db_ms"] = max(entry["max_db_ms"], stats.total_ms)
+            for statement, repeats in stats.statements.items():
+                if repeats >= self.n_plus_one_threshold:
+                    entry["n_plus_one"][statement] = max(entry["n_plus_one"].get(statement, 0), repeats)
+
+    def report(self) -> dict:
+        with self._lock:
+            endpoints = []
+            for route, entry in self.endpoints.items():
+                requests = entry["requests"] or 1
+                endpoints.append({
+                    "route": route,
+                    "requests": entry["requests"],
+                    "avg_queries": round(entry["queries"] / requests, 1),
+                    "max_queries": entry["max_queries"],
+                    "avg_db_ms": round(entry["db_ms"] / requests, 1),
+                    "max_db_ms": round(entry["max_db_ms"], 1),
+                    "n_plus_one_suspects": [
+                        {"statement": statement, "max_repeats": repeats}
+                        for statement, repeats in sorted(entry["n_plus_one"].items(), key=lambda item: -item[1])
+                    ],
+                })
+        endpoints.sort(key=lambda item: item["max_queries"], reverse=True)
+        return {
+            "slow_query_ms": self.slow_query_ms,
+            "n_plus_one_threshold": self.n_plus_one_threshold,
+            "endpoints": endpoints,
+            "slow_queries": list(self.slow_queries),
+        }
+
+    def reset(self):
+        with self._lock:
+            self.endpoints.clear()
+            self.slow_queries.clear()
+
+query_profiler = QueryProfiler()
+
+class QueryCountMiddleware:
+    """
+    ASGI-middleware: считает SQL-запросы и время в БД на каждый HTTP-запрос.
+    Итог отдается в заголовке Server-Timing и копится в сводке по эндпоинтам.
+    """
+
+    def __init__(self, app, profiler: QueryProfiler = query_profiler):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        stats = RequestQueries()
+        token = _current.set(stats)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((
+                    b"server-timing",
+                    f'db;dur={stats.total_ms:.1f};desc="{stats.count} queries"'.encode(),
+                ))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # Задачи, созданные из запроса, держат копию контекста с этим объектом и после ответа
+            stats.closed = True
+            _current.reset(token)
+            if stats.count:
+                self.profiler.record_request(f'{scope["method"]} {route_template(scope)}', stats)
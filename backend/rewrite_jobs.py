@@ -0,0 +1,160 @@
+import os
+import time
+import uuid
+import asyncio
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from db import SessionLocal
+from models import SelectedPost
+from openai_utils import rewrite
+from tracing import background_task
+
+# Записи воркеров идут по одной: запись короткая, а параллельные UPDATE из потоков в SQLite
+# с общим кэшем (база по умолчанию) падают с "database table is locked"
+_write_lock = threading.Lock()
+
+class RewriteJobManager:
+    """Фоновые задачи пакетного AI-переписывания отобранных постов"""
+
+    def __init__(self, max_workers: Optional[int] = None, max_jobs: int = 50):
+        self.max_workers = max_workers or int(os.getenv('REWRITE_BATCH_WORKERS', '4'))
+        self.max_jobs = max_jobs  # Сколько последних задач храним для просмотра прогресса
+        self.jobs: "OrderedDict[str, dict]" = OrderedDict()
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    async def start_job(self, selected_post_ids: Optional[List[int]] = None, truncate: Optional[int] = None,
+                        overwrite: bool = False) -> dict:
+        """
+        Создает задачу по списку id (или по всем черновикам) и запускает ее в фоне.
+        Посты, которые редактор уже поправил вручную (edited_text отличается от оригинала),
+        пропускаются, если не передан overwrite.
+        """
+        rows = await asyncio.to_thread(_load_posts, selected_post_ids)
+
+        job_id = uuid.uuid4().hex
+        items = {}
+        texts = {}
+        expected = {}  # edited_text на момент запуска - результат пишется, только если он не изменился
+        for row in rows:
+            edited_by_hand = bool(row.edited_text) and row.edited_text != row.original_text
+            items[row.id] = {
+                "selected_post_id": row.id,
+                "status": "skipped" if edited_by_hand and not overwrite else "pending",
+                "error": None,
+                "duration_ms": None,
+            }
+            if items[row.id]["status"] == "pending":
+                texts[row.id] = row.original_text or ""
+                expected[row.id] = row.edited_text
+        job = {
+            "id": job_id,
+            "status": "running",
+            "total": len(rows),
+            "done": 0,
+            "failed": 0,
+            "skipped": len(rows) - len(texts),
+            "truncate": truncate,
+            "overwrite": overwrite,
+            "started_at": datetime.utcnow().isoformat(),
+            "finished_at": None,
+            "items": items,
+        }
+        self.jobs[job_id] = job
+        while len(self.jobs) > self.max_jobs:
+            self.jobs.popitem(last=False)
+
+        # Задача переживает HTTP-запрос, который ее создал
+        task = background_task(self._run(job, texts, expected, truncate, overwrite))
+        self._tasks[job_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(job_id, None))
+        print(f"🤖 Запущено пакетное переписывание {job_id}: {len(texts)} постов (пропущено {job['skipped']}), воркеров: {self.max_workers}")
+        return self.get_job(job_id)
+
+    def get_job(self, job_id: str) -> Optional[dict]:
+        """Снимок состояния задачи для отдачи в API"""
+        job = self.jobs.get(job_id)
+        if not job:
+            return None
+        return {**job, "items": list(job["items"].values())}
+
+    async def _run(self, job: dict, texts: Dict[int, str], expected: Dict[int, Optional[str]],
+                   truncate: Optional[int], overwrite: bool):
+        """Раздает посты ограниченному пулу воркеров"""
+        queue: asyncio.Queue = asyncio.Queue()
+        for selected_post_id in texts:
+            queue.put_nowait(selected_post_id)
+
+        async def worker():
+            while True:
+                try:
+                    selected_post_id = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                await self._process_item(job, selected_post_id, texts[selected_post_id], expected[selected_post_id],
+                                         truncate, overwrite)
+
+        workers = [asyncio.create_task(worker()) for _ in range(min(self.max_workers, len(texts)))]
+        await asyncio.gather(*workers)
+
+        job["status"] = "completed" if job["failed"] == 0 else "completed_with_errors"
+        job["finished_at"] = datetime.utcnow().isoformat()
+        print(f"✅ Пакетное переписывание {job['id']} завершено: {job['done']} готово, {job['failed']} ошибок, {job['skipped']} пропущено")
+
+    async def _process_item(self, job: dict, selected_post_id: int, text: str, expected_edited_text: Optional[str],
+                            truncate: Optional[int], overwrite: bool):
+        """Переписывает один пост и сохраняет результат в edited_text"""
+        item = job["items"][selected_post_id]
+        item["status"] = "running"
+        started = time.perf_counter()
+        try:
+            result = await rewrite(text, truncate, raise_errors=True)
+            # Синхронная сессия - в пуле потоков, чтобы воркеры не блокировали event loop
+            saved = await asyncio.to_thread(_save_result, selected_post_id, result, expected_edited_text, overwrite)
+            if saved:
+                item["status"] = "done"
+                job["done"] += 1
+            else:
+                # Пока шло переписывание, редактор изменил текст вручную
+                item["status"] = "skipped"
+                job["skipped"] += 1
+        except Exception as e:
+            item["status"] = "error"
+            item["error"] = str(e)
+            job["failed"] += 1
+        finally:
+            item["duration_ms"] = round((time.perf_counter() - started) * 1000)
+
+def _load_posts(selected_post_ids: Optional[List[int]]) -> list:
+    db = SessionLocal()
+    try:
+        query = db.query(SelectedPost.id, SelectedPost.original_text, SelectedPost.edited_text)
+        if selected_post_ids:
+            query = query.filter(SelectedPost.id.in_(selected_post_ids))
+        else:
+            query = query.filter(SelectedPost.status == "draft")
+        return query.order_by(SelectedPost.id).all()
+    finally:
+        db.close()
+
+def _save_result(selected_post_id: int, result: str, expected_edited_text: Optional[str], overwrite: bool) -> bool:
+    """Пишет edited_text; без overwrite - только если текст не меняли с момента запуска задачи"""
+    with _write_lock:
+        db = SessionLocal()
+        try:
+            query = db.query(SelectedPost).filter(SelectedPost.id == selected_post_id)
+            if not overwrite:
+                if expected_edited_text is None:
+                    query = query.filter(SelectedPost.edited_text.is_(None))
+                else:
+                    query = query.filter(SelectedPost.edited_text == expected_edited_text)
+            updated = query.update({"edited_text": result}, synchronize_session=False)
+            db.commit()
+            return updated > 0
+        finally:
+            db.close()
+
+# Глобальный экземпляр менеджера
+rewrite_job_manager = RewriteJobManager()
@@ -0,0 +1,61 @@
+"""
+Демон Telegram: единственный процесс, который держит MTProto-клиенты и файлы сессий.
+API запускается с TELEGRAM_MODE=remote и обращается к демону через Unix-сокет,
+поэтому uvicorn можно запускать с несколькими воркерами.
+
+Запуск (из папки backend):  python telegram_daemon.py
+"""
+import os
+import signal
+import asyncio
+
+from db import engine, Base, SessionLocal, upgrade_schema
+from telegram_parser import telegram_parser
+from multi_user_telegram import multi_user_manager
+from telegram_ipc import TelegramIPCServer
+from publisher import publish_scheduler
+from loop_monitor import loop_monitor
+from logging_config import setup_logging, shutdown_logging
+
+async def main():
+    Base.metadata.create_all(bind=engine)
+    upgrade_schema()
+    loop_monitor.start()
+
+    await telegram_parser.initialize_client()
+
+    if os.getenv('TELEGRAM_WARM_START', '').lower() in ('1', 'true', 'yes'):
+        db = SessionLocal()
+        try:
+            await multi_user_manager.warm_up(db)
+        except Exception as e:
+            print(f"❌ Ошибка прогрева сессий: {e}")
+        finally:
+            db.close()
+
+    # Планировщик публикаций должен работать в одном экземпляре, а не в каждом воркере API
+    if os.getenv('BOT_TOKEN'):
+        publish_scheduler.start()
+
+    server = TelegramIPCServer(multi_user_manager, telegram_parser)
+    await server.start()
+
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop_event.set)
+
+    try:
+        await stop_event.wait()
+    finally:
+        print("🔌 Останавливаем демон Telegram...")
+        await server.stop()
+        await publish_scheduler.stop()
+        await multi_user_manager.stop_all()
+        await telegram_parser.stop()
+        await loop_monitor.stop()
+        shutdown_logging()
+
+if __name__ == "__main__":
+    setup_logging()
+    asyncio.run(main())
@@ -0,0 +1,343 @@
+import os
+import json
+import asyncio
+import inspect
+import itertools
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from db import SessionLocal, AsyncSessionLocal
+from tracing import tracer, trace_context, background_task
+
+# Сокет, через который API-воркеры обращаются к демону с Telegram-клиентами
+IPC_SOCKET_PATH = os.getenv('TELEGRAM_IPC_SOCKET', os.path.abspath("sessions/telegram_daemon.sock"))
+IPC_TIMEOUT = float(os.getenv('TELEGRAM_IPC_TIMEOUT', '600'))
+# Ответы с постами бывают большими - поднимаем лимит строки StreamReader
+IPC_LINE_LIMIT = 64 * 1024 * 1024
+
+# Методы, которые можно вызвать удаленно. *_DB_METHODS получают сессию БД демона в аргументе db
+# (парсер работает с AsyncSession, менеджер - с обычной Session)
+PARSER_METHODS = {
+    "initialize_client", "is_authorized", "get_user_channels", "get_channel_info",
+    "quick_check_new_posts", "bulk_check_new_posts", "parse_channel_posts",
+    "redownload_media", "get_status", "stop", "logout", "clear_auth_cache",
+}
+PARSER_DB_METHODS = {"parse_all_sources", "parse_all_sources_limited"}
+MANAGER_METHODS = {"send_phone_code", "get_user_channels", "stop_all", "get_warm_up_report", "get_cache_stats"}
+MANAGER_DB_METHODS = {"verify_phone_code", "verify_password", "logout_user", "warm_up", "cleanup_inactive_sessions"}
+
+class TelegramIPCError(Exception):
+    """Ошибка, пришедшая от демона Telegram или из канала связи с ним"""
+
+def _encode(value: Any) -> Any:
+    """JSON-совместимое представление (datetime в результатах парсинга)"""
+    if isinstance(value, datetime):
+        return {"__datetime__": value.isoformat()}
+    if isinstance(value, dict):
+        return {key: _encode(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple, set)):
+        return [_encode(item) for item in value]
+    return value
+
+def _decode(value: Any) -> Any:
+    if isinstance(value, dict):
+        if len(value) == 1 and "__datetime__" in value:
+            return datetime.fromisoformat(value["__datetime__"])
+        return {key: _decode(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_decode(item) for item in value]
+    return value
+
+def _dumps(message: dict) -> bytes:
+    return json.dumps(_encode(message), ensure_ascii=False).encode('utf-8') + b"\n"
+
+class TelegramIPCServer:
+    """Сторона демона: принимает JSON-запросы построчно и вызывает методы менеджера и парсеров"""
+
+    def __init__(self, manager, legacy_parser, socket_path: str = IPC_SOCKET_PATH):
+        self.manager = manager
+        self.legacy_parser = legacy_parser
+        self.socket_path = socket_path
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self):
+        os.makedirs(os.path.dirname(self.socket_path), exist_ok=True)
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        self._server = await asyncio.start_unix_server(self._handle_connection, self.socket_path, limit=IPC_LINE_LIMIT)
+        print(f"📡 Демон Telegram слушает {self.socket_path}")
+
+    async def stop(self):
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        write_lock = asyncio.Lock()
+        tasks = set()
+
+        async def respond(request: dict):
+            response = {"id": request.get("id")}
+            # Продолжаем trace воркера API, чтобы один trace покрывал оба процесса
+            trace_id, parent_id = request.get("trace") or (None, None)
+            try:
+                with tracer.span(f'ipc.server {request.get("method")}', kind="server", trace_id=trace_id, parent_id=parent_id):
+                    response["result"] = await self._dispatch(request)
+            except Exception as e:
+                response["error"] = f"{type(e).__name__}: {e}"
+            async with write_lock:
+                writer.write(_dumps(response))
+                await writer.drain()
+
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                # Запросы одного воркера выполняются параллельно, ответы сопоставляются по id
+                task = asyncio.create_task(respond(_decode(json.loads(line))))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+            writer.close()
+
+    async def _dispatch(self, request: dict) -> Any:
+        target = request["target"]
+        method = request["method"]
+        args = request.get("args", [])
+        kwargs = request.get("kwargs", {})
+
+        if target == "manager":
+            if method == "get_current_user":
+                return await self._current_user_phone()
+            if method not in MANAGER_METHODS | MANAGER_DB_METHODS:
+                raise TelegramIPCError(f"Метод менеджера {method} недоступен через IPC")
+            obj, needs_db = self.manager, method in MANAGER_DB_METHODS
+        else:
+            if method not in PARSER_METHODS | PARSER_DB_METHODS:
+                raise TelegramIPCError(f"Метод парсера {method} недоступен через IPC")
+            if target == "legacy":
+                obj = self.legacy_parser
+            else:
+                obj = await self.manager.get_parser_for_user(request["phone_number"])
+            needs_db = method in PARSER_DB_METHODS
+
+        if not needs_db:
+            return await self._invoke(obj, method, args, kwargs)
+        if target == "manager":
+            db = SessionLocal()
+            try:
+                return await self._invoke(obj, method, args, {**kwargs, "db": db})
+            finally:
+                db.close()
+        async with AsyncSessionLocal() as db:
+            return await self._invoke(obj, method, args, {**kwargs, "db": db})
+
+    @staticmethod
+    async def _invoke(obj, method: str, args: list, kwargs: dict) -> Any:
+        result = getattr(obj, method)(*args, **kwargs)
+        if inspect.isawaitable(result):
+            result = await result
+        return result
+
+    async def _current_user_phone(self) -> Optional[str]:
+        """Номер телефона, под которым менеджер держит парсер текущего пользователя"""
+        db = SessionLocal()
+        try:
+            parser = await self.manager.get_current_user_parser(db)
+        finally:
+            db.close()
+        for phone_number, user_parser in self.manager.user_parsers.items():
+            if user_parser is parser:
+                return phone_number
+        return None
+
+class TelegramIPCClient:
+    """Сторона API-воркера: одно соединение с демоном, запросы мультиплексируются по id"""
+
+    def __init__(self, socket_path: str = IPC_SOCKET_PATH, timeout: float = IPC_TIMEOUT):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._reader_task: Optional[asyncio.Task] = None
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._ids = itertools.count(1)
+        self._connect_lock = asyncio.Lock()
+        self._write_lock = asyncio.Lock()
+
+    async def _ensure_connected(self):
+        async with self._connect_lock:
+            if self._writer is not None and not self._writer.is_closing():
+                return
+            try:
+                self._reader, self._writer = await asyncio.open_unix_connection(self.socket_path, limit=IPC_LINE_LIMIT)
+            except OSError as e:
+                raise TelegramIPCError(f"Демон Telegram недоступен ({self.socket_path}): {e}")
+            self._reader_task = background_task(self._read_responses())
+
+    async def _read_responses(self):
+        try:
+            while True:
+                line = await self._reader.readline()
+                if not line:
+                    break
+                response = _decode(json.loads(line))
+                future = self._pending.pop(response.get("id"), None)
+                if future is None or future.done():
+                    continue
+                if "error" in response:
+                    future.set_exception(TelegramIPCError(response["error"]))
+                else:
+                    future.set_result(response.get("result"))
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            # Соединение оборвалось - будим всех, кто ждет ответа
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(TelegramIPCError("Соединение с демоном Telegram потеряно"))
+            self._pending.clear()
+            if self._writer:
+                self._writer.close()
+            self._writer = None
+
+    async def call(self, target: str, method: str, *args, phone_number: Optional[str] = None, **kwargs) -> Any:
+        await self._ensure_connected()
+        request_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        with tracer.span(f"ipc.client {method}", kind="client", target=target):
+            request = {
+                "id": request_id,
+                "target": target,
+                "phone_number": phone_number,
+                "method": method,
+                "args": list(args),
+                "kwargs": kwargs,
+                "trace": trace_context(),
+            }
+            try:
+                async with self._write_lock:
+                    self._writer.write(_dumps(request))
+                    await self._writer.drain()
+                return await asyncio.wait_for(future, timeout=self.timeout)
+            finally:
+                self._pending.pop(request_id, None)
+
+    async def close(self):
+        if self._writer:
+            self._writer.close()
+        if self._reader_task:
+            self._reader_task.cancel()
+            try:
+                await self._reader_task
+            except asyncio.CancelledError:
+                pass
+            self._reader_task = None
+
+# Фоновые вызовы демона: asyncio держит на задачи только слабые ссылки
+_background_calls: set = set()
+
+def _background_call_done(task: asyncio.Task):
+    _background_calls.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        print(f"❌ Ошибка фонового вызова демона Telegram: {task.exception()}")
+
+def _remote(method: str):
+    """Метод-прокси: вызывает одноименный метод парсера в демоне"""
+    async def call(self, *args, **kwargs):
+        return await self._ipc.call(self._target, method, *args, phone_number=self.phone_number, **kwargs)
+    call.__name__ = method
+    return call
+
+class RemoteParser:
+    """Заместитель TelegramParser в API-воркере: те же методы, но выполняются в демоне"""
+
+    def __init__(self, ipc: TelegramIPCClient, phone_number: Optional[str] = None, legacy: bool = False):
+        self._ipc = ipc
+        self.phone_number = phone_number
+        self._target = "legacy" if legacy else "parser"
+
+    initialize_client = _remote("initialize_client")
+    is_authorized = _remote("is_authorized")
+    get_user_channels = _remote("get_user_channels")
+    get_channel_info = _remote("get_channel_info")
+    quick_check_new_posts = _remote("quick_check_new_posts")
+    bulk_check_new_posts = _remote("bulk_check_new_posts")
+    parse_channel_posts = _remote("parse_channel_posts")
+    redownload_media = _remote("redownload_media")
+    get_status = _remote("get_status")
+    stop = _remote("stop")
+    logout = _remote("logout")
+
+    async def parse_all_sources(self, db=None):
+        # Демон пишет посты через свою сессию БД
+        return await self._ipc.call(self._target, "parse_all_sources", phone_number=self.phone_number)
+
+    async def parse_all_sources_limited(self, db=None, limit: int = 5):
+        return await self._ipc.call(self._target, "parse_all_sources_limited", phone_number=self.phone_number, limit=limit)
+
+    def clear_auth_cache(self):
+        # В TelegramParser метод синхронный - отправляем запрос в фоне, ошибки пишем в лог
+        task = asyncio.create_task(self._ipc.call(self._target, "clear_auth_cache", phone_number=self.phone_number))
+        _background_calls.add(task)
+        task.add_done_callback(_background_call_done)
+
+class RemoteTelegramManager:
+    """Заместитель MultiUserTelegramManager в API-воркере (TELEGRAM_MODE=remote)"""
+
+    def __init__(self, socket_path: str = IPC_SOCKET_PATH):
+        self._ipc = TelegramIPCClient(socket_path)
+        self.legacy_parser = RemoteParser(self._ipc, legacy=True)
+
+    async def _call(self, method: str, *args, **kwargs):
+        return await self._ipc.call("manager", method, *args, **kwargs)
+
+    async def get_parser_for_user(self, phone_number: str) -> RemoteParser:
+        return RemoteParser(self._ipc, phone_number)
+
+    async def get_current_user_parser(self, db=None) -> Optional[RemoteParser]:
+        phone_number = await self._call("get_current_user")
+        return RemoteParser(self._ipc, phone_number) if phone_number else None
+
+    async def send_phone_code(self, phone_number: str):
+        return await self._call("send_phone_code", phone_number)
+
+    async def verify_phone_code(self, phone_number: str, phone_code: str, phone_code_hash: str, db=None):
+        return await self._call("verify_phone_code", phone_number, phone_code, phone_code_hash)
+
+    async def verify_password(self, phone_number: str, password: str, db=None):
+        return await self._call("verify_password", phone_number, password)
+
+    async def logout_user(self, phone_number: str, db=None):
+        return await self._call("logout_user", phone_number)
+
+    async def get_user_channels(self, phone_number: str):
+        return await self._call("get_user_channels", phone_number)
+
+    async def cleanup_inactive_sessions(self, db=None):
+        return await self._call("cleanup_inactive_sessions")
+
+    async def warm_up(self, db=None):
+        return await self._call("warm_up")
+
+    async def get_warm_up_report(self):
+        return await self._call("get_warm_up_report")
+
+    async def get_cache_stats(self):
+        return await self._call("get_cache_stats")
+
+    async def stop_all(self):
+        return await self._call("stop_all")
+
+    async def close(self):
+        """Закрывает соединение с демоном (сами клиенты Telegram продолжают работать)"""
+        await self._ipc.close()
@@ -1,5 +1,7 @@
 import os
+import time
 import asyncio
+import logging
 from datetime import datetime, timezone
 from typing import List, Optional
 from pyrogram import Client
@@ -13,14 +15,49 @@ from pyrogram.errors import (
     UsernameNotOccupied,
     PeerIdInvalid
 )
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from dotenv import load_dotenv
 
 from models import Source, Post
 from db import get_session
+from ttl_cache import AsyncTTLCache
+from telegram_supervisor import ConnectionSupervisor
+from metrics import (
+    add_ingested_post,
+    instrument_pyrogram,
+    MESSAGES_SCANNED,
+    TELEGRAM_FLOOD_WAIT_SLEPT,
+    MEDIA_DOWNLOAD_SECONDS,
+    MEDIA_DOWNLOAD_BYTES,
+    MEDIA_DOWNLOAD_ERRORS,
+)
+from tracing import traced, span, current_span, trace_pyrogram
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+# Задержки и ошибки всех вызовов Telegram API для /metrics
+instrument_pyrogram(Client)
+trace_pyrogram(Client)
+
+# Общие для всех парсеров кэши: ключи включают имя сессии, поэтому пользователи не пересекаются
+auth_cache = AsyncTTLCache(
+    "telegram_auth",
+    maxsize=256,
+    ttl=60,
+    negative_ttl=15,
+    is_negative=lambda authorized: not authorized,
+)
+quick_check_cache = AsyncTTLCache(
+    "telegram_quick_check",
+    maxsize=int(os.getenv('QUICK_CHECK_CACHE_SIZE', '2048')),
+    ttl=60,
+    negative_ttl=15,
+    is_negative=lambda result: result.get("status") != "success",
+)
+
 class TelegramParser:
     def __init__(self):
         self.api_id = os.getenv('TELEGRAM_API_ID')
@@ -28,10 +65,7 @@ class TelegramParser:
         self.session_name = "smm_bot_session"
         self.client = None
         self._initialized = False
-        self._auth_cache = None
-        self._auth_cache_time = None
-        self._quick_check_cache = {}  # Кэш для быстрых проверок каналов
-        self._quick_check_cache_time = {}  # Время кэша для каждого канала
+        self.supervisor = ConnectionSupervisor(self)
         
     async def initialize_client(self):
         """Инициализация клиента Telegram"""
@@ -167,8 +201,8 @@ class TelegramParser:
                 print(f"✅ Успешная авторизация пользователя: {signed_in.first_name}")
                 
                 # Очищаем кэш ПОСЛЕ успешной авторизации для принудительной проверки
-                self._auth_cache = None
-                self._auth_cache_time = None
+                auth_cache.invalidate(self.session_name)
+                self.supervisor.mark_authorized(True)
                 
                 # Проверяем авторизацию
                 if await self.is_authorized():
@@ -221,25 +255,29 @@ class TelegramParser:
             await self.client.check_password(password)
             
             # Очищаем кэш авторизации для принудительной проверки
-            self._auth_cache = None
-            self._auth_cache_time = None
+            auth_cache.invalidate(self.session_name)
+            self.supervisor.mark_authorized(True)
             
             return {"status": "success", "message": "Успешная авторизация"}
         except Exception as e:
             return {"status": "error", "message": f"Неверный пароль: {str(e)}"}
     
     async def is_authorized(self):
-        """Проверить, авторизован ли пользователь"""
+        """Проверить, авторизован ли пользователь (результат кэшируется, чтобы не дергать API)"""
+        # Супервизор держит соединение и знает статус по реальным ответам API - сеть не нужна
+        if self.supervisor.running and self.supervisor.authorized is not None:
+            return self.supervisor.authorized
+
+        authorized = await auth_cache.get_or_load(self.session_name, self._check_authorized)
+        if authorized:
+            self.supervisor.mark_authorized(True)
+            self.supervisor.start()
+        return authorized
+
+    async def _check_authorized(self):
+        """Проверка авторизации через Telegram API"""
         print("🔍 Проверяем статус авторизации...")
         
-        # Используем кэш на 60 секунд для минимизации запросов к API
-        now = datetime.now()
-        if (self._auth_cache is not None and 
-            self._auth_cache_time and 
-            (now - self._auth_cache_time).total_seconds() < 60):
-            print(f"📋 Используем кэшированный статус: {self._auth_cache}")
-            return self._auth_cache
-            
         try:
             if not self.client:
                 await self.initialize_client()
@@ -247,8 +285,6 @@ class TelegramParser:
             # Проверяем, есть ли файл сессии
             session_file = f"sessions/{self.session_name}.session"
             if not os.path.exists(session_file):
-                self._auth_cache = False
-                self._auth_cache_time = now
                 return False
             
             # Если клиент не подключен, пытаемся подключиться
@@ -268,12 +304,8 @@ class TelegramParser:
                             print("✅ Переподключение после переинициализации успешно")
                         except Exception as reinit_error:
                             print(f"❌ Ошибка переинициализации клиента: {reinit_error}")
-                            self._auth_cache = False
-                            self._auth_cache_time = now
                             return False
                     else:
-                        self._auth_cache = False
-                        self._auth_cache_time = now
                         return False
             
             # Проверяем авторизацию через API запрос с повторными попытками
@@ -283,12 +315,8 @@ class TelegramParser:
                     me = await self.client.get_me()
                     if me is not None:
                         print(f"✅ Пользователь авторизован: {me.first_name if hasattr(me, 'first_name') else 'Unknown'}")
-                        self._auth_cache = True
-                        self._auth_cache_time = now
                         return True
                     print("❌ get_me() вернул None")
-                    self._auth_cache = False
-                    self._auth_cache_time = now
                     return False
                 except Exception as e:
                     error_str = str(e)
@@ -307,8 +335,6 @@ class TelegramParser:
                     if any(err in error_str for err in session_errors):
                         print(f"🗑️ Обнаружена проблема с сессией ({error_str}), удаляем файл...")
                         await self._reset_session()
-                        self._auth_cache = False
-                        self._auth_cache_time = now
                         return False
                     
                     # Обработка проблем с подключением
@@ -338,14 +364,10 @@ class TelegramParser:
                         await asyncio.sleep(1)
                     else:
                         print(f"❌ Все попытки исчерпаны. Последняя ошибка: {error_str}")
-                        self._auth_cache = False
-                        self._auth_cache_time = now
                         return False
                         
         except Exception as e:
             print(f"Критическая ошибка проверки авторизации: {e}")
-            self._auth_cache = False
-            self._auth_cache_time = now
             return False
     
     async def get_user_channels(self):
@@ -438,33 +460,30 @@ class TelegramParser:
             print(f"Ошибка получения информации о канале {channel_id}: {e}")
             return None
 
+    @traced("telegram.quick_check_new_posts", lambda self, channel_id, *args, **kwargs: {"channel_id": channel_id})
     async def quick_check_new_posts(self, channel_id: str, last_date_in_db=None):
         """Быстрая проверка наличия новых постов в канале по дате последнего сообщения"""
+        return await quick_check_cache.get_or_load(
+            (self.session_name, channel_id),
+            lambda: self._quick_check(channel_id, last_date_in_db)
+        )
+
+    async def _quick_check(self, channel_id: str, last_date_in_db=None):
+        """Запрос последнего сообщения канала для quick_check_new_posts"""
         try:
-            # Проверяем кэш быстрых проверок (60 секунд на канал)
-            now = datetime.now()
-            if (channel_id in self._quick_check_cache and 
-                channel_id in self._quick_check_cache_time and
-                (now - self._quick_check_cache_time[channel_id]).total_seconds() < 60):
-                cached_result = self._quick_check_cache[channel_id]
-                print(f"📋 Используем кэшированный результат для канала {channel_id}: {cached_result.get('has_new_posts', False)}")
-                return cached_result
-            
             if not self.client:
                 await self.initialize_client()
             
             # Проверяем авторизацию
             if not await self.is_authorized():
                 result = {"status": "error", "message": "Не авторизован в Telegram"}
-                self._quick_check_cache[channel_id] = result
-                self._quick_check_cache_time[channel_id] = now
                 return result
             
             # Убеждаемся, что клиент подключен
             if not self.client.is_connected:
                 await self.client.connect()
             
-            print(f"🔍 Быстрая проверка канала {channel_id}")
+            logger.debug("🔍 Быстрая проверка канала %s", channel_id, extra={"channel_id": channel_id})
             
             # Получаем только последнее сообщение из канала
             try:
@@ -472,76 +491,142 @@ class TelegramParser:
                     latest_message_date = message.date
                     latest_message_id = message.id
                     
-                    print(f"📅 Последнее сообщение в канале: ID={latest_message_id}, дата={latest_message_date}")
+                    logger.debug("📅 Последнее сообщение в канале: ID=%s, дата=%s", latest_message_id, latest_message_date, extra={"channel_id": channel_id})
                     
                     # Если нет данных в БД, считаем что есть новые посты
                     if last_date_in_db is None:
-                        print(f"✅ БД пуста для канала {channel_id}, есть новые посты")
+                        logger.debug("✅ БД пуста для канала %s, есть новые посты", channel_id, extra={"channel_id": channel_id})
                         result = {
                             "status": "success", 
                             "has_new_posts": True,
                             "latest_date": latest_message_date,
                             "latest_message_id": latest_message_id
                         }
-                        self._quick_check_cache[channel_id] = result
-                        self._quick_check_cache_time[channel_id] = now
                         return result
                     
                     # Сравниваем даты
                     if latest_message_date > last_date_in_db:
-                        print(f"✅ Найдены новые посты в канале {channel_id}: {latest_message_date} > {last_date_in_db}")
+                        logger.debug("✅ Найдены новые посты в канале %s: %s > %s", channel_id, latest_message_date, last_date_in_db, extra={"channel_id": channel_id})
                         result = {
                             "status": "success", 
                             "has_new_posts": True,
                             "latest_date": latest_message_date,
                             "latest_message_id": latest_message_id
                         }
-                        self._quick_check_cache[channel_id] = result
-                        self._quick_check_cache_time[channel_id] = now
                         return result
                     else:
-                        print(f"📭 Новых постов нет в канале {channel_id}: {latest_message_date} <= {last_date_in_db}")
+                        logger.debug("📭 Новых постов нет в канале %s: %s <= %s", channel_id, latest_message_date, last_date_in_db, extra={"channel_id": channel_id})
                         result = {
                             "status": "success", 
                             "has_new_posts": False,
                             "latest_date": latest_message_date,
                             "latest_message_id": latest_message_id
                         }
-                        self._quick_check_cache[channel_id] = result
-                        self._quick_check_cache_time[channel_id] = now
                         return result
                 
                 # Если канал пустой
-                print(f"📭 Канал {channel_id} пустой")
+                logger.debug("📭 Канал %s пустой", channel_id, extra={"channel_id": channel_id})
                 result = {"status": "success", "has_new_posts": False}
-                self._quick_check_cache[channel_id] = result
-                self._quick_check_cache_time[channel_id] = now
                 return result
                 
             except Exception as e:
-                print(f"❌ Ошибка получения истории чата {channel_id}: {e}")
+                logger.warning("❌ Ошибка получения истории чата %s: %s", channel_id, e, extra={"channel_id": channel_id})
                 result = {"status": "error", "message": f"Ошибка получения сообщений: {str(e)}"}
-                self._quick_check_cache[channel_id] = result
-                self._quick_check_cache_time[channel_id] = now
                 return result
             
         except Exception as e:
-            print(f"❌ Ошибка быстрой проверки канала {channel_id}: {e}")
+            logger.warning("❌ Ошибка быстрой проверки канала %s: %s", channel_id, e, extra={"channel_id": channel_id})
             result = {"status": "error", "message": f"Ошибка проверки: {str(e)}"}
-            self._quick_check_cache[channel_id] = result
-            self._quick_check_cache_time[channel_id] = now
             return result
-    
+
+    @traced("telegram.bulk_check_new_posts", lambda self, watermarks: {"channels": len(watermarks)})
+    async def bulk_check_new_posts(self, watermarks: dict):
+        """
+        Пакетная проверка новых постов по списку диалогов.
+        watermarks: {channel_id источника: последний message_id в БД (или None)}.
+        Диалоги приходят страницами по 100 вместе с top-сообщением, поэтому
+        проверка всех каналов стоит несколько запросов вместо одного на канал.
+        Каналы, которых нет в диалогах, возвращаются в missing - их нужно
+        проверить через quick_check_new_posts.
+        """
+        try:
+            if not self.client:
+                await self.initialize_client()
+
+            if not await self.is_authorized():
+                return {"status": "error", "message": "Не авторизован в Telegram"}
+
+            if not self.client.is_connected:
+                await self.client.connect()
+
+            # Источник может быть задан как числовым id, так и @username
+            lookup = {}
+            for channel_id in watermarks:
+                key = str(channel_id).strip()
+                lookup[key] = channel_id
+                lookup[key.lstrip('@').lower()] = channel_id
+
+            changed = {}
+            unchanged = []
+            found = set()
+            dialogs_scanned = 0
+
+            async for dialog in self.client.get_dialogs():
+                dialogs_scanned += 1
+                chat = dialog.chat
+                if chat.type.name not in ['CHANNEL', 'SUPERGROUP']:
+                    continue
+
+                channel_id = lookup.get(str(chat.id))
+                if channel_id is None and getattr(chat, 'username', None):
+                    channel_id = lookup.get(chat.username.lower())
+                if channel_id is None or channel_id in found:
+                    continue
+                found.add(channel_id)
+
+                top_message = dialog.top_message
+                last_message_id = watermarks[channel_id]
+                if top_message and (last_message_id is None or top_message.id > last_message_id):
+                    changed[channel_id] = {
+                        "latest_message_id": top_message.id,
+                        "latest_date": top_message.date,
+                    }
+                else:
+                    unchanged.append(channel_id)
+
+                # Все источники найдены - остальные диалоги не нужны
+                if len(found) == len(watermarks):
+                    break
+
+            missing = [channel_id for channel_id in watermarks if channel_id not in found]
+            requests_made = max(1, -(-dialogs_scanned // 100))
+            current_span().set(dialogs=dialogs_scanned, requests=requests_made, changed=len(changed), missing=len(missing))
+            logger.info("📋 Пакетная проверка: %s диалогов (~%s запросов), изменились %s, без изменений %s, нет в диалогах %s",
+                        dialogs_scanned, requests_made, len(changed), len(unchanged), len(missing))
+
+            return {
+                "status": "success",
+                "changed": changed,
+                "unchanged": unchanged,
+                "missing": missing,
+                "dialogs_scanned": dialogs_scanned,
+                "requests": requests_made,
+            }
+
+        except Exception as e:
+            logger.warning("❌ Ошибка пакетной проверки каналов: %s", e)
+            return {"status": "error", "message": f"Ошибка пакетной проверки: {str(e)}"}
+
+    @traced(
+        "telegram.parse_channel_posts",
+        lambda self, channel_id, limit=50, until_date=None, offset=0: {"channel_id": channel_id, "limit": limit, "offset": offset},
+    )
     async def parse_channel_posts(self, channel_id: str, limit: int = 50, until_date=None, offset: int = 0):
         """Парсинг постов из канала"""
-        print(f"🔄 Начинаем парсинг канала {channel_id} с лимитом {limit}")
-        print(f"🔍 until_date = {until_date} (тип: {type(until_date).__name__})")
-        if until_date:
-            print(f"⏰ Парсим до даты: {until_date}")
-        else:
-            print(f"⏰ Парсим БЕЗ ограничений по дате")
-        if offset > 0:
-            print(f"⏭️ Пропускаем первые {offset} постов")
+        log_extra = {"channel_id": channel_id}
+        started = time.perf_counter()
+        logger.debug("🔄 Начинаем парсинг канала %s: limit=%s, offset=%s, until_date=%s",
+                     channel_id, limit, offset, until_date, extra=log_extra)
         
         try:
             if not self.client:
@@ -549,35 +634,36 @@ class TelegramParser:
             
             # Проверяем авторизацию
             if not await self.is_authorized():
-                print(f"❌ Не авторизован в Telegram для канала {channel_id}")
+                logger.warning("❌ Не авторизован в Telegram для канала %s", channel_id, extra=log_extra)
                 return {"status": "error", "message": "Не авторизован в Telegram"}
             
             # Убеждаемся, что клиент подключен
             if not self.client.is_connected:
-                print(f"🔌 Подключаемся к Telegram...")
+                logger.info("🔌 Подключаемся к Telegram...")
                 await self.client.connect()
             
             posts_data = []
             processed_albums = set()  # Отслеживаем обработанные альбомы
             
             # Получаем информацию о канале
-            print(f"📋 Получаем информацию о канале {channel_id}")
             channel_info = await self.get_channel_info(channel_id)
             if not channel_info:
-                print(f"❌ Канал {channel_id} не найден")
+                logger.warning("❌ Канал %s не найден", channel_id, extra=log_extra)
                 return {"status": "error", "message": f"Канал {channel_id} не найден"}
             
-            print(f"✅ Канал найден: {channel_info.get('title', 'Без названия')}")
+            logger.debug("✅ Канал найден: %s", channel_info.get('title', 'Без названия'), extra=log_extra)
             
             # Создаем папку для медиа файлов (используем абсолютный путь)
             media_dir = os.path.abspath(f"../frontend/public/media/{channel_id.replace('-', '')}")
             os.makedirs(media_dir, exist_ok=True)
-            print(f"📁 Создана папка для медиа: {media_dir}")
             
             # Парсим сообщения
             message_count = 0
             skipped_count = 0
-            print(f"📥 Начинаем получение сообщений из канала {channel_id}")
+            # Счетчики для итоговой строки лога вместо строки на каждое сообщение
+            older_count = 0
+            empty_count = 0
+            media_count = 0
             
             try:
                 # Увеличиваем лимит на offset чтобы получить нужные посты после пропуска
@@ -589,20 +675,19 @@ class TelegramParser:
                         # Пропускаем первые offset сообщений
                         if skipped_count < offset:
                             skipped_count += 1
-                            print(f"⏭️ Пропускаем сообщение {skipped_count}/{offset}: {message.id}")
                             continue
                         
                         # Если уже набрали нужное количество постов, прерываем
                         if len(posts_data) >= limit:
-                            print(f"🔢 Достигнут лимит {limit} постов, прерываем парсинг")
+                            logger.debug("🔢 Достигнут лимит %s постов, прерываем парсинг", limit, extra=log_extra)
                             break
                         
                         # Оптимизация: пропускаем посты старше until_date (если указана)
                         if until_date is not None and message.date <= until_date:
-                            print(f"⏰ Пропускаем пост {message.id} (дата {message.date} <= {until_date})")
+                            older_count += 1
                             continue
                         
-                        print(f"📝 Обрабатываем сообщение {len(posts_data)+1}/{limit}: {message.id}")
+                        logger.debug("📝 Обрабатываем сообщение %s/%s: %s", len(posts_data) + 1, limit, message.id, extra=log_extra)
                         
                         # Получаем текст сообщения
                         text = message.text or message.caption or ""
@@ -610,7 +695,7 @@ class TelegramParser:
                         # Обрабатываем альбомы (группы медиа)
                         if hasattr(message, 'media_group_id') and message.media_group_id:
                             if message.media_group_id not in processed_albums:
-                                print(f"🎞️ Обрабатываем альбом: {message.media_group_id}")
+                                logger.debug("🎞️ Обрабатываем альбом: %s", message.media_group_id, extra=log_extra)
                                 album_posts = await self._parse_album(message, channel_info, media_dir, channel_id)
                                 posts_data.extend(album_posts)
                                 processed_albums.add(message.media_group_id)
@@ -621,7 +706,7 @@ class TelegramParser:
                         
                         # Включаем посты только с текстом, даже без медиа
                         if not text.strip() and not media_info:
-                            print(f"⏭️ Пропускаем пустое сообщение {message.id}")
+                            empty_count += 1
                             continue
                         
                         post_data = {
@@ -645,17 +730,27 @@ class TelegramParser:
                             })
                         
                         posts_data.append(post_data)
-                        print(f"✅ Добавлен пост {message.id}, текст: {len(text)} символов, медиа: {media_info.get('type') if media_info else 'нет'}")
+                        if media_info:
+                            media_count += 1
+                        logger.debug("✅ Добавлен пост %s, текст: %s символов, медиа: %s", message.id, len(text),
+                                     media_info.get('type') if media_info else 'нет', extra=log_extra)
                         
                     except Exception as e:
-                        print(f"❌ Ошибка обработки сообщения {message.id}: {e}")
+                        logger.warning("❌ Ошибка обработки сообщения %s: %s", message.id, e, extra=log_extra)
                         continue
                         
             except Exception as e:
-                print(f"❌ Ошибка при получении истории чата {channel_id}: {e}")
+                logger.warning("❌ Ошибка при получении истории чата %s: %s", channel_id, e, extra=log_extra)
                 return {"status": "error", "message": f"Ошибка получения сообщений: {str(e)}"}
                 
-            print(f"🎯 Парсинг завершен! Обработано {len(posts_data)} постов из {message_count} сообщений")
+            MESSAGES_SCANNED.inc(channel_info["id"], amount=message_count)
+            current_span().set(message_count=message_count, posts=len(posts_data))
+            logger.info(
+                "🎯 Парсинг %s завершен за %.2fс: %s постов из %s сообщений (альбомов %s, с медиа %s, пропущено: offset %s, старых %s, пустых %s)",
+                channel_id, time.perf_counter() - started, len(posts_data), message_count, len(processed_albums),
+                media_count, skipped_count, older_count, empty_count,
+                extra={**log_extra, "posts": len(posts_data), "messages": message_count},
+            )
             
             return {
                 "status": "success", 
@@ -666,15 +761,15 @@ class TelegramParser:
             
         except FloodWait as e:
             wait_time = e.value
-            print(f"⏳ Rate limit от Telegram: нужно подождать {wait_time} секунд")
+            logger.warning("⏳ Rate limit от Telegram: нужно подождать %s секунд", wait_time, extra=log_extra)
             if wait_time <= 60:  # Ждем только если меньше минуты
-                print(f"⏱️ Ждем {wait_time} секунд...")
+                TELEGRAM_FLOOD_WAIT_SLEPT.inc(amount=wait_time)
                 await asyncio.sleep(wait_time)
                 # Повторяем попытку парсинга после ожидания
                 try:
                     return await self.parse_channel_posts(channel_id, limit, until_date, offset)
                 except Exception as retry_error:
-                    print(f"❌ Ошибка повторной попытки: {retry_error}")
+                    logger.error("❌ Ошибка повторной попытки: %s", retry_error, extra=log_extra)
                     return {"status": "error", "message": f"Ошибка после ожидания rate limit: {str(retry_error)}"}
             else:
                 return {"status": "error", "message": f"Rate limit слишком большой: {wait_time} секунд"}
@@ -682,7 +777,7 @@ class TelegramParser:
             return {"status": "error", "message": "Нет доступа к каналу"}
         except Exception as e:
             error_str = str(e)
-            print(f"❌ Критическая ошибка парсинга канала {channel_id}: {error_str}")
+            logger.error("❌ Критическая ошибка парсинга канала %s: %s", channel_id, error_str, extra=log_extra)
             
             # Проверяем, связана ли ошибка с авторизацией
             auth_errors = [
@@ -693,14 +788,33 @@ class TelegramParser:
             ]
             
             if any(err in error_str for err in auth_errors):
-                print(f"🔄 Обнаружена ошибка авторизации при парсинге: {error_str}")
+                logger.warning("🔄 Обнаружена ошибка авторизации при парсинге: %s", error_str, extra=log_extra)
                 # Сбрасываем кэш авторизации
-                self._auth_cache = None
-                self._auth_cache_time = None
+                auth_cache.invalidate(self.session_name)
+                self.supervisor.report_error(e)
                 return {"status": "error", "message": f"Потеря авторизации: {error_str}"}
             
             return {"status": "error", "message": f"Ошибка парсинга: {error_str}"}
 
+    async def _download_media(self, media, file_name: str, media_type: str):
+        """download_media с учетом длительности и объема скачанного в метриках"""
+        started = time.perf_counter()
+        with span("telegram.download_media", media_type=media_type) as download_span:
+            try:
+                file_path = await self.client.download_media(media, file_name=file_name)
+            except Exception:
+                MEDIA_DOWNLOAD_ERRORS.inc(media_type)
+                raise
+            MEDIA_DOWNLOAD_SECONDS.observe(time.perf_counter() - started, media_type)
+            if file_path and os.path.exists(file_path):
+                size = os.path.getsize(file_path)
+                MEDIA_DOWNLOAD_BYTES.inc(media_type, amount=size)
+                download_span.set(bytes=size)
+            else:
+                MEDIA_DOWNLOAD_ERRORS.inc(media_type)
+            return file_path
+
+    @traced("telegram.parse_media", lambda self, message, media_dir, channel_id: {"channel_id": channel_id, "message_id": message.id})
     async def _parse_media(self, message: Message, media_dir: str, channel_id: str):
         """Парсинг и скачивание медиа из сообщения"""
         try:
@@ -710,9 +824,10 @@ class TelegramParser:
             if message.photo:
                 # Фото
                 try:
-                    file_path = await self.client.download_media(
+                    file_path = await self._download_media(
                         message.photo,
-                        file_name=f"{media_dir}/photo_{message.id}.jpg"
+                        f"{media_dir}/photo_{message.id}.jpg",
+                        "photo"
                     )
                     if file_path and os.path.exists(file_path) and os.path.getsize(file_path) > 0:
                         media_info = {
@@ -723,15 +838,15 @@ class TelegramParser:
                             "height": getattr(message.photo, 'height', None),
                             "size": getattr(message.photo, 'file_size', None)
                         }
-                        print(f"Скачано фото: {file_path}, размер файла: {os.path.getsize(file_path)} байт")
+                        logger.debug("Скачано фото: %s, размер файла: %s байт", file_path, os.path.getsize(file_path), extra={"channel_id": channel_id})
                     else:
-                        print(f"Ошибка скачивания фото {message.id}: файл не создан или пустой")
+                        logger.warning("Ошибка скачивания фото %s: файл не создан или пустой", message.id, extra={"channel_id": channel_id})
                         # Удаляем неудачный файл если он существует
                         temp_file = f"{media_dir}/photo_{message.id}.jpg"
                         if os.path.exists(temp_file):
                             os.remove(temp_file)
                 except Exception as e:
-                    print(f"Ошибка скачивания фото {message.id}: {e}")
+                    logger.warning("Ошибка скачивания фото %s: %s", message.id, e, extra={"channel_id": channel_id})
                 
             elif message.video:
                 # Видео
@@ -742,11 +857,12 @@ class TelegramParser:
                         file_extension = ext_map.get(message.video.mime_type, "mp4")
                     
                     video_size = getattr(message.video, 'file_size', 0)
-                    print(f"Начинаю скачивание видео {message.id}, ожидаемый размер: {video_size} байт")
+                    logger.debug("Начинаю скачивание видео %s, ожидаемый размер: %s байт", message.id, video_size, extra={"channel_id": channel_id})
                     
-                    file_path = await self.client.download_media(
+                    file_path = await self._download_media(
                         message.video,
-                        file_name=f"{media_dir}/video_{message.id}.{file_extension}"
+                        f"{media_dir}/video_{message.id}.{file_extension}",
+                        "video"
                     )
                     if file_path and os.path.exists(file_path) and os.path.getsize(file_path) > 0:
                         actual_size = os.path.getsize(file_path)
@@ -759,22 +875,23 @@ class TelegramParser:
                             "height": getattr(message.video, 'height', None),
                             "size": video_size
                         }
-                        print(f"Скачано видео: {file_path}, размер файла: {actual_size} байт")
+                        logger.debug("Скачано видео: %s, размер файла: %s байт", file_path, actual_size, extra={"channel_id": channel_id})
                     else:
-                        print(f"Ошибка скачивания видео {message.id}: файл не создан или пустой")
+                        logger.warning("Ошибка скачивания видео %s: файл не создан или пустой", message.id, extra={"channel_id": channel_id})
                         # Удаляем неудачный файл если он существует
                         temp_file = f"{media_dir}/video_{message.id}.{file_extension}"
                         if os.path.exists(temp_file):
                             os.remove(temp_file)
                 except Exception as e:
-                    print(f"Ошибка скачивания видео {message.id}: {e}")
+                    logger.warning("Ошибка скачивания видео %s: %s", message.id, e, extra={"channel_id": channel_id})
                 
             elif message.animation:
                 # GIF анимация
                 try:
-                    file_path = await self.client.download_media(
+                    file_path = await self._download_media(
                         message.animation,
-                        file_name=f"{media_dir}/animation_{message.id}.gif"
+                        f"{media_dir}/animation_{message.id}.gif",
+                        "animation"
                     )
                     if file_path and os.path.exists(file_path) and os.path.getsize(file_path) > 0:
                         media_info = {
@@ -786,21 +903,22 @@ class TelegramParser:
                             "height": getattr(message.animation, 'height', None),
                             "size": getattr(message.animation, 'file_size', None)
                         }
-                        print(f"Скачана анимация: {file_path}, размер файла: {os.path.getsize(file_path)} байт")
+                        logger.debug("Скачана анимация: %s, размер файла: %s байт", file_path, os.path.getsize(file_path), extra={"channel_id": channel_id})
                     else:
-                        print(f"Ошибка скачивания анимации {message.id}: файл не создан или пустой")
+                        logger.warning("Ошибка скачивания анимации %s: файл не создан или пустой", message.id, extra={"channel_id": channel_id})
                         temp_file = f"{media_dir}/animation_{message.id}.gif"
                         if os.path.exists(temp_file):
                             os.remove(temp_file)
                 except Exception as e:
-                    print(f"Ошибка скачивания анимации {message.id}: {e}")
+                    logger.warning("Ошибка скачивания анимации %s: %s", message.id, e, extra={"channel_id": channel_id})
                 
             elif message.voice:
                 # Голосовое сообщение
                 try:
-                    file_path = await self.client.download_media(
+                    file_path = await self._download_media(
                         message.voice,
-                        file_name=f"{media_dir}/voice_{message.id}.ogg"
+                        f"{media_dir}/voice_{message.id}.ogg",
+                        "voice"
                     )
                     if file_path and os.path.exists(file_path) and os.path.getsize(file_path) > 0:
                         media_info = {
@@ -810,14 +928,14 @@ class TelegramParser:
                             "duration": getattr(message.voice, 'duration', None),
                             "size": getattr(message.voice, 'file_size', None)
                         }
-                        print(f"Скачано голосовое: {file_path}, размер файла: {os.path.getsize(file_path)} байт")
+                        logger.debug("Скачано голосовое: %s, размер файла: %s байт", file_path, os.path.getsize(file_path), extra={"channel_id": channel_id})
                     else:
-                        print(f"Ошибка скачивания голосового {message.id}: файл не создан или пустой")
+                        logger.warning("Ошибка скачивания голосового %s: файл не создан или пустой", message.id, extra={"channel_id": channel_id})
                         temp_file = f"{media_dir}/voice_{message.id}.ogg"
                         if os.path.exists(temp_file):
                             os.remove(temp_file)
                 except Exception as e:
-                    print(f"Ошибка скачивания голосового {message.id}: {e}")
+                    logger.warning("Ошибка скачивания голосового %s: %s", message.id, e, extra={"channel_id": channel_id})
                 
             elif message.audio:
                 # Аудио файл
@@ -827,9 +945,10 @@ class TelegramParser:
                         ext_map = {"audio/mpeg": "mp3", "audio/mp4": "m4a", "audio/ogg": "ogg"}
                         file_extension = ext_map.get(message.audio.mime_type, "mp3")
                     
-                    file_path = await self.client.download_media(
+                    file_path = await self._download_media(
                         message.audio,
-                        file_name=f"{media_dir}/audio_{message.id}.{file_extension}"
+                        f"{media_dir}/audio_{message.id}.{file_extension}",
+                        "audio"
                     )
                     if file_path and os.path.exists(file_path) and os.path.getsize(file_path) > 0:
                         media_info = {
@@ -841,14 +960,14 @@ class TelegramParser:
                             "performer": getattr(message.audio, 'performer', None),
                             "size": getattr(message.audio, 'file_size', None)
                         }
-                        print(f"Скачано аудио: {file_path}, размер файла: {os.path.getsize(file_path)} байт")
+                        logger.debug("Скачано аудио: %s, размер файла: %s байт", file_path, os.path.getsize(file_path), extra={"channel_id": channel_id})
                     else:
-                        print(f"Ошибка скачивания аудио {message.id}: файл не создан или пустой")
+                        logger.warning("Ошибка скачивания аудио %s: файл не создан или пустой", message.id, extra={"channel_id": channel_id})
                         temp_file = f"{media_dir}/audio_{message.id}.{file_extension}"
                         if os.path.exists(temp_file):
                             os.remove(temp_file)
                 except Exception as e:
-                    print(f"Ошибка скачивания аудио {message.id}: {e}")
+                    logger.warning("Ошибка скачивания аудио %s: %s", message.id, e, extra={"channel_id": channel_id})
                 
             elif message.document:
                 # Документ
@@ -857,9 +976,10 @@ class TelegramParser:
                     # Убираем небезопасные символы из имени файла
                     safe_file_name = "".join(c for c in file_name if c.isalnum() or c in ".-_").rstrip()
                     
-                    file_path = await self.client.download_media(
+                    file_path = await self._download_media(
                         message.document,
-                        file_name=f"{media_dir}/{safe_file_name}"
+                        f"{media_dir}/{safe_file_name}",
+                        "document"
                     )
                     if file_path and os.path.exists(file_path) and os.path.getsize(file_path) > 0:
                         media_info = {
@@ -869,14 +989,14 @@ class TelegramParser:
                             "mime_type": getattr(message.document, 'mime_type', None),
                             "size": getattr(message.document, 'file_size', None)
                         }
-                        print(f"Скачан документ: {file_path}, размер файла: {os.path.getsize(file_path)} байт")
+                        logger.debug("Скачан документ: %s, размер файла: %s байт", file_path, os.path.getsize(file_path), extra={"channel_id": channel_id})
                     else:
-                        print(f"Ошибка скачивания документа {message.id}: файл не создан или пустой")
+                        logger.warning("Ошибка скачивания документа %s: файл не создан или пустой", message.id, extra={"channel_id": channel_id})
                         temp_file = f"{media_dir}/{safe_file_name}"
                         if os.path.exists(temp_file):
                             os.remove(temp_file)
                 except Exception as e:
-                    print(f"Ошибка скачивания документа {message.id}: {e}")
+                    logger.warning("Ошибка скачивания документа %s: %s", message.id, e, extra={"channel_id": channel_id})
                 
             elif message.sticker:
                 # Стикер
@@ -887,9 +1007,10 @@ class TelegramParser:
                     elif hasattr(message.sticker, 'is_video') and message.sticker.is_video:
                         file_extension = "webm"
                         
-                    file_path = await self.client.download_media(
+                    file_path = await self._download_media(
                         message.sticker,
-                        file_name=f"{media_dir}/sticker_{message.id}.{file_extension}"
+                        f"{media_dir}/sticker_{message.id}.{file_extension}",
+                        "sticker"
                     )
                     if file_path and os.path.exists(file_path) and os.path.getsize(file_path) > 0:
                         media_info = {
@@ -901,25 +1022,29 @@ class TelegramParser:
                             "emoji": getattr(message.sticker, 'emoji', None),
                             "size": getattr(message.sticker, 'file_size', None)
                         }
-                        print(f"Скачан стикер: {file_path}, размер файла: {os.path.getsize(file_path)} байт")
+                        logger.debug("Скачан стикер: %s, размер файла: %s байт", file_path, os.path.getsize(file_path), extra={"channel_id": channel_id})
                     else:
-                        print(f"Ошибка скачивания стикера {message.id}: файл не создан или пустой")
+                        logger.warning("Ошибка скачивания стикера %s: файл не создан или пустой", message.id, extra={"channel_id": channel_id})
                         temp_file = f"{media_dir}/sticker_{message.id}.{file_extension}"
                         if os.path.exists(temp_file):
                             os.remove(temp_file)
                 except Exception as e:
-                    print(f"Ошибка скачивания стикера {message.id}: {e}")
+                    logger.warning("Ошибка скачивания стикера %s: %s", message.id, e, extra={"channel_id": channel_id})
             
             return media_info
             
         except Exception as e:
-            print(f"Критическая ошибка скачивания медиа для сообщения {message.id}: {e}")
+            logger.error("Критическая ошибка скачивания медиа для сообщения %s: %s", message.id, e, extra={"channel_id": channel_id})
             return None
 
+    @traced(
+        "telegram.parse_album",
+        lambda self, message, channel_info, media_dir, channel_id: {"channel_id": channel_id, "album_id": message.media_group_id},
+    )
     async def _parse_album(self, message: Message, channel_info: dict, media_dir: str, channel_id: str):
         """Парсинг альбома (группы медиа файлов)"""
         try:
-            print(f"Начинаем парсинг альбома {message.media_group_id}")
+            logger.debug("Начинаем парсинг альбома %s", message.media_group_id, extra={"channel_id": channel_id})
             
             # Получаем все сообщения из альбома
             album_messages = []
@@ -936,7 +1061,7 @@ class TelegramParser:
             
             # Сортируем по ID сообщения
             album_messages.sort(key=lambda x: x.id)
-            print(f"Найдено {len(album_messages)} элементов в альбоме")
+            logger.debug("Найдено %s элементов в альбоме", len(album_messages), extra={"channel_id": channel_id})
             
             # Создаем посты для каждого элемента альбома
             album_posts = []
@@ -975,22 +1100,60 @@ class TelegramParser:
                     })
                 
                 album_posts.append(post_data)
-                print(f"Добавлен элемент альбома {i+1}/{len(album_messages)}: {msg.id}")
+                logger.debug("Добавлен элемент альбома %s/%s: %s", i+1, len(album_messages), msg.id, extra={"channel_id": channel_id})
             
-            print(f"Альбом {message.media_group_id} обработан: {len(album_posts)} элементов")
+            logger.debug("Альбом %s обработан: %s элементов", message.media_group_id, len(album_posts), extra={"channel_id": channel_id})
+            current_span().set(album_items=len(album_posts))
             return album_posts
             
         except Exception as e:
-            print(f"Ошибка обработки альбома {message.media_group_id}: {e}")
+            logger.warning("Ошибка обработки альбома %s: %s", message.media_group_id, e, extra={"channel_id": channel_id})
             return []
     
-    async def parse_all_sources(self, db: Session):
+    async def redownload_media(self, channel_id: str, message_id: int):
+        """Повторно скачивает медиа одного сообщения; сохранение в БД остается за вызывающим"""
+        try:
+            channel_info = await self.get_channel_info(channel_id)
+            if not channel_info:
+                return {"status": "not_found", "message": f"Канал {channel_id} не найден или недоступен"}
+            
+            # Создаем папку для медиа файлов
+            media_dir = os.path.abspath(f"../frontend/public/media/{channel_id.replace('-', '')}")
+            os.makedirs(media_dir, exist_ok=True)
+            
+            if not self.client.is_connected:
+                await self.client.connect()
+            
+            # Используем get_messages для получения конкретного сообщения
+            messages = await self.client.get_messages(channel_id, message_ids=[message_id])
+            if not messages or not messages[0]:
+                return {"status": "not_found", "message": f"Сообщение {message_id} не найдено"}
+            
+            media_info = await self._parse_media(messages[0], media_dir, channel_id)
+            return {"status": "success", "media_info": media_info}
+        except Exception as e:
+            return {"status": "error", "message": f"Ошибка получения сообщения: {str(e)}"}
+
+    async def get_status(self):
+        """Диагностика клиента без обращения к сети"""
+        return {
+            "session_name": self.session_name,
+            "session_file_exists": os.path.exists(f"sessions/{self.session_name}.session"),
+            "client_connected": self.client.is_connected if self.client else False,
+            "client_initialized": self._initialized,
+            "connection": self.supervisor.snapshot(),
+        }
+
+    async def parse_all_sources(self, db: AsyncSession):
         """Парсинг всех активных источников"""
         if not await self.is_authorized():
             return {"status": "error", "message": "Не авторизован в Telegram"}
         
         # Получаем активные источники
-        sources = db.query(Source).filter(Source.is_active == True).all()
+        # Берем колонки, а не объекты: после rollback объекты истекают, а ленивая загрузка в async недоступна
+        sources = (await db.execute(
+            select(Source.channel_id, Source.channel_name).where(Source.is_active == True)
+        )).all()
         if not sources:
             return {"status": "error", "message": "Нет активных источников для парсинга"}
         
@@ -1010,41 +1173,43 @@ class TelegramParser:
                     for post_data in posts_data:
                         try:
                             # Проверяем, не существует ли уже этот пост
-                            existing_post = db.query(Post).filter(
+                            existing_post = (await db.execute(select(Post.id).where(
                                 Post.channel_id == post_data["channel_id"],
                                 Post.message_id == post_data["message_id"]
-                            ).first()
+                            ))).first()
                             
                             if not existing_post:
                                 new_post = Post(**post_data)
-                                db.add(new_post)
+                                add_ingested_post(db, new_post)
                                 new_posts += 1
                         except Exception as e:
-                            print(f"Ошибка при сохранении поста {post_data.get('message_id', 'unknown')} из канала {source.channel_name}: {e}")
+                            logger.warning("Ошибка при сохранении поста %s из канала %s: %s", post_data.get('message_id', 'unknown'),
+                                           source.channel_name, e, extra={"channel_id": source.channel_id})
                             continue
                     
                     try:
-                        db.commit()
+                        await db.commit()
                     except Exception as e:
-                        print(f"Ошибка при коммите для канала {source.channel_name}: {e}")
-                        db.rollback()
+                        logger.warning("Ошибка при коммите для канала %s: %s", source.channel_name, e, extra={"channel_id": source.channel_id})
+                        await db.rollback()
                         # Пытаемся сохранить посты по одному
                         new_posts = 0
                         for post_data in posts_data:
                             try:
-                                existing_post = db.query(Post).filter(
+                                existing_post = (await db.execute(select(Post.id).where(
                                     Post.channel_id == post_data["channel_id"],
                                     Post.message_id == post_data["message_id"]
-                                ).first()
+                                ))).first()
                                 
                                 if not existing_post:
                                     new_post = Post(**post_data)
-                                    db.add(new_post)
-                                    db.commit()
+                                    add_ingested_post(db, new_post)
+                                    await db.commit()
                                     new_posts += 1
                             except Exception as post_error:
-                                print(f"Ошибка при сохранении поста {post_data.get('message_id', 'unknown')} из канала {source.channel_name}: {post_error}")
-                                db.rollback()
+                                logger.warning("Ошибка при сохранении поста %s из канала %s: %s", post_data.get('message_id', 'unknown'),
+                                               source.channel_name, post_error, extra={"channel_id": source.channel_id})
+                                await db.rollback()
                                 continue
                     
                     total_posts += new_posts
@@ -1079,13 +1244,16 @@ class TelegramParser:
             "results": results
         }
     
-    async def parse_all_sources_limited(self, db: Session, limit: int = 5):
+    async def parse_all_sources_limited(self, db: AsyncSession, limit: int = 5):
         """Ограниченный парсинг всех активных источников (только указанное количество постов)"""
         if not await self.is_authorized():
             return {"status": "error", "message": "Не авторизован в Telegram"}
         
         # Получаем активные источники
-        sources = db.query(Source).filter(Source.is_active == True).all()
+        # Берем колонки, а не объекты: после rollback объекты истекают, а ленивая загрузка в async недоступна
+        sources = (await db.execute(
+            select(Source.channel_id, Source.channel_name).where(Source.is_active == True)
+        )).all()
         if not sources:
             return {"status": "error", "message": "Нет активных источников для парсинга"}
         
@@ -1109,21 +1277,23 @@ class TelegramParser:
                             
                         try:
                             # Проверяем, не существует ли уже этот пост
-                            existing_post = db.query(Post).filter(
+                            existing_post = (await db.execute(select(Post.id).where(
                                 Post.channel_id == post_data["channel_id"],
                                 Post.message_id == post_data["message_id"]
-                            ).first()
+                            ))).first()
                             
                             if not existing_post:
                                 new_post = Post(**post_data)
-                                db.add(new_post)
-                                db.commit()  # Коммитим сразу для потоковой загрузки
+                                add_ingested_post(db, new_post)
+                                await db.commit()  # Коммитим сразу для потоковой загрузки
                                 new_posts += 1
                                 posts_found += 1
-                                print(f"💾 Сохранен пост {post_data.get('message_id')} из {source.channel_name}")
+                                logger.debug("💾 Сохранен пост %s из %s", post_data.get('message_id'), source.channel_name,
+                                             extra={"channel_id": source.channel_id})
                         except Exception as e:
-                            print(f"Ошибка при сохранении поста {post_data.get('message_id', 'unknown')}: {e}")
-                            db.rollback()
+                            logger.warning("Ошибка при сохранении поста %s: %s", post_data.get('message_id', 'unknown'), e,
+                                           extra={"channel_id": source.channel_id})
+                            await db.rollback()
                             continue
                     
                     total_posts += new_posts
@@ -1164,6 +1334,8 @@ class TelegramParser:
     
     async def stop(self):
         """Безопасно остановить клиент"""
+        # Сначала супервизор, иначе он тут же переподключит клиент
+        await self.supervisor.stop()
         try:
             if self.client and hasattr(self.client, 'is_connected'):
                 if self.client.is_connected:
@@ -1183,6 +1355,7 @@ class TelegramParser:
 
     async def _reset_session(self):
         """Внутренний метод для сброса сессии при ошибках"""
+        self.supervisor.mark_authorized(False)
         try:
             # Останавливаем клиент
             if self.client and hasattr(self.client, 'is_connected'):
@@ -1210,12 +1383,14 @@ class TelegramParser:
         except Exception as e:
             print(f"❌ Ошибка при сбросе сессии: {e}")
 
+    def _clear_caches(self):
+        """Сбрасывает закэшированные авторизацию и быстрые проверки этой сессии"""
+        auth_cache.invalidate(self.session_name)
+        quick_check_cache.invalidate_where(lambda key: key[0] == self.session_name)
+
     def clear_auth_cache(self):
         """Очистить кэш авторизации (БЕЗ удаления файла сессии)"""
-        self._auth_cache = None
-        self._auth_cache_time = None
-        self._quick_check_cache.clear()
-        self._quick_check_cache_time.clear()
+        self._clear_caches()
         print("🗑️ Кэш авторизации и быстрых проверок очищен")
         
         # НЕ удаляем файл сессии здесь - это должно происходить только при явном выходе
@@ -1228,10 +1403,7 @@ class TelegramParser:
             await self.stop()
             
             # Очищаем кэш
-            self._auth_cache = None
-            self._auth_cache_time = None
-            self._quick_check_cache.clear()
-            self._quick_check_cache_time.clear()
+            self._clear_caches()
             
             # Удаляем файл сессии
             session_file = f"sessions/{self.session_name}.session"
@@ -0,0 +1,156 @@
+import os
+import time
+import random
+import asyncio
+from datetime import datetime
+from typing import Optional
+from pyrogram import raw
+
+from tracing import background_task
+
+# Ошибки, после которых сессия недействительна и переподключение не поможет
+SESSION_ERRORS = [
+    "AUTH_KEY_UNREGISTERED",
+    "AUTH_KEY_INVALID",
+    "SESSION_REVOKED",
+    "USER_DEACTIVATED",
+    "SESSION_EXPIRED",
+]
+
+class ConnectionSupervisor:
+    """
+    Следит за соединением одного аккаунта: подключает и переподключает клиент с backoff,
+    шлет keepalive-запросы и запоминает статус авторизации по реальным ответам API.
+    Горячие эндпоинты читают этот статус из памяти вместо get_me() на каждый запрос.
+    """
+
+    def __init__(self, parser, ping_interval: Optional[float] = None, max_backoff: Optional[float] = None):
+        self.parser = parser
+        self.ping_interval = ping_interval or float(os.getenv('TELEGRAM_PING_INTERVAL', '30'))
+        self.max_backoff = max_backoff or float(os.getenv('TELEGRAM_RECONNECT_MAX_BACKOFF', '60'))
+        self.state = "stopped"  # stopped, connecting, connected, disconnected, unauthorized
+        self.authorized: Optional[bool] = None  # None - еще не знаем
+        self.last_error: Optional[str] = None
+        self.last_ping_at: Optional[datetime] = None
+        self.last_ping_ms: Optional[float] = None
+        self.connected_since: Optional[datetime] = None
+        self.reconnects = 0
+        self._auth_changed = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        if not self.running:
+            self._task = background_task(self._run())
+            print(f"🛰️ Запущен супервизор соединения для {self.parser.session_name}")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.state = "stopped"
+        self.connected_since = None
+
+    def mark_authorized(self, authorized: bool):
+        """Обновляет статус авторизации (после входа, проверки или ошибки сессии)"""
+        self.authorized = authorized
+        if authorized:
+            self.last_error = None
+            # Будим цикл, если он ждал повторного входа
+            self._auth_changed.set()
+        elif self.state != "stopped":
+            self.state = "unauthorized"
+
+    def report_error(self, error: Exception) -> bool:
+        """Учитывает ошибку вызова API; возвращает True, если сессия больше не действительна"""
+        error_str = str(error)
+        self.last_error = error_str
+        if any(err in error_str for err in SESSION_ERRORS):
+            print(f"🔒 Сессия {self.parser.session_name} недействительна: {error_str}")
+            self.mark_authorized(False)
+            return True
+        return False
+
+    def snapshot(self) -> dict:
+        """Состояние соединения без обращения к сети"""
+        return {
+            "state": self.state,
+            "authorized": self.authorized,
+            "running": self.running,
+            "connected_since": self.connected_since.isoformat() if self.connected_since else None,
+            "last_ping_at": self.last_ping_at.isoformat() if self.last_ping_at else None,
+            "last_ping_ms": self.last_ping_ms,
+            "reconnects": self.reconnects,
+            "last_error": self.last_error,
+        }
+
+    async def _run(self):
+        backoff = 1.0
+        while True:
+            try:
+                if self.authorized is False:
+                    # Без действующей сессии переподключаться бессмысленно - ждем входа
+                    self._auth_changed.clear()
+                    await self._auth_changed.wait()
+                    continue
+
+                await self._ensure_connected()
+                backoff = 1.0
+                await asyncio.sleep(self.ping_interval)
+                await self._ping()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if self.report_error(e):
+                    continue
+                self.state = "disconnected"
+                self.connected_since = None
+                delay = backoff + random.uniform(0, backoff / 2)
+                print(f"🌐 Соединение {self.parser.session_name} потеряно ({e}), переподключение через {delay:.1f}с")
+                await asyncio.sleep(delay)
+                backoff = min(self.max_backoff, backoff * 2)
+
+    async def _ensure_connected(self):
+        """Подключает клиент, если соединения нет, и подтверждает авторизацию одним запросом"""
+        client = self.parser.client
+        if client is not None and client.is_connected and self.state == "connected":
+            return
+
+        self.state = "connecting"
+        if not self.parser.client:
+            await self.parser.initialize_client()
+            client = self.parser.client
+        if not os.path.exists(f"sessions/{self.parser.session_name}.session"):
+            self.mark_authorized(False)
+            return
+
+        reconnected = False
+        if not client.is_connected:
+            await client.connect()
+            reconnected = self.last_ping_at is not None
+
+        me = await client.get_me()
+        self.mark_authorized(me is not None)
+        if me is not None:
+            self.state = "connected"
+            self.connected_since = datetime.now()
+            if reconnected:
+                self.reconnects += 1
+
+    async def _ping(self):
+        """Keepalive: легкий авторизованный запрос, заодно проверяет, что сессия жива"""
+        started = time.perf_counter()
+        await asyncio.wait_for(
+            self.parser.client.invoke(raw.functions.updates.GetState()),
+            timeout=15,
+        )
+        self.last_ping_ms = round((time.perf_counter() - started) * 1000, 1)
+        self.last_ping_at = datetime.now()
+        self.authorized = True
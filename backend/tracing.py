@@ -0,0 +1,352 @@
+import os
+import json
+import asyncio
+import time
+import queue
+import atexit
+import secrets
+import functools
+import threading
+import contextvars
+import urllib.request
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session as OrmSession
+
+from metrics import route_template
+
+# Трассировка этапов обновления ленты: HTTP -> проверка/парсинг канала -> альбомы/медиа -> RPC -> коммит.
+# TRACING_EXPORTER: пусто - выключено (span() ничего не стоит), json - строки JSON в TRACING_FILE,
+# otlp - OTLP/HTTP JSON в локальный коллектор (TRACING_OTLP_ENDPOINT).
+
+TRACING_EXPORTER = os.getenv("TRACING_EXPORTER", "").lower()
+TRACING_FILE = os.getenv("TRACING_FILE", "traces.jsonl")
+TRACING_OTLP_ENDPOINT = os.getenv("TRACING_OTLP_ENDPOINT", "http://localhost:4318/v1/traces")
+TRACING_SERVICE_NAME = os.getenv("TRACING_SERVICE_NAME", "smm-backend")
+
+class Span:
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "kind", "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], kind: str = "internal"):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.kind = kind
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self.attributes = {}
+        self.error: Optional[str] = None
+
+    def set(self, **attributes):
+        for key, value in attributes.items():
+            if value is not None:
+                self.attributes[key] = value
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "kind": self.kind,
+            "start_ns": self.start_ns,
+            "duration_ms": round((self.end_ns - self.start_ns) / 1e6, 3),
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+class _NoopSpan:
+    """Заглушка при выключенной трассировке"""
+    trace_id = None
+
+    def set(self, **attributes):
+        pass
+
+_NOOP_SPAN = _NoopSpan()
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("current_span", default=None)
+
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+_OTLP_KINDS = {"internal": 1, "server": 2, "client": 3}
+
+class Tracer:
+    """Создает спаны и отдает завершенные в фоновый поток экспорта пачками"""
+
+    def __init__(self, exporter: str = TRACING_EXPORTER):
+        self.exporter = exporter if exporter in ("json", "otlp") else ""
+        self._queue: "queue.Queue[Optional[Span]]" = queue.Queue(maxsize=10000)
+        self._worker: Optional[threading.Thread] = None
+        self.dropped = 0
+        if self.exporter:
+            self._worker = threading.Thread(target=self._export_loop, name="trace-exporter", daemon=True)
+            self._worker.start()
+            atexit.register(self.shutdown)
+            print(f"🧵 Трассировка включена: {self.exporter}")
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.exporter)
+
+    def start_span(self, name: str, kind: str = "internal", trace_id: Optional[str] = None,
+                   parent_id: Optional[str] = None, **attributes) -> Span:
+        """Спан - потомок текущего; для обработчиков событий, где нельзя использовать with"""
+        parent = _current_span.get()
+        if parent is not None and trace_id is None:
+            trace_id, parent_id = parent.trace_id, parent.span_id
+        span = Span(name, trace_id or secrets.token_hex(16), parent_id, kind)
+        span.set(**attributes)
+        return span
+
+    def end_span(self, span: Span, error: Optional[str] = None):
+        span.end_ns = time.time_ns()
+        if error:
+            span.error = error
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+
+    @contextmanager
+    def span(self, name: str, kind: str = "internal", trace_id: Optional[str] = None,
+             parent_id: Optional[str] = None, **attributes):
+        if not self.enabled:
+            yield _NOOP_SPAN
+            return
+
+        span = self.start_span(name, kind, trace_id, parent_id, **attributes)
+        token = _current_span.set(span)
+        error = None
+        try:
+            yield span
+        except BaseException as e:
+            error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            _current_span.reset(token)
+            self.end_span(span, error)
+
+    def _export_loop(self):
+        while True:
+            batch = []
+            try:
+                item = self._queue.get(timeout=2)
+            except queue.Empty:
+                continue
+            stop = item is None
+            if item is not None:
+                batch.append(item)
+            while len(batch) < 512 and not stop:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                else:
+                    batch.append(item)
+            if batch:
+                try:
+                    self._export(batch)
+                except Exception as e:
+                    print(f"⚠️ Не удалось выгрузить {len(batch)} спанов: {e}")
+            if stop:
+                return
+
+    def _export(self, batch):
+        if self.exporter == "json":
+            with open(TRACING_FILE, "a", encoding="utf-8") as f:
+                for span in batch:
+                    f.write(json.dumps(span.to_dict(), ensure_ascii=False, default=str) + "\n")
+            return
+
+        payload = {"resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": TRACING_SERVICE_NAME}}]},
+            "scopeSpans": [{
+                "scope": {"name": "smm_web_app"},
+                "spans": [{
+                    "traceId": span.trace_id,
+                    "spanId": span.span_id,
+                    **({"parentSpanId": span.parent_id} if span.parent_id else {}),
+                    "name": span.name,
+                    "kind": _OTLP_KINDS.get(span.kind, 1),
+                    "startTimeUnixNano": str(span.start_ns),
+                    "endTimeUnixNano": str(span.end_ns),
+                    "attributes": [{"key": key, "value": _otlp_value(value)} for key, value in span.attributes.items()],
+                    "status": {"code": 2, "message": span.error} if span.error else {"code": 1},
+                } for span in batch],
+            }],
+        }]}
+        request = urllib.request.Request(
+            TRACING_OTLP_ENDPOINT,
+            data=json.dumps(payload, default=str).encode(),
+            headers={"Content-Type": "application/json"},
+        )
+        urllib.request.urlopen(request, timeout=5).close()
+
+    def shutdown(self):
+        """Дописывает накопленные спаны (вызывается и при выходе процесса)"""
+        if self._worker and self._worker.is_alive():
+            self._queue.put(None)
+            self._worker.join(timeout=5)
+
+tracer = Tracer()
+
+def span(name: str, **attributes):
+    return tracer.span(name, **attributes)
+
+def current_span():
+    """Текущий спан, чтобы дописать атрибуты по ходу работы (число сообщений, байты)"""
+    return _current_span.get() or _NOOP_SPAN
+
+def trace_context() -> Optional[list]:
+    """[trace_id, span_id] текущего спана для передачи в другой процесс (IPC с демоном)"""
+    current = _current_span.get()
+    return [current.trace_id, current.span_id] if current is not None else None
+
+def background_task(coro) -> asyncio.Task:
+    """
+    Задача на все время жизни процесса (супервизор, писатель, планировщик) в чистом контексте.
+    Обычный create_task копирует контекст вызывающего - запущенная из HTTP-запроса задача
+    вечно вешала бы свои спаны на уже завершенный трейс этого запроса.
+    """
+    return asyncio.create_task(coro, context=contextvars.Context())
+
+def traced(name: str, attributes: Optional[Callable[..., dict]] = None):
+    """
+    Декоратор для async-функций: спан на весь вызов.
+    attributes получает те же аргументы, что и функция, и возвращает атрибуты спана.
+    Если функция вернула словарь со status (как методы парсера), он попадает в атрибуты.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            if not tracer.enabled:
+                return await func(*args, **kwargs)
+            with tracer.span(name, **(attributes(*args, **kwargs) if attributes else {})) as current:
+                result = await func(*args, **kwargs)
+                if isinstance(result, dict) and "status" in result:
+                    current.set(result_status=result["status"])
+                return result
+        return wrapper
+    return decorator
+
+def trace_pyrogram(client_class):
+    """Спан на каждый вызов Telegram API (все методы pyrogram идут через Client.invoke)"""
+    if getattr(client_class.invoke, "_traced", False):
+        return
+    original_invoke = client_class.invoke
+
+    async def invoke(self, query, *args, **kwargs):
+        if not tracer.enabled:
+            return await original_invoke(self, query, *args, **kwargs)
+        with tracer.span(f"telegram.rpc {type(query).__name__}", kind="client"):
+            return await original_invoke(self, query, *args, **kwargs)
+
+    invoke._traced = True
+    client_class.invoke = invoke
+
+def trace_engine(engine):
+    """Спан на каждый SQL-запрос движка (для async_engine передавать async_engine.sync_engine)"""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if tracer.enabled and _current_span.get() is not None:
+            operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "OTHER"
+            context._trace_span = tracer.start_span(
+                f"db.{operation.lower()}", kind="client", **{"db.statement": statement[:300]}
+            )
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        span = getattr(context, "_trace_span", None)
+        if span is not None:
+            context._trace_span = None
+            span.set(**{"db.rows": cursor.rowcount if cursor.rowcount >= 0 else None})
+            tracer.end_span(span)
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(exception_context):
+        context = exception_context.execution_context
+        span = getattr(context, "_trace_span", None) if context is not None else None
+        if span is not None:
+            context._trace_span = None
+            tracer.end_span(span, f"{type(exception_context.original_exception).__name__}")
+
+def _trace_commits():
+    """Спан db.commit на каждый коммит сессии (и синхронной, и AsyncSession); flush попадает внутрь"""
+
+    @event.listens_for(OrmSession, "before_commit")
+    def before_commit(session):
+        if tracer.enabled and _current_span.get() is not None:
+            parent = _current_span.get()
+            span = tracer.start_span("db.commit", new_objects=len(session.new))
+            session.info["_trace_commit"] = (span, parent, _current_span.set(span))
+
+    def finish(session, error=None):
+        pending = session.info.pop("_trace_commit", None)
+        if pending is not None:
+            span, parent, token = pending
+            try:
+                _current_span.reset(token)
+            except ValueError:
+                # Коммит завершился в другом контексте - просто возвращаем родительский спан
+                _current_span.set(parent)
+            tracer.end_span(span, error)
+
+    @event.listens_for(OrmSession, "after_commit")
+    def after_commit(session):
+        finish(session)
+
+    @event.listens_for(OrmSession, "after_rollback")
+    def after_rollback(session):
+        finish(session, "rollback")
+
+_trace_commits()
+
+def _parse_traceparent(headers) -> tuple:
+    """W3C traceparent: 00-<trace_id>-<parent_id>-<flags>"""
+    for key, value in headers:
+        if key == b"traceparent":
+            parts = value.decode("latin-1").split("-")
+            if len(parts) == 4 and len(parts[1]) == 32 and len(parts[2]) == 16:
+                return parts[1], parts[2]
+    return None, None
+
+class TracingMiddleware:
+    """ASGI-middleware: корневой спан запроса; продолжает внешний trace из заголовка traceparent"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not tracer.enabled:
+            return await self.app(scope, receive, send)
+
+        trace_id, parent_id = _parse_traceparent(scope.get("headers", []))
+        with tracer.span("http", kind="server", trace_id=trace_id, parent_id=parent_id,
+                         **{"http.method": scope["method"], "http.target": scope["path"]}) as root:
+
+            async def send_wrapper(message):
+                if message["type"] == "http.response.start":
+                    root.set(**{"http.status_code": message["status"]})
+                    message = {**message, "headers": list(message.get("headers", [])) + [
+                        (b"x-trace-id", root.trace_id.encode())
+                    ]}
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                route = route_template(scope)
+                root.name = f'{scope["method"]} {route}'
+                root.set(**{"http.route": route})
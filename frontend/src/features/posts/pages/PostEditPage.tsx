@@ -142,7 +142,8 @@ export const PostEditPage: React.FC<PostEditPageProps> = ({ selectedPost, onBack
         body: JSON.stringify({
           selected_post_id: selectedPost.id,
           channel_id: selectedChannel,
-          scheduled_time: scheduledTime,
+          // datetime-local дает локальное время без пояса - отправляем момент в UTC
+          scheduled_time: new Date(scheduledTime).toISOString(),
           text: editedText
         }),
       });